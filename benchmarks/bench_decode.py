@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark for CSI datagram decoding (packets/s, old struct path vs ndarray path)
+
+Usage: python3 benchmarks/bench_decode.py [num_samples] [iterations]
+"""
+
+import os
+import sys
+import struct
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from csi_protocol import (HEADER_FORMAT, HEADER_SIZE, SAMPLE_SIZE,
+                          RECV_BUFFER_SIZE, decode_csi_datagram)
+
+
+def build_datagram(num_samples):
+    """Build a CSIdump datagram with random I/Q samples"""
+    iq = np.random.randint(-2048, 2048, size=num_samples * 2).astype('<f8')
+    header = struct.pack(HEADER_FORMAT, int(time.time() * 1000), 0, 1, num_samples)
+    return header + iq.tobytes()
+
+
+def decode_struct(data):
+    """Previous decode path: struct.unpack into a list of Python complex objects"""
+    timestamp, antenna_idx, packet_count, total_samples = struct.unpack(
+        HEADER_FORMAT, data[:HEADER_SIZE])
+    samples_data = data[HEADER_SIZE:]
+    num_samples = len(samples_data) // SAMPLE_SIZE
+    samples = []
+    if num_samples > 0:
+        iq_values = list(struct.unpack(f'<{num_samples * 2}d', samples_data))
+        for i in range(0, len(iq_values), 2):
+            samples.append(complex(iq_values[i], iq_values[i + 1]))
+    # update_plots converted the list to an ndarray afterwards
+    return np.array(samples)
+
+
+def decode_ndarray(buffer, data):
+    """Current decode path: copy into the reused receive buffer and view it as complex128"""
+    nbytes = len(data)
+    buffer[:nbytes] = data  # stands in for socket.recvfrom_into
+    return decode_csi_datagram(buffer, nbytes)[3][0]
+
+
+def run(label, func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    rate = iterations / elapsed
+    print(f"{label:<10} {rate:>12.0f} packets/s  ({elapsed / iterations * 1e6:.1f} us/packet)")
+    return rate
+
+
+def main():
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 510
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    data = build_datagram(num_samples)
+    buffer = bytearray(RECV_BUFFER_SIZE)
+
+    # Both paths have to agree on the decoded samples
+    assert np.array_equal(decode_struct(data), decode_ndarray(buffer, data))
+
+    print(f"Decoding {iterations} datagrams with {num_samples} samples ({len(data)} bytes)")
+    before = run("struct", lambda: decode_struct(data), iterations)
+    after = run("ndarray", lambda: decode_ndarray(buffer, data), iterations)
+    print(f"Speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+"""End-to-end throughput benchmark suite for the CSI client
+
+Measures decode rate, processing rate (with and without phase sanitization),
+Doppler spectrogram rate per window length, sliding-window rate against
+stacking windows from per-packet history, GUI render frame time and
+end-to-end latency (from the header timestamp) against the synthetic CSIdump
+stand-in, and writes a machine-readable JSON report for regression tracking.
+
+Usage: python3 benchmarks/bench_pipeline.py [--antennas 4] [--subcarriers 512] [--output report.json]
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import platform
+import argparse
+import subprocess
+from collections import deque
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_DIR)
+
+from csi_protocol import CSIBatchBuilder, CSIUdpClient, HEADER_STRUCT, SAMPLE_DTYPE
+from csi_processing import CSIPipeline
+from csi_doppler import DopplerAnalyzer
+from csi_windows import CSIWindower
+from csi_sim_server import SyntheticChannel, samples_per_packet
+
+
+def summarize(values):
+    """Distribution summary of a list of measurements"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def build_datagrams(num_antennas, num_samples, packets_per_antenna):
+    """Synthetic datagrams interleaved across antennas"""
+    channel = SyntheticChannel(num_antennas, num_samples)
+    timestamp = int(time.time() * 1000)
+    per_antenna = [channel.packets(antenna_idx, packets_per_antenna).astype(SAMPLE_DTYPE)
+                   for antenna_idx in range(num_antennas)]
+    datagrams = []
+    for i in range(packets_per_antenna):
+        for antenna_idx in range(num_antennas):
+            header = HEADER_STRUCT.pack(timestamp, antenna_idx, 1, num_samples)
+            datagrams.append(bytearray(header + per_antenna[antenna_idx][i].tobytes()))
+    return datagrams
+
+
+def build_batches(datagrams, batch_size):
+    builder = CSIBatchBuilder()
+    batches = []
+    for start in range(0, len(datagrams), batch_size):
+        for datagram in datagrams[start:start + batch_size]:
+            builder.add_datagram(datagram, len(datagram))
+        batches.append(builder.build())
+    return batches
+
+
+def bench_decode(datagrams, batch_size):
+    start = time.perf_counter()
+    build_batches(datagrams, batch_size)
+    elapsed = time.perf_counter() - start
+    return {"packets": len(datagrams), "seconds": elapsed, "packets_per_s": len(datagrams) / elapsed}
+
+
+def bench_processing(batches, sanitize_phase=False):
+    pipeline = CSIPipeline(remove_dc_subcarrier=True, remove_dc_offset=True, sanitize_phase=sanitize_phase)
+    packets = sum(len(block.samples) for batch in batches for block in batch.blocks)
+    start = time.perf_counter()
+    for batch in batches:
+        pipeline.process_batch(batch)
+    elapsed = time.perf_counter() - start
+    return {"packets": packets, "seconds": elapsed, "packets_per_s": packets / elapsed}
+
+
+def bench_doppler(batches, windows=(64, 256, 1024)):
+    """Sliding-DFT spectrogram rate per window length; the cost per packet should not depend on it"""
+    pipeline = CSIPipeline()
+    processed_blocks = [processed for batch in batches for processed in pipeline.process_batch(batch)]
+    packets = sum(len(processed.timestamps) for processed in processed_blocks)
+    results = {}
+    for window in windows:
+        doppler = DopplerAnalyzer(window)
+        start = time.perf_counter()
+        for processed in processed_blocks:
+            doppler.update(processed)
+        elapsed = time.perf_counter() - start
+        results[f"window_{window}"] = {"packets": packets, "seconds": elapsed, "packets_per_s": packets / elapsed}
+    return results
+
+
+def bench_windows(batches, lengths=(64, 256)):
+    """Windows at hop 1 as views of CSIWindower against np.stack over a deque of packets per antenna"""
+    pipeline = CSIPipeline()
+    processed_batches = [pipeline.process_batch(batch) for batch in batches]
+    packets = sum(len(processed.timestamps) for blocks in processed_batches for processed in blocks)
+    results = {}
+    for length in lengths:
+        windower = CSIWindower(length)
+        start = time.perf_counter()
+        windows = sum(1 for _ in windower.iterate(processed_batches))
+        elapsed = time.perf_counter() - start
+
+        # Previous consumer side: rows kept per antenna, every window stacked anew
+        history = {}
+        stacked = 0
+        start = time.perf_counter()
+        for blocks in processed_batches:
+            for processed in blocks:
+                for row in processed.magnitude:
+                    rows = history.setdefault(processed.antenna_idx, deque(maxlen=length))
+                    rows.append(row)
+                    if processed.antenna_idx == max(history) and len(rows) == length:
+                        np.stack([np.stack(rows, axis=-1) for rows in history.values()]).astype(np.float32)
+                        stacked += 1
+        stack_elapsed = time.perf_counter() - start
+        results[f"length_{length}"] = {"packets": packets, "windows": windows, "seconds": elapsed,
+                                       "windows_per_s": windows / elapsed, "stacked_windows": stacked,
+                                       "stacked_seconds": stack_elapsed,
+                                       "stacked_windows_per_s": stacked / stack_elapsed if stacked else 0.0}
+    return results
+
+
+def bench_render(batches, frames):
+    """Frame time of the GUI render path (offscreen), one batch ingested per frame"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    import csi_udp_client_gui
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    # Point the receiver at an unused port, frames are fed directly
+    window = csi_udp_client_gui.CSIVisualizerWindow('127.0.0.1', free_port())
+    window.receiver.stop_receiving()
+    window.render_timer.stop()
+    window.show()
+
+    ingest_times = []
+    frame_times = []
+    for i in range(frames):
+        batch = batches[i % len(batches)]
+        start = time.perf_counter()
+        window.on_data_received(batch)
+        ingest_times.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        window.render_frame()
+        app.processEvents()  # Paint
+        frame_times.append((time.perf_counter() - start) * 1000)
+
+    window.close()
+    app.processEvents()
+    return {"frames": frames, "ingest_ms": summarize(ingest_times), "frame_ms": summarize(frame_times)}
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_sim_server(port, args):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, 'csi_sim_server.py'), str(port),
+         '--antennas', str(args.antennas), '--subcarriers', str(args.subcarriers),
+         '--rate', str(args.rate), '--burst', str(args.burst), '--duration', str(args.duration)],
+        stdout=subprocess.PIPE, universal_newlines=True)
+
+
+def sent_datagrams(server):
+    """Wait for the simulated server to exit and parse its final datagram count"""
+    output, _ = server.communicate(timeout=30)
+    for line in output.splitlines():
+        if line.startswith("Sent "):
+            return int(line.split()[1])
+    return 0
+
+
+def bench_end_to_end(args):
+    """Receive + process from the simulated server, latency measured from the header timestamp"""
+    port = free_port()
+    server = start_sim_server(port, args)
+    time.sleep(0.5)
+
+    client = CSIUdpClient('127.0.0.1', port, encoding=args.encoding, aggregate=args.aggregate,
+                          mix_antennas=args.mix_antennas)
+    pipeline = CSIPipeline()
+    client.register()
+    latencies = []
+    received = 0
+    packets = 0
+    deadline = time.time() + args.duration + 1.0
+    try:
+        while time.time() < deadline and server.poll() is None:
+            batch = client.receive_batch(0.2)
+            if batch is None:
+                continue
+            received += batch.num_datagrams
+            for processed in pipeline.process_batch(batch):
+                packets += len(processed.timestamps)
+                now_ms = time.time() * 1000
+                latencies.extend(now_ms - processed.timestamps.astype(float))
+    finally:
+        client.close()
+    sent = sent_datagrams(server)
+    return {
+        "sent": sent,
+        "received": received,
+        "loss_ratio": 1 - received / sent if sent else 0.0,
+        "packets": packets,
+        "packets_per_s": packets / args.duration,
+        "latency_ms": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSI client throughput benchmark suite")
+    parser.add_argument("--antennas", type=int, default=4)
+    parser.add_argument("--subcarriers", type=int, default=512)
+    parser.add_argument("--packets", type=int, default=2000, help="packets per antenna for decode/processing")
+    parser.add_argument("--batch-size", type=int, default=100, help="datagrams per batch")
+    parser.add_argument("--frames", type=int, default=200, help="frames for the render stage")
+    parser.add_argument("--rate", type=float, default=100.0, help="end-to-end packets/s per antenna")
+    parser.add_argument("--burst", type=int, default=1, help="end-to-end burst size")
+    parser.add_argument("--duration", type=float, default=5.0, help="end-to-end duration in seconds")
+    parser.add_argument("--encoding", default="float64", help="end-to-end sample encoding")
+    parser.add_argument("--aggregate", type=int, metavar="BYTES", help="end-to-end datagram aggregation size")
+    parser.add_argument("--mix-antennas", action="store_true", help="end-to-end aggregation across antennas")
+    parser.add_argument("--stages", default="decode,processing,processing_phase,doppler,windows,render,end_to_end",
+                        help="comma separated list of stages to run")
+    parser.add_argument("--output", metavar="FILE", help="write the JSON report to FILE (default: stdout)")
+    args = parser.parse_args()
+    stages = args.stages.split(',')
+
+    num_samples = samples_per_packet(args.subcarriers)
+    datagrams = build_datagrams(args.antennas, num_samples, args.packets)
+    batches = build_batches(datagrams, args.batch_size)
+
+    report = {
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "config": vars(args),
+        "stages": {},
+    }
+    if "decode" in stages:
+        report["stages"]["decode"] = bench_decode(datagrams, args.batch_size)
+    if "processing" in stages:
+        report["stages"]["processing"] = bench_processing(batches)
+    if "processing_phase" in stages:
+        report["stages"]["processing_phase"] = bench_processing(batches, sanitize_phase=True)
+    if "doppler" in stages:
+        report["stages"]["doppler"] = bench_doppler(batches)
+    if "windows" in stages:
+        report["stages"]["windows"] = bench_windows(batches)
+    if "render" in stages:
+        try:
+            report["stages"]["render"] = bench_render(batches, args.frames)
+        except ImportError as e:
+            report["stages"]["render"] = {"skipped": str(e)}
+    if "end_to_end" in stages:
+        report["stages"]["end_to_end"] = bench_end_to_end(args)
+
+    for name, result in report["stages"].items():
+        print(f"{name:<16} {json.dumps(result)}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""Render-cost benchmark for the GUI: ms per frame versus antenna count x subcarriers
+
+Feeds synthetic batches straight into CSIVisualizerWindow (offscreen unless a
+display is given), one batch per frame, and times render_frame plus the paint.
+Each configuration runs in a fresh window; plots of all antennas are redrawn
+every frame, which is the worst case of the dirty-channel scheme.
+
+Usage: python3 benchmarks/bench_render.py [--antennas 1,2,4] [--subcarriers 64,128,256,512]
+                                          [--frames 100] [--no-decimate] [--opengl] [--line-width 2]
+                                          [--output report.json]
+"""
+
+import os
+import sys
+import time
+import json
+import platform
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from csi_sim_server import samples_per_packet
+from bench_pipeline import build_datagrams, build_batches, summarize, free_port
+
+
+def bench_config(app, num_antennas, subcarriers, frames, window_options):
+    """Frame times of one antennas x subcarriers configuration"""
+    import csi_udp_client_gui
+
+    num_samples = samples_per_packet(subcarriers)
+    # One packet per antenna per batch, like a 100 Hz stream at a 100 Hz frame rate
+    batches = build_batches(build_datagrams(num_antennas, num_samples, frames), num_antennas)
+
+    # Point the receiver at an unused port, frames are fed directly
+    window = csi_udp_client_gui.CSIVisualizerWindow('127.0.0.1', free_port(), **window_options)
+    window.receiver.stop_receiving()
+    window.render_timer.stop()
+    window.update_timer.stop()
+    window.show()
+
+    # Warm up: plots are created and laid out on the first frames
+    for batch in batches[:5]:
+        window.on_data_received(batch)
+        window.render_frame()
+        app.processEvents()
+
+    frame_times = []
+    for batch in batches[5:]:
+        window.on_data_received(batch)
+        start = time.perf_counter()
+        window.render_frame()
+        app.processEvents()  # Paint
+        frame_times.append((time.perf_counter() - start) * 1000)
+
+    window.close()
+    app.processEvents()
+    result = summarize(frame_times)
+    result["fps_at_mean"] = 1000.0 / result["mean"] if result.get("mean") else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSI GUI render-cost benchmark")
+    parser.add_argument("--antennas", default="1,2,4", help="comma separated antenna counts")
+    parser.add_argument("--subcarriers", default="64,128,256,512",
+                        help="comma separated subcarrier counts (20/40/80/160 MHz)")
+    parser.add_argument("--frames", type=int, default=100, help="frames per configuration")
+    parser.add_argument("--no-decimate", action="store_true", help="draw every point of the line plots")
+    parser.add_argument("--opengl", action="store_true", help="render the plots with OpenGL")
+    parser.add_argument("--line-width", type=int, default=2, help="line plot pen width")
+    parser.add_argument("--output", metavar="FILE", help="write the JSON report to FILE (default: stdout)")
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5 import QtWidgets
+    except ImportError as e:
+        print(f"Cannot run the render benchmark: {e}", file=sys.stderr)
+        sys.exit(1)
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    window_options = dict(decimate=not args.no_decimate, opengl=args.opengl, line_width=args.line_width)
+    report = {
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "config": vars(args),
+        "results": [],
+    }
+    for num_antennas in [int(n) for n in args.antennas.split(',')]:
+        for subcarriers in [int(n) for n in args.subcarriers.split(',')]:
+            result = bench_config(app, num_antennas, subcarriers, args.frames, window_options)
+            result.update(antennas=num_antennas, subcarriers=subcarriers)
+            report["results"].append(result)
+            print(f"{num_antennas} antennas x {subcarriers:3d} subcarriers: "
+                  f"{result['mean']:7.2f} ms/frame (p95 {result['p95']:7.2f}), {result['fps_at_mean']:6.1f} fps",
+                  file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
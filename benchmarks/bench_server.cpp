@@ -0,0 +1,244 @@
+// Host-side benchmark of the CSIdump dump path: parsing and serialize + send per dump
+//
+// Builds synthetic csi_data dumps and times the single-pass ParserMT76::parseDump and
+// CsiUdpSender (reused buffers, sendmmsg) against the previous path: processRawData once
+// per antenna, with a 4x512 complex scratch matrix and a std::vector<double> per packet,
+// and serialization into a new buffer per datagram sent with one sendto each.
+// Datagrams go to a UDP socket on loopback that is never read, so the kernel drops them
+// once its buffer is full and the send cost stays a syscall plus a copy. The previous
+// path is modelled for one packet per datagram to every antenna, so compare without
+// aggregate, mix_antennas, meta and antennas options.
+//
+// Build and run on the host (no libnl or radio needed). capture_scheduler.cpp is not linked:
+// the sender only uses the CsiCaptureStatus struct from capture_scheduler.h, no CaptureScheduler.
+//   g++ -O2 -std=c++17 -I. benchmarks/bench_server.cpp csi_udp_sender.cpp parsers/parser_mt76.cpp -o bench_server
+//   ./bench_server [packets_per_dump=100] [dumps=2000] [clients=1] ["register options"]
+
+#include "csi_udp_sender.h"
+#include "parsers/parser_mt76.h"
+
+#include <chrono>
+#include <complex>
+#include <cstring>
+#include <iostream>
+#include <random>
+#include <sstream>
+#include <string>
+#include <vector>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <arpa/inet.h>
+
+// Previous ParserMT76::processRawData, called once per antenna
+static std::vector<std::vector<double>> legacyProcessRawData(void *data, int antIdx)
+{
+    std::vector<std::vector<std::complex<double>>> csi_per_antenna(ANTENNA_NUM, std::vector<std::complex<double>>(CSI_BW160_DATA_COUNT));
+    std::vector<csi_data *> *list = (std::vector<csi_data *>*)data;
+    std::vector<std::vector<double>> tones_per_packet[ANTENNA_NUM];
+
+    for (size_t it = 0; it < list->size(); it++)
+    {
+        int num_subcarriers = CSI_BW20_DATA_COUNT;
+        csi_data *csi = list->at(it);
+        if (csi)
+        {
+            switch (csi->ch_bw) {
+                case 0: num_subcarriers = CSI_BW20_DATA_COUNT; break;
+                case 1: num_subcarriers = CSI_BW40_DATA_COUNT; break;
+                case 2: num_subcarriers = CSI_BW80_DATA_COUNT; break;
+                case 3: num_subcarriers = CSI_BW160_DATA_COUNT; break;
+                default: num_subcarriers = CSI_BW20_DATA_COUNT; break;
+            }
+            for (int i = 0; i < num_subcarriers; i++)
+                csi_per_antenna[csi->rx_idx][i] = std::complex<double>(csi->data_i[i], csi->data_q[i]);
+
+            if (csi->rx_idx == antIdx)
+            {
+                int start_idx = (num_subcarriers >= 64) ? 2 : 1;
+                int end_idx = num_subcarriers - 1;
+                std::vector<double> iq_data;
+                for (int i = start_idx; i < end_idx; i++) {
+                    iq_data.push_back(static_cast<double>(csi->data_i[i]));
+                    iq_data.push_back(static_cast<double>(csi->data_q[i]));
+                }
+                tones_per_packet[antIdx].push_back(iq_data);
+            }
+        }
+    }
+    return tones_per_packet[antIdx];
+}
+
+// Previous serialization: a new buffer per datagram, one sendto per datagram
+static size_t legacySend(int sock, const std::vector<std::vector<std::vector<double>>>& data,
+                         const std::vector<UdpClient>& clients, uint64_t timestamp)
+{
+    size_t sent = 0;
+    for (const UdpClient& client : clients) {
+        size_t headerSize = client.headerVersion == CSI_HEADER_VERSION_2 ? sizeof(CsiPacketHeaderV2) : sizeof(CsiPacketHeader);
+        uint8_t sampleFormat = client.headerVersion == CSI_HEADER_VERSION_2 ? client.sampleFormat
+                                                                             : (uint8_t)CSI_SAMPLE_FLOAT64;
+        size_t sampleSize = sampleFormat == CSI_SAMPLE_INT16 ? sizeof(CsiSampleI16)
+                          : sampleFormat == CSI_SAMPLE_FLOAT32 ? sizeof(CsiSampleF32) : sizeof(CsiSample);
+
+        std::vector<std::vector<uint8_t>> datagrams;
+        for (size_t ant = 0; ant < data.size(); ant++) {
+            for (const std::vector<double>& packet : data[ant]) {
+                CsiPacketHeaderV2 header = {};
+                header.timestamp = timestamp;
+                header.antenna_idx = ant;
+                header.packet_count = 1;
+                header.total_samples = packet.size() / 2;
+                header.version = client.headerVersion;
+                header.sample_format = sampleFormat;
+                std::vector<uint8_t> buffer(headerSize + header.total_samples * sampleSize);
+                uint8_t* ptr = buffer.data();
+                memcpy(ptr, &header, headerSize);
+                ptr += headerSize;
+                for (size_t i = 0; i + 1 < packet.size(); i += 2) {
+                    if (sampleFormat == CSI_SAMPLE_FLOAT32) {
+                        CsiSampleF32 sample = { static_cast<float>(packet[i]), static_cast<float>(packet[i + 1]) };
+                        memcpy(ptr, &sample, sizeof(sample));
+                    } else if (sampleFormat == CSI_SAMPLE_INT16) {
+                        CsiSampleI16 sample = { static_cast<int16_t>(packet[i]), static_cast<int16_t>(packet[i + 1]) };
+                        memcpy(ptr, &sample, sizeof(sample));
+                    } else {
+                        CsiSample sample = { packet[i], packet[i + 1] };
+                        memcpy(ptr, &sample, sizeof(sample));
+                    }
+                    ptr += sampleSize;
+                }
+                datagrams.push_back(std::move(buffer));
+            }
+        }
+
+        struct sockaddr_in clientAddr;
+        memset(&clientAddr, 0, sizeof(clientAddr));
+        clientAddr.sin_family = AF_INET;
+        clientAddr.sin_port = htons(client.port);
+        inet_pton(AF_INET, client.ip.c_str(), &clientAddr.sin_addr);
+        for (const auto& buffer : datagrams) {
+            if (sendto(sock, buffer.data(), buffer.size(), 0, (struct sockaddr*)&clientAddr, sizeof(clientAddr)) >= 0)
+                sent++;
+        }
+    }
+    return sent;
+}
+
+// Option parsing of MotionDetector::parseRegisterMessage, enough for the benchmark
+static UdpClient parseOptions(const std::string& options, int port)
+{
+    UdpClient client = { "127.0.0.1", port, CSI_HEADER_VERSION_1, CSI_SAMPLE_FLOAT64, 0, false, false, false, 0 };
+    std::istringstream tokens(options);
+    std::string token;
+    while (tokens >> token) {
+        if (token == "register")
+            continue;
+        client.headerVersion = CSI_HEADER_VERSION_2;
+        if (token == "encoding=float32")
+            client.sampleFormat = CSI_SAMPLE_FLOAT32;
+        else if (token == "encoding=int16")
+            client.sampleFormat = CSI_SAMPLE_INT16;
+        else if (token.rfind("aggregate=", 0) == 0)
+            client.aggregateBytes = static_cast<uint16_t>(std::stoi(token.substr(10)));
+        else if (token == "mix_antennas=1")
+            client.mixAntennas = true;
+        else if (token == "meta=1")
+            client.packetMeta = true;
+        else if (token.rfind("antennas=", 0) == 0) {
+            std::istringstream indices(token.substr(9));
+            std::string index;
+            while (std::getline(indices, index, ','))
+                client.antennaMask |= 1u << std::stoi(index);
+        }
+    }
+    return client;
+}
+
+// 160 MHz packets, round robin over the antennas like a dump of one frame stream
+static std::vector<csi_data> syntheticDump(size_t packets)
+{
+    std::mt19937 rng(0);
+    std::uniform_int_distribution<int> value(-2048, 2047);
+    std::vector<csi_data> records(packets);
+    for (size_t p = 0; p < packets; p++) {
+        csi_data& csi = records[p];
+        memset(&csi, 0, sizeof(csi));
+        csi.ch_bw = 3;
+        csi.rx_idx = p % ANTENNA_NUM;
+        csi.pkt_sn = (p / ANTENNA_NUM) % 4096;
+        csi.ts = p * 10000;
+        csi.rssi = -50;
+        for (int i = 0; i < CSI_BW160_DATA_COUNT; i++) {
+            csi.data_i[i] = value(rng);
+            csi.data_q[i] = value(rng);
+        }
+    }
+    return records;
+}
+
+template <typename F>
+static double perDumpUs(size_t dumps, F&& run)
+{
+    auto start = std::chrono::steady_clock::now();
+    for (size_t d = 0; d < dumps; d++)
+        run();
+    return std::chrono::duration<double, std::micro>(std::chrono::steady_clock::now() - start).count() / dumps;
+}
+
+int main(int argc, char** argv)
+{
+    size_t packets = argc > 1 ? std::stoul(argv[1]) : 100;
+    size_t dumps = argc > 2 ? std::stoul(argv[2]) : 2000;
+    size_t numClients = argc > 3 ? std::stoul(argv[3]) : 1;
+    std::string options = argc > 4 ? argv[4] : "register";
+
+    std::vector<csi_data> records = syntheticDump(packets);
+    std::vector<csi_data *> list;
+    for (csi_data& csi : records)
+        list.push_back(&csi);
+
+    // Sink: bound, never read
+    int sink = socket(AF_INET, SOCK_DGRAM, 0);
+    struct sockaddr_in sinkAddr;
+    memset(&sinkAddr, 0, sizeof(sinkAddr));
+    sinkAddr.sin_family = AF_INET;
+    sinkAddr.sin_addr.s_addr = htonl(INADDR_LOOPBACK);
+    socklen_t sinkLen = sizeof(sinkAddr);
+    if (sink < 0 || bind(sink, (struct sockaddr*)&sinkAddr, sizeof(sinkAddr)) < 0 ||
+        getsockname(sink, (struct sockaddr*)&sinkAddr, &sinkLen) < 0) {
+        std::cerr << "Failed to create the sink socket: " << strerror(errno) << std::endl;
+        return 1;
+    }
+    int sock = socket(AF_INET, SOCK_DGRAM, 0);
+    std::vector<UdpClient> clients(numClients, parseOptions(options, ntohs(sinkAddr.sin_port)));
+
+    ParserMT76 parser;
+    std::vector<CsiAntennaPackets> parsed;
+    CsiUdpSender sender;
+    std::vector<std::vector<std::vector<double>>> legacyParsed(ANTENNA_NUM);
+
+    double legacyParse = perDumpUs(dumps, [&] {
+        for (int i = 0; i < ANTENNA_NUM; i++)
+            legacyParsed[i] = legacyProcessRawData(&list, i);
+    });
+    double parse = perDumpUs(dumps, [&] { parser.parseDump(&list, parsed); });
+
+    size_t legacyDatagrams = 0;
+    size_t datagrams = 0;
+    double legacySendUs = perDumpUs(dumps, [&] { legacyDatagrams += legacySend(sock, legacyParsed, clients, 0); });
+    double sendUs = perDumpUs(dumps, [&] { datagrams += sender.send(sock, parsed, clients, 0); });
+
+    std::cout << packets << " packets per dump (160 MHz, " << ANTENNA_NUM << " antennas), " << dumps << " dumps, "
+              << numClients << " client(s), \"" << options << "\"" << std::endl;
+    std::cout << "parse:          previous " << legacyParse << " us/dump, single pass " << parse << " us/dump ("
+              << legacyParse / parse << "x)" << std::endl;
+    std::cout << "serialize+send: previous " << legacySendUs << " us/dump (" << legacyDatagrams / dumps
+              << " datagrams), reused buffers + sendmmsg " << sendUs << " us/dump (" << datagrams / dumps
+              << " datagrams, " << legacySendUs / sendUs << "x)" << std::endl;
+    std::cout << "total:          previous " << legacyParse + legacySendUs << " us/dump, now " << parse + sendUs
+              << " us/dump (" << (legacyParse + legacySendUs) / (parse + sendUs) << "x)" << std::endl;
+
+    close(sock);
+    close(sink);
+    return 0;
+}
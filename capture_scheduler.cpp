@@ -0,0 +1,89 @@
+#include "capture_scheduler.h"
+
+#include <algorithm>
+#include <cmath>
+
+// EMA gain for the packets per dump and the cycle time
+#define CAPTURE_EMA_GAIN 0.125
+// Latency mode requests this much more than a dump usually returns, so bursts fit
+#define CAPTURE_HEADROOM 1.5
+// First dump size in latency mode, the previous fixed dump size
+#define CAPTURE_INITIAL_DUMP 100
+
+CaptureScheduler::CaptureScheduler(const CaptureConfig& config)
+    : config(config), interval(std::chrono::milliseconds(std::max(config.intervalMs, 1u)))
+{
+    this->config.maxDump = std::max<unsigned>(config.maxDump, CAPTURE_DUMP_STEP);
+    if (config.mode == CAPTURE_RATE && config.rate > 0) {
+        // Dumps come in whole steps, the period is stretched so dump / period is the rate
+        dump = clampDump(config.rate * std::max(config.intervalMs, 1u) / 1000.0);
+        interval = std::chrono::duration_cast<Clock::duration>(std::chrono::duration<double>(dump / config.rate));
+    } else if (config.mode == CAPTURE_THROUGHPUT) {
+        dump = this->config.maxDump;
+    } else {
+        dump = clampDump(CAPTURE_INITIAL_DUMP);
+    }
+}
+
+// Rounded up to whole steps, between one step and maxDump
+unsigned CaptureScheduler::clampDump(double packets) const
+{
+    unsigned steps = static_cast<unsigned>(std::ceil(std::max(packets, 1.0) / CAPTURE_DUMP_STEP));
+    return std::min(steps * CAPTURE_DUMP_STEP, config.maxDump / CAPTURE_DUMP_STEP * CAPTURE_DUMP_STEP);
+}
+
+void CaptureScheduler::start(Clock::time_point now)
+{
+    deadline = now;
+    lastStatus = now;
+}
+
+CaptureScheduler::Clock::time_point CaptureScheduler::cycleDone(unsigned returned, Clock::time_point cycleStart,
+                                                                Clock::time_point now)
+{
+    cycles++;
+    packets += returned;
+    double busyUs = std::chrono::duration<double, std::micro>(now - cycleStart).count();
+    cycleUs = cycles == 1 ? busyUs : cycleUs + CAPTURE_EMA_GAIN * (busyUs - cycleUs);
+    packetsPerCycle = cycles == 1 ? returned : packetsPerCycle + CAPTURE_EMA_GAIN * (returned - packetsPerCycle);
+
+    // A full dump means the driver held more packets than were asked for
+    bool full = returned >= dump;
+    if (full)
+        overruns++;
+
+    if (config.mode == CAPTURE_LATENCY) {
+        // Grow quickly on a backlog, shrink slowly to what arrives per interval
+        dump = full ? clampDump(2.0 * dump) : clampDump(CAPTURE_HEADROOM * packetsPerCycle);
+    } else if (config.mode == CAPTURE_THROUGHPUT && full) {
+        // Drain the backlog right away, the deadlines restart afterwards
+        deadline = now;
+        return now;
+    }
+
+    deadline += interval;
+    if (now > deadline) {
+        // Missed the deadline: start the next cycle now instead of catching up with a burst
+        lateCycles++;
+        deadline = now;
+    }
+    return deadline;
+}
+
+CsiCaptureStatus CaptureScheduler::status(Clock::time_point now)
+{
+    CsiCaptureStatus status = {};
+    double seconds = std::chrono::duration<double>(now - lastStatus).count();
+    status.mode = config.mode;
+    status.interval_ms = std::chrono::duration_cast<std::chrono::milliseconds>(interval).count();
+    status.dump_size = dump;
+    status.cycles = cycles;
+    status.late_cycles = lateCycles;
+    status.overruns = overruns;
+    status.cycle_us = static_cast<uint32_t>(cycleUs);
+    status.rate = seconds > 0 ? static_cast<float>(packets / seconds) : 0.0f;
+    status.target_rate = config.mode == CAPTURE_RATE ? static_cast<float>(config.rate) : 0.0f;
+    packets = 0;
+    lastStatus = now;
+    return status;
+}
@@ -0,0 +1,68 @@
+#pragma once
+
+#include <chrono>
+#include <cstdint>
+
+// motion_detection_dump requests packets from the driver in steps of this many (CSI_DUMP_PER_NUM)
+#define CAPTURE_DUMP_STEP 3
+
+enum CaptureMode : uint8_t {
+    CAPTURE_LATENCY = 0,     // A dump every interval, sized to the packets that arrive per interval
+    CAPTURE_THROUGHPUT = 1,  // Largest dumps, the next one right away while the driver has a backlog
+    CAPTURE_RATE = 2,        // rate * interval packets every interval (period stretched to whole dump steps)
+};
+
+struct CaptureConfig {
+    CaptureMode mode = CAPTURE_LATENCY;
+    unsigned intervalMs = 10;  // Dump period
+    double rate = 0;           // Packets per second over all antennas, CAPTURE_RATE only
+    unsigned maxDump = 300;    // Largest dump in packets
+};
+
+// Scheduler counters, sent to clients that registered with "status=1"
+struct CsiCaptureStatus {
+    uint8_t mode;          // CaptureMode
+    uint8_t reserved[3];
+    uint32_t interval_ms;  // Dump period, the rate mode's may be longer than the configured interval
+    uint32_t dump_size;    // Packets requested per dump
+    uint32_t cycles;       // Dumps since monitoring started
+    uint32_t late_cycles;  // Cycles that ended after the next cycle's deadline
+    uint32_t overruns;     // Dumps that came back full, the driver had more packets
+    uint32_t cycle_us;     // Mean dump + parse + send time per cycle
+    float rate;            // Packets per second since the previous status
+    float target_rate;     // Requested packets per second (CAPTURE_RATE), else 0
+} __attribute__((packed));
+
+// Paces runMonitoring against steady-clock deadlines instead of sleeping a fixed interval after
+// every cycle, so processing time does not stretch the period, and sizes the dumps from the
+// packets the previous dumps returned.
+class CaptureScheduler
+{
+public:
+    using Clock = std::chrono::steady_clock;
+
+    explicit CaptureScheduler(const CaptureConfig& config);
+
+    void start(Clock::time_point now);
+    // Packets to request in the next dump
+    unsigned dumpSize() const { return dump; }
+    // A cycle that started at cycleStart returned packets and ended at now; returns when the next one starts
+    Clock::time_point cycleDone(unsigned packets, Clock::time_point cycleStart, Clock::time_point now);
+    // Counters, with the rate measured since the previous call
+    CsiCaptureStatus status(Clock::time_point now);
+
+private:
+    unsigned clampDump(double packets) const;
+
+    CaptureConfig config;
+    Clock::duration interval;
+    Clock::time_point deadline;       // Start of the next cycle
+    unsigned dump;
+    double packetsPerCycle = 0;       // EMA of the packets returned per dump
+    double cycleUs = 0;               // EMA of the cycle busy time
+    uint32_t cycles = 0;
+    uint32_t lateCycles = 0;
+    uint32_t overruns = 0;
+    uint64_t packets = 0;             // Packets since the previous status
+    Clock::time_point lastStatus;
+};
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+"""Raw CSIdump datagram capture files: recorder, memory-mapped reader and rate-controlled replayer
+
+A capture is an append-only data file holding a short file header (magic and
+the header version of the recorded datagrams) followed by records of (arrival
+time, length, raw datagram), plus an offset index in a sidecar file
+(<capture>.idx). The index is rebuilt from the data file if it is
+missing or incomplete, e.g. after the recorder was killed.
+"""
+
+import os
+import sys
+import mmap
+import time
+import socket
+import struct
+import argparse
+import numpy as np
+
+from csi_protocol import CSIUdpClient, CSIBatchBuilder, MAX_BATCH_DATAGRAMS, HEADER_VERSION_1, ENCODINGS
+
+# CSICAP01 files hold version 1 datagrams only; CSICAP02 adds uint32_t header_version
+CAPTURE_MAGIC_V1 = b'CSICAP01'
+CAPTURE_MAGIC = b'CSICAP02'
+FILE_HEADER_STRUCT = struct.Struct('<8sI')
+
+# Record header: double arrival_time (unix seconds), uint32_t datagram length
+RECORD_FORMAT = '<dI'
+RECORD_STRUCT = struct.Struct(RECORD_FORMAT)
+RECORD_HEADER_SIZE = RECORD_STRUCT.size
+
+# Index entry: offset of the datagram payload, its length and arrival time
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('time', '<f8')])
+INDEX_STRUCT = struct.Struct('<QId')  # Same packed layout as INDEX_DTYPE
+INDEX_SUFFIX = '.idx'
+
+class CaptureWriter:
+    """Appends raw datagrams with arrival timestamps to a capture file
+
+    header_version is the protocol header version of the recorded datagrams;
+    appending to an existing capture requires the same version.
+    """
+    def __init__(self, path, header_version=HEADER_VERSION_1):
+        self.path = path
+        self.header_version = header_version
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            existing_version = read_file_header(path)[1]
+            if existing_version != header_version:
+                raise ValueError(f"{path} holds header version {existing_version} datagrams, not {header_version}")
+        self.data_file = open(path, 'ab', buffering=1 << 20)
+        if self.data_file.tell() == 0:
+            self.data_file.write(FILE_HEADER_STRUCT.pack(CAPTURE_MAGIC, header_version))
+        self.offset = self.data_file.tell()
+        self.index_file = open(path + INDEX_SUFFIX, 'ab', buffering=1 << 16)
+        self.count = 0
+
+    def write(self, buffer, nbytes, arrival_time=None):
+        """Append buffer[:nbytes] as one record"""
+        if arrival_time is None:
+            arrival_time = time.time()
+        self.data_file.write(RECORD_STRUCT.pack(arrival_time, nbytes))
+        self.data_file.write(memoryview(buffer)[:nbytes])
+        payload_offset = self.offset + RECORD_HEADER_SIZE
+        self.index_file.write(INDEX_STRUCT.pack(payload_offset, nbytes, arrival_time))
+        self.offset = payload_offset + nbytes
+        self.count += 1
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+def read_file_header(path):
+    """Return (file header size, header version of the recorded datagrams)"""
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER_STRUCT.size)
+    if header[:len(CAPTURE_MAGIC_V1)] == CAPTURE_MAGIC_V1:
+        return len(CAPTURE_MAGIC_V1), HEADER_VERSION_1
+    if len(header) == FILE_HEADER_STRUCT.size and header[:len(CAPTURE_MAGIC)] == CAPTURE_MAGIC:
+        return FILE_HEADER_STRUCT.size, FILE_HEADER_STRUCT.unpack(header)[1]
+    raise ValueError(f"{path} is not a CSI capture file")
+
+class CaptureReader:
+    """Memory-mapped capture file; datagrams are returned as views without loading the file"""
+    def __init__(self, path):
+        self.path = path
+        self.file_header_size, self.header_version = read_file_header(path)
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        self.index = self.load_index()
+
+    def load_index(self):
+        """Memory-map the sidecar index, or rebuild it if it does not cover the whole data file"""
+        index_path = self.path + INDEX_SUFFIX
+        if os.path.exists(index_path) and os.path.getsize(index_path) >= INDEX_DTYPE.itemsize:
+            count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+            index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+            if int(index[-1]['offset']) + int(index[-1]['length']) == len(self.mm):
+                return index
+        elif len(self.mm) == self.file_header_size:
+            return np.empty(0, dtype=INDEX_DTYPE)
+        return self.rebuild_index()
+
+    def rebuild_index(self):
+        """Walk the record headers of the data file; a truncated last record is ignored"""
+        entries = []
+        offset = self.file_header_size
+        size = len(self.mm)
+        while offset + RECORD_HEADER_SIZE <= size:
+            arrival_time, length = RECORD_STRUCT.unpack_from(self.mm, offset)
+            offset += RECORD_HEADER_SIZE
+            if offset + length > size:
+                break
+            entries.append((offset, length, arrival_time))
+            offset += length
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def times(self):
+        return self.index['time']
+
+    def datagram(self, i):
+        """Raw datagram i as a memoryview into the mapped file"""
+        offset = int(self.index[i]['offset'])
+        return self.view[offset:offset + int(self.index[i]['length'])]
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+
+class CaptureReplayer:
+    """Replays a capture at its recorded pace scaled by speed (speed <= 0 replays as fast as possible)"""
+    def __init__(self, reader, speed=1.0, loop=False):
+        self.reader = reader
+        self.speed = speed
+        self.loop = loop
+
+    def due_ranges(self, max_count=MAX_BATCH_DATAGRAMS):
+        """Yield (start, stop) ranges of datagram indices as they become due, sleeping in between"""
+        times = np.asarray(self.reader.times())
+        if len(times) == 0:
+            return
+        relative_times = times - times[0]
+        while True:
+            start = 0
+            start_time = time.perf_counter()
+            while start < len(times):
+                if self.speed > 0:
+                    elapsed = (time.perf_counter() - start_time) * self.speed
+                    stop = int(np.searchsorted(relative_times, elapsed, side='right'))
+                    if stop <= start:
+                        time.sleep((relative_times[start] - elapsed) / self.speed)
+                        continue
+                else:
+                    stop = len(times)
+                stop = min(stop, start + max_count)
+                yield start, stop
+                start = stop
+            if not self.loop:
+                return
+
+    def batches(self, max_datagrams=MAX_BATCH_DATAGRAMS):
+        """Feed the capture straight into the receive path, yielding one CSIBatch per wake-up"""
+        builder = CSIBatchBuilder(self.reader.header_version)
+        for start, stop in self.due_ranges(max_datagrams):
+            for i in range(start, stop):
+                datagram = self.reader.datagram(i)
+                builder.add_datagram(datagram, len(datagram))
+            yield builder.build()
+
+    def send_udp(self, sock, addr):
+        """Send the capture to addr through sock; returns the number of datagrams sent"""
+        sent = 0
+        for start, stop in self.due_ranges():
+            for i in range(start, stop):
+                sock.sendto(self.reader.datagram(i), addr)
+            sent += stop - start
+        return sent
+
+def record(args):
+    """Record raw datagrams from a CSIdump server until Ctrl+C or --duration"""
+    client = CSIUdpClient(args.server_ip, args.server_port, encoding=args.encoding, aggregate=args.aggregate,
+                          mix_antennas=args.mix_antennas, packet_meta=args.packet_meta,
+                          multicast_interface=args.multicast_interface, capture_status=args.capture_status)
+    client.recorder = CaptureWriter(args.file, client.header_version)
+    client.register()
+    print(f"Recording from {args.server_ip}:{args.server_port} to {args.file}")
+    deadline = time.time() + args.duration if args.duration > 0 else None
+    try:
+        while deadline is None or time.time() < deadline:
+            client.receive_batch(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+        client.recorder.close()
+    print(f"Recorded {client.recorder.count} datagrams")
+
+def replay(args):
+    """Serve a capture like CSIdump: wait for a client to register, then send the datagrams"""
+    reader = CaptureReader(args.file)
+    if reader.header_version != HEADER_VERSION_1:
+        print(f"Note: {args.file} holds header version {reader.header_version} datagrams; "
+              f"clients must request the options it was recorded with")
+    replayer = CaptureReplayer(reader, 0 if args.max_speed else args.speed, args.loop)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', args.port))
+    print(f"Replaying {len(reader)} datagrams from {args.file}, waiting for a client on port {args.port}")
+    try:
+        while True:
+            message, addr = sock.recvfrom(1024)
+            if message.startswith(b'register'):
+                break
+        print(f"Client registered from {addr[0]}:{addr[1]}")
+        start = time.perf_counter()
+        sent = replayer.send_udp(sock, addr)
+        elapsed = time.perf_counter() - start
+        print(f"Sent {sent} datagrams in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f} datagrams/s)")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        reader.close()
+
+def info(args):
+    reader = CaptureReader(args.file)
+    times = reader.times()
+    if len(reader):
+        duration = times[-1] - times[0]
+        print(f"{args.file}: {len(reader)} datagrams, {duration:.2f}s, "
+              f"{len(reader) / max(duration, 1e-9):.0f} datagrams/s, {len(reader.mm)} bytes, "
+              f"header version {reader.header_version}")
+    else:
+        print(f"{args.file}: empty")
+    reader.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay raw CSIdump datagrams")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    record_parser = subparsers.add_parser("record", help="record datagrams from a CSIdump server")
+    record_parser.add_argument("server_ip")
+    record_parser.add_argument("server_port", type=int)
+    record_parser.add_argument("file")
+    record_parser.add_argument("--duration", type=float, default=0,
+                               help="stop after this many seconds (default: run until Ctrl+C)")
+    record_parser.add_argument("--encoding", choices=sorted(ENCODINGS), default="float64",
+                               help="sample encoding requested from the server (default: float64)")
+    record_parser.add_argument("--aggregate", type=int, metavar="BYTES",
+                               help="ask the server to pack packets into datagrams of up to BYTES")
+    record_parser.add_argument("--mix-antennas", action="store_true",
+                               help="with --aggregate, let packets of different antennas share a datagram")
+    record_parser.add_argument("--packet-meta", action="store_true",
+                               help="ask the server for the driver fields of every packet")
+    record_parser.add_argument("--capture-status", action="store_true",
+                               help="ask the server for its capture scheduler status every second")
+    record_parser.add_argument("--multicast-interface", metavar="IP",
+                               help="interface address to join on if the server is a multicast group")
+    record_parser.set_defaults(func=record)
+
+    replay_parser = subparsers.add_parser("replay", help="serve a capture to a registering client over UDP")
+    replay_parser.add_argument("file")
+    replay_parser.add_argument("port", type=int)
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="replay speed relative to the recording (default: 1.0)")
+    replay_parser.add_argument("--max-speed", action="store_true", help="send as fast as possible")
+    replay_parser.add_argument("--loop", action="store_true", help="restart at the end of the capture")
+    replay_parser.set_defaults(func=replay)
+
+    info_parser = subparsers.add_parser("info", help="print capture statistics")
+    info_parser.add_argument("file")
+    info_parser.set_defaults(func=info)
+
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+
+"""Chunked, time-indexed on-disk CSI datasets: background writer and lazy, memory-mapped reader
+
+A dataset is a directory. Processed packets are grouped into streams, one per
+(source, antenna, subcarrier count), and every stream is cut into chunks of
+at most chunk_rows packets. A chunk is stored column by column as plain .npy
+files (<dataset>/streamNNNN/chunkNNNNNNNN_<column>.npy):
+
+    timestamps   uint64 header timestamps (ms)
+    samples      complex64 processed samples               (content 'complex')
+    magnitude    float32 raw magnitude                     (content 'polar')
+    phase        float32 phase, sanitized if enabled       (content 'polar')
+
+dataset.json lists the content mode and the streams. index.idx is an
+append-only table with one INDEX_DTYPE entry per chunk (stream, chunk number,
+rows, time range), written only after the chunk's files are complete, so a
+killed writer leaves a readable dataset. Appending to an existing dataset
+continues its streams.
+
+The writer copies blocks into a bounded queue and does all file work on a
+background thread; when the queue is full, blocks are dropped and counted
+instead of stalling the caller. The reader memory-maps the index and opens
+only the chunks overlapping a requested time range and antenna set.
+"""
+
+import os
+import sys
+import json
+import queue
+import argparse
+import threading
+import numpy as np
+
+from csi_processing import BASELINE_APPLIED
+
+DATASET_FORMAT = 'csi-dataset'
+DATASET_VERSION = 1
+META_FILE = 'dataset.json'
+INDEX_FILE = 'index.idx'
+
+# What is stored per packet besides the timestamps
+CONTENTS = {
+    'complex': ('samples',),
+    'polar': ('magnitude', 'phase'),
+}
+
+# Chunk index entry; start and end are the first and last header timestamps in unix seconds
+INDEX_DTYPE = np.dtype([('stream', '<u4'), ('chunk', '<u4'), ('rows', '<u4'), ('antenna_idx', '<u4'),
+                        ('width', '<u4'), ('start', '<f8'), ('end', '<f8')])
+
+# Packets per chunk; a chunk is also closed once it spans DEFAULT_CHUNK_SECONDS
+DEFAULT_CHUNK_ROWS = 4096
+DEFAULT_CHUNK_SECONDS = 10.0
+
+# Blocks waiting for the writer thread before new ones are dropped
+DEFAULT_QUEUE_BLOCKS = 256
+
+def stream_dir(path, stream):
+    return os.path.join(path, f"stream{stream:04d}")
+
+def chunk_path(path, stream, chunk, column):
+    return os.path.join(stream_dir(path, stream), f"chunk{chunk:08d}_{column}.npy")
+
+def load_meta(path):
+    """dataset.json of the dataset at path, or None if there is none yet"""
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != DATASET_FORMAT:
+        raise ValueError(f"{path} is not a CSI dataset")
+    if meta.get('version', 0) > DATASET_VERSION:
+        raise ValueError(f"{path} has dataset version {meta['version']}, this reader supports {DATASET_VERSION}")
+    return meta
+
+def load_index(path):
+    """Chunk index of the dataset at path; a partly written last entry is ignored"""
+    index_path = os.path.join(path, INDEX_FILE)
+    count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+    if count == 0:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    return np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+
+class StreamBuffer:
+    """Packets of one stream waiting to become a chunk"""
+    def __init__(self, stream, antenna_idx, width, chunk):
+        self.stream = stream
+        self.antenna_idx = antenna_idx
+        self.width = width
+        self.chunk = chunk  # Number of the next chunk
+        self.columns = {}  # Column name -> list of arrays
+        self.rows = 0
+        self.start_ms = None
+
+    def append(self, columns):
+        for name, values in columns.items():
+            self.columns.setdefault(name, []).append(values)
+        if self.start_ms is None:
+            self.start_ms = int(columns['timestamps'][0])
+        self.rows += len(columns['timestamps'])
+
+    def take(self):
+        columns = {name: np.concatenate(values) for name, values in self.columns.items()}
+        self.columns = {}
+        self.rows = 0
+        self.start_ms = None
+        return columns
+
+class DatasetWriter:
+    """Streams ProcessedBlocks into a dataset directory from a background thread
+
+    content is 'complex' or 'polar' (see CONTENTS). add() never blocks: it
+    copies the block (it may view shared memory) and queues it, or counts it
+    as dropped when max_queue blocks are already waiting. Memory is bounded by
+    the queue plus one partly filled chunk per stream.
+    """
+    def __init__(self, path, content='complex', chunk_rows=DEFAULT_CHUNK_ROWS,
+                 chunk_seconds=DEFAULT_CHUNK_SECONDS, max_queue=DEFAULT_QUEUE_BLOCKS):
+        if content not in CONTENTS:
+            raise ValueError(f"content must be one of {', '.join(CONTENTS)}, got {content}")
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        os.makedirs(path, exist_ok=True)
+        meta = load_meta(path)
+        if meta is None:
+            meta = dict(format=DATASET_FORMAT, version=DATASET_VERSION, content=content, streams=[])
+        elif meta['content'] != content:
+            raise ValueError(f"{path} holds '{meta['content']}' data, not '{content}'")
+        self.meta = meta
+        self.content = content
+        # Appended streams continue after their last indexed chunk
+        index = load_index(path)
+        self.next_chunk = {}
+        for stream in np.unique(index['stream']):
+            self.next_chunk[int(stream)] = int(index['chunk'][index['stream'] == stream].max()) + 1
+        self.stream_ids = {(info['source'], info['antenna_idx'], info['width']): info['id']
+                           for info in meta['streams']}
+        self.buffers = {}  # Stream id -> StreamBuffer
+        self.index_file = open(os.path.join(path, INDEX_FILE), 'ab')
+        # Drop a partly written entry left by a killed writer
+        self.index_file.truncate(len(index) * INDEX_DTYPE.itemsize)
+        self.write_meta()
+
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0  # Packets dropped because the writer fell behind
+        self.rows = 0  # Packets written to chunks
+        self.chunks = 0  # Chunks written
+        self.error = None  # First exception the writer thread hit, if any
+        self.thread = threading.Thread(target=self.run, name="DatasetWriter", daemon=True)
+        self.thread.start()
+
+    def write_meta(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def columns(self, processed):
+        """Copies of the stored columns of a ProcessedBlock"""
+        columns = dict(timestamps=np.array(processed.timestamps, dtype=np.uint64))
+        if self.content == 'complex':
+            columns['samples'] = processed.samples.astype(np.complex64)
+        else:
+            # Raw magnitude, also while a baseline is subtracted
+            if processed.baseline_state == BASELINE_APPLIED:
+                magnitude = np.abs(processed.samples)
+            else:
+                magnitude = processed.magnitude
+            columns['magnitude'] = magnitude.astype(np.float32)
+            columns['phase'] = processed.phase().astype(np.float32)
+        return columns
+
+    def add(self, processed):
+        """Queue a ProcessedBlock for writing (caller side)"""
+        if len(processed.timestamps) == 0:
+            return
+        key = (processed.source or "", processed.antenna_idx, processed.samples.shape[-1])
+        try:
+            self.queue.put_nowait((key, self.columns(processed)))
+        except queue.Full:
+            self.dropped += len(processed.timestamps)
+
+    def run(self):
+        """Writer thread: collect queued blocks into chunks until close() queues None
+
+        A block that cannot be written is reported and skipped, the thread keeps
+        draining the queue so close() never waits on it.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.append(*item)
+            except Exception as e:
+                self.record_error(e)
+        for buffer in self.buffers.values():
+            if buffer.rows:
+                try:
+                    self.write_chunk(buffer)
+                except Exception as e:
+                    self.record_error(e)
+
+    def record_error(self, error):
+        if self.error is None:
+            self.error = error
+        print(f"Error writing dataset {self.path}: {error}", file=sys.stderr)
+
+    def stream_buffer(self, key):
+        stream = self.stream_ids.get(key)
+        if stream is None:
+            stream = self.stream_ids[key] = len(self.meta['streams'])
+            source, antenna_idx, width = key
+            self.meta['streams'].append(dict(id=stream, source=source, antenna_idx=antenna_idx, width=width))
+            self.write_meta()
+        buffer = self.buffers.get(stream)
+        if buffer is None:
+            buffer = self.buffers[stream] = StreamBuffer(stream, key[1], key[2], self.next_chunk.get(stream, 0))
+        return buffer
+
+    def append(self, key, columns):
+        buffer = self.stream_buffer(key)
+        count = len(columns['timestamps'])
+        start = 0
+        while start < count:
+            # Fill the open chunk up to chunk_rows
+            stop = min(count, start + self.chunk_rows - buffer.rows)
+            buffer.append({name: values[start:stop] for name, values in columns.items()})
+            start = stop
+            span = (int(columns['timestamps'][stop - 1]) - buffer.start_ms) / 1000.0
+            if buffer.rows >= self.chunk_rows or span >= self.chunk_seconds:
+                self.write_chunk(buffer)
+
+    def write_chunk(self, buffer):
+        """Write the buffered packets as one chunk, then index it"""
+        columns = buffer.take()
+        os.makedirs(stream_dir(self.path, buffer.stream), exist_ok=True)
+        for name, values in columns.items():
+            path = chunk_path(self.path, buffer.stream, buffer.chunk, name)
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, values)
+            os.replace(path + '.tmp', path)
+        timestamps = columns['timestamps']
+        entry = np.array([(buffer.stream, buffer.chunk, len(timestamps), buffer.antenna_idx, buffer.width,
+                           timestamps.min() / 1000.0, timestamps.max() / 1000.0)], dtype=INDEX_DTYPE)
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+        buffer.chunk += 1
+        self.rows += len(timestamps)
+        self.chunks += 1
+
+    def close(self):
+        """Write everything queued, including partly filled chunks"""
+        # A full queue only drains while the writer thread runs
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        self.index_file.close()
+
+class DatasetChunk:
+    """One chunk of a query result; columns are memory-mapped on first access
+
+    start and stop (unix seconds, inclusive) restrict the rows returned by
+    column(); chunks entirely inside the range are returned without a copy.
+    """
+    def __init__(self, path, entry, stream_info, start=None, stop=None):
+        self.path = path
+        self.stream = int(entry['stream'])
+        self.chunk = int(entry['chunk'])
+        self.source = stream_info['source']
+        self.antenna_idx = int(entry['antenna_idx'])
+        self.width = int(entry['width'])
+        inside = (start is None or entry['start'] >= start) and (stop is None or entry['end'] <= stop)
+        self.range = None if inside else (start, stop)
+        self.rows = None  # Row selection, computed from the timestamps when the range cuts the chunk
+
+    def load(self, column):
+        return np.load(chunk_path(self.path, self.stream, self.chunk, column), mmap_mode='r')
+
+    def column(self, name):
+        values = self.load(name)
+        if self.range is None:
+            return values
+        if self.rows is None:
+            seconds = self.load('timestamps') / 1000.0
+            start, stop = self.range
+            mask = np.ones(len(seconds), dtype=bool)
+            if start is not None:
+                mask &= seconds >= start
+            if stop is not None:
+                mask &= seconds <= stop
+            self.rows = np.flatnonzero(mask)
+        return values[self.rows]
+
+    @property
+    def timestamps(self):
+        return self.column('timestamps')
+
+class DatasetReader:
+    """Memory-mapped access to a dataset directory written by DatasetWriter"""
+    def __init__(self, path):
+        meta = load_meta(path)
+        if meta is None:
+            raise ValueError(f"{path} is not a CSI dataset")
+        self.path = path
+        self.content = meta['content']
+        self.streams = {info['id']: info for info in meta['streams']}
+        self.index = load_index(path)
+
+    def __len__(self):
+        return int(self.index['rows'].sum())
+
+    @property
+    def columns(self):
+        return ('timestamps',) + CONTENTS[self.content]
+
+    def time_range(self):
+        """(first, last) header timestamp in unix seconds, or None for an empty dataset"""
+        if len(self.index) == 0:
+            return None
+        return float(self.index['start'].min()), float(self.index['end'].max())
+
+    def chunks(self, start=None, stop=None, antennas=None, sources=None):
+        """DatasetChunks overlapping [start, stop] (unix seconds), in stream and time order
+
+        antennas and sources optionally restrict the antenna indices and servers.
+        Only the index is scanned; no chunk is opened until a column is read.
+        """
+        mask = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            mask &= self.index['end'] >= start
+        if stop is not None:
+            mask &= self.index['start'] <= stop
+        if antennas is not None:
+            mask &= np.isin(self.index['antenna_idx'], list(antennas))
+        if sources is not None:
+            stream_ids = [stream for stream, info in self.streams.items() if info['source'] in sources]
+            mask &= np.isin(self.index['stream'], stream_ids)
+        selected = self.index[mask]
+        selected = selected[np.lexsort((selected['start'], selected['stream']))]
+        return [DatasetChunk(self.path, entry, self.streams[int(entry['stream'])], start, stop)
+                for entry in selected]
+
+    def read(self, start=None, stop=None, antennas=None, sources=None, columns=None):
+        """Query result concatenated per stream: {(source, antenna_idx, width): {column: array}}"""
+        columns = columns or self.columns
+        parts = {}
+        for chunk in self.chunks(start, stop, antennas, sources):
+            key = (chunk.source, chunk.antenna_idx, chunk.width)
+            stream = parts.setdefault(key, {name: [] for name in columns})
+            for name in columns:
+                stream[name].append(chunk.column(name))
+        return {key: {name: np.concatenate(values) for name, values in stream.items()}
+                for key, stream in parts.items()}
+
+def parse_antennas(text):
+    """argparse type for a comma separated antenna list"""
+    try:
+        return [int(part) for part in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a comma separated antenna list, got {text}")
+
+def info(args):
+    reader = DatasetReader(args.path)
+    time_range = reader.time_range()
+    if time_range is None:
+        print(f"{args.path}: empty ({reader.content})")
+        return
+    duration = time_range[1] - time_range[0]
+    print(f"{args.path}: {len(reader)} packets in {len(reader.index)} chunks, {duration:.2f}s, "
+          f"content {reader.content}")
+    for stream, stream_info in sorted(reader.streams.items()):
+        entries = reader.index[reader.index['stream'] == stream]
+        if len(entries) == 0:
+            continue
+        source = f"{stream_info['source']} " if stream_info['source'] else ""
+        print(f"  stream {stream}: {source}antenna {stream_info['antenna_idx']}, {stream_info['width']} subcarriers, "
+              f"{int(entries['rows'].sum())} packets in {len(entries)} chunks, "
+              f"{entries['start'].min():.3f} .. {entries['end'].max():.3f}")
+
+def export(args):
+    """Save a time range of a dataset as an .npz file, keyed like csi_headless.py --export"""
+    reader = DatasetReader(args.path)
+    start = args.start
+    stop = args.stop
+    if args.relative and reader.time_range() is not None:
+        first = reader.time_range()[0]
+        start = first + start if start is not None else None
+        stop = first + stop if stop is not None else None
+    arrays = {}
+    for (source, antenna_idx, width), columns in reader.read(start, stop, args.antennas).items():
+        key = f"antenna{antenna_idx}_{width}"
+        if source:
+            key = f"{source.replace(':', '_')}_{key}"
+        for name, values in columns.items():
+            arrays[f"{key}_{name}"] = values
+    np.savez(args.file, **arrays)
+    print(f"Exported {len(arrays)} arrays to {args.file}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and slice chunked CSI datasets")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    info_parser = subparsers.add_parser("info", help="print dataset streams and time ranges")
+    info_parser.add_argument("path")
+    info_parser.set_defaults(func=info)
+
+    export_parser = subparsers.add_parser("export", help="save a time range and antenna set to an .npz file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--start", type=float, help="first time to export (unix seconds)")
+    export_parser.add_argument("--stop", type=float, help="last time to export (unix seconds)")
+    export_parser.add_argument("--relative", action="store_true",
+                               help="--start and --stop are seconds after the start of the dataset")
+    export_parser.add_argument("--antennas", type=parse_antennas, metavar="I,J,...",
+                               help="antennas to export (default: all)")
+    export_parser.set_defaults(func=export)
+
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""Doppler spectrogram of selected subcarriers, updated incrementally with a sliding DFT
+
+The magnitude of each selected subcarrier is treated as a time series at the
+packet rate. A sliding DFT keeps the spectrum of the newest window packets:
+every packet updates each bin with X_k <- (X_k + x_new - x_old) * e^(2j pi k / N),
+so the cost per packet is O(bins x subcarriers) and does not depend on the
+window length. Only a fixed number of bins, spread evenly from the lowest
+non-zero bin to half the packet rate, is tracked (the static DC bin is left
+out). Every hop packets the power, averaged over the
+subcarriers, becomes one spectrogram column.
+
+A block of packets is applied with one matrix product per hop instead of a
+Python loop per packet.
+"""
+
+import argparse
+import numpy as np
+
+from csi_processing import BASELINE_APPLIED
+
+# Subcarriers used when no subset is configured, spread evenly over the band
+DEFAULT_SUBCARRIERS = 16
+
+def parse_subcarriers(text):
+    """argparse type for a subcarrier subset: "start:stop[:step]" or "i,j,k" """
+    try:
+        if ':' in text:
+            return slice(*[int(part) if part else None for part in text.split(':')])
+        return [int(part) for part in text.split(',')]
+    except (ValueError, TypeError):
+        raise argparse.ArgumentTypeError(f"expected start:stop[:step] or a comma separated list, got {text}")
+
+def doppler_bins(window, bins):
+    """DFT bin indices 1..window/2 (DC left out), at most bins of them, evenly spaced"""
+    highest = window // 2
+    if bins >= highest:
+        return np.arange(1, highest + 1)
+    return np.unique(np.round(np.linspace(1, highest, bins)).astype(int))
+
+class SlidingDFT:
+    """Selected DFT bins over the newest window values of several series"""
+    def __init__(self, window, bins, series):
+        self.window = window
+        self.bins = np.asarray(bins)
+        self.history = np.zeros((window, series))  # Ring of the newest window inputs
+        self.pos = 0
+        self.count = 0  # Values seen
+        self.spectrum = np.zeros((len(self.bins), series), dtype=complex)
+        self.twiddles = {}  # Segment length -> (m, bins) factors e^(2j pi k (m - i) / N)
+
+    def factors(self, length):
+        factors = self.twiddles.get(length)
+        if factors is None:
+            steps = np.arange(length, 0, -1)[:, None]
+            factors = self.twiddles[length] = np.exp(2j * np.pi * steps * self.bins / self.window)
+        return factors
+
+    def update(self, values):
+        """Slide over values (m, series) with m <= window"""
+        length = len(values)
+        rows = (self.pos + np.arange(length)) % self.window
+        deltas = values - self.history[rows]
+        self.history[rows] = values
+        self.pos = (self.pos + length) % self.window
+        self.count += length
+
+        # X[n] = w^m X[n - m] + sum_i w^(m - i) (x_i - x_(i - N)), for all bins at once
+        factors = self.factors(length)
+        self.spectrum *= factors[0][:, None]
+        self.spectrum += factors.T @ deltas
+
+    @property
+    def full(self):
+        return self.count >= self.window
+
+    def power(self):
+        """(bins, series) power of the window, normalized by the window length"""
+        return np.abs(self.spectrum) ** 2 / self.window ** 2
+
+class DopplerSpectrogram:
+    """Spectrogram of one (source, antenna) channel: columns of mean power per Doppler bin"""
+    def __init__(self, window, hop, bins, width, subcarriers, columns):
+        self.hop = hop
+        self.width = width  # Subcarriers per packet
+        self.subcarriers = subcarriers  # Indices of the selected subcarriers
+        self.sdft = SlidingDFT(window, bins, len(subcarriers))
+        self.timestamps = np.zeros(window)  # Header timestamps of the window, for the packet rate
+        self.columns = np.zeros((2 * columns, len(self.sdft.bins)))  # Written twice, see WaterfallBuffer
+        self.max_columns = columns
+        self.head = 0
+        self.count = 0  # Columns stored
+        self.since_column = 0  # Packets since the last column
+
+    def add_column(self, power_db):
+        self.columns[self.head] = power_db
+        self.columns[self.head + self.max_columns] = power_db
+        self.head = (self.head + 1) % self.max_columns
+        self.count = min(self.count + 1, self.max_columns)
+
+    def view(self):
+        """Chronological (columns, bins) view, newest last, in dB"""
+        start = self.head + self.max_columns - self.count
+        return self.columns[start:start + self.count]
+
+    def packet_rate(self):
+        """Packets per second over the window, from the header timestamps (ms)"""
+        window = self.sdft.window
+        newest = self.timestamps[(self.sdft.pos - 1) % window]
+        oldest = self.timestamps[self.sdft.pos % window]
+        span = newest - oldest
+        return (window - 1) * 1000.0 / span if self.sdft.full and span > 0 else 0.0
+
+    def frequencies(self):
+        """Doppler frequency (Hz) of every bin, 0 until the window is full"""
+        return self.sdft.bins * self.packet_rate() / self.sdft.window
+
+    def update(self, timestamps, magnitude):
+        """Feed (packets,) timestamps and (packets, subcarriers) magnitude; returns the number of new columns"""
+        new_columns = 0
+        start = 0
+        while start < len(magnitude):
+            # Segments end where the next column is due
+            stop = min(len(magnitude), start + self.hop - self.since_column)
+            rows = (self.sdft.pos + np.arange(stop - start)) % self.sdft.window
+            self.timestamps[rows] = timestamps[start:stop]
+            self.sdft.update(magnitude[start:stop, self.subcarriers])
+            self.since_column += stop - start
+            start = stop
+            if self.since_column == self.hop:
+                self.since_column = 0
+                if self.sdft.full:
+                    power = self.sdft.power().mean(axis=1)
+                    self.add_column(10 * np.log10(power + 1e-12))
+                    new_columns += 1
+        return new_columns
+
+class DopplerAnalyzer:
+    """Doppler spectrograms of every (source, antenna) channel of a processed stream
+
+    window is the DFT length in packets, hop the packets between spectrogram
+    columns, bins the number of Doppler bins tracked and columns the
+    spectrogram history. subcarriers selects the subcarriers (a slice or an
+    index list); by default DEFAULT_SUBCARRIERS are spread over the band.
+    """
+    def __init__(self, window=128, hop=8, bins=32, subcarriers=None, columns=200):
+        if not 0 < hop <= window:
+            raise ValueError(f"hop must be between 1 and the window length ({window}), got {hop}")
+        self.window = window
+        self.hop = hop
+        self.bins = doppler_bins(window, bins)
+        self.subcarriers = subcarriers
+        self.columns = columns
+        self.channels = {}  # (source, antenna) -> DopplerSpectrogram
+
+    def reset(self):
+        self.channels.clear()
+
+    def select_subcarriers(self, num_subcarriers):
+        if self.subcarriers is None:
+            count = min(DEFAULT_SUBCARRIERS, num_subcarriers)
+            return np.unique(np.linspace(0, num_subcarriers - 1, count).astype(int))
+        if isinstance(self.subcarriers, slice):
+            indices = np.arange(num_subcarriers)[self.subcarriers]
+        else:
+            # Indices beyond a narrower bandwidth are left out
+            indices = np.asarray(self.subcarriers)
+            indices = indices[(indices >= 0) & (indices < num_subcarriers)]
+        return indices if len(indices) else np.arange(num_subcarriers)
+
+    def update(self, processed):
+        """Feed a ProcessedBlock; returns the channel's DopplerSpectrogram and the number of new columns"""
+        # Raw magnitude, also while a baseline is subtracted
+        if processed.baseline_state == BASELINE_APPLIED:
+            magnitude = np.abs(processed.samples)
+        else:
+            magnitude = processed.magnitude
+        channel = (processed.source, processed.antenna_idx)
+        spectrogram = self.channels.get(channel)
+        if spectrogram is None or spectrogram.width != magnitude.shape[-1]:
+            # New channel or bandwidth change: restart with a new subcarrier selection
+            width = magnitude.shape[-1]
+            spectrogram = DopplerSpectrogram(self.window, self.hop, self.bins, width,
+                                             self.select_subcarriers(width), self.columns)
+            self.channels[channel] = spectrogram
+        return spectrogram, spectrogram.update(processed.timestamps.astype(float), magnitude)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""Asyncio fan-in receiver: any number of CSIdump servers on one event loop and one thread
+
+Each server gets its own registered CSIUdpClient socket (or a socket that
+joined the server's multicast group). The sockets are
+watched with loop.add_reader, and every wake-up drains the ready socket with
+drain_socket, so datagrams are batched and SO_RXQ_OVFL drops are counted per
+source exactly as for a single client. Every CSIBatch and CSIData is tagged
+with the "ip:port" name of its server.
+
+Batches can be consumed as async iterators (all sources, or one source per
+stream) from asyncio code, or with receive_batches() from a plain thread,
+which steps the event loop until data arrives.
+"""
+
+import sys
+import asyncio
+import argparse
+
+from csi_protocol import CSIUdpClient
+
+def server_address(text):
+    """argparse type for "host:port" """
+    host, sep, port = text.rpartition(':')
+    if not sep or not host:
+        raise argparse.ArgumentTypeError(f"expected host:port, got {text}")
+    try:
+        return host, int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port in {text}")
+
+class CSIFanInReceiver:
+    """Receives CSI batches from several CSIdump servers on a single asyncio event loop
+
+    servers is a list of (ip, port) tuples; the remaining arguments are passed
+    to every CSIUdpClient. Without a loop, a private event loop is created and
+    driven by receive_batches(). Multicast groups among the servers are joined
+    on multicast_interface.
+    """
+    def __init__(self, servers, rcvbuf=None, encoding='float64', aggregate=None, mix_antennas=False, loop=None,
+                 packet_meta=False, multicast_interface=None, capture_status=False):
+        self.own_loop = loop is None
+        self.loop = asyncio.new_event_loop() if loop is None else loop
+        self.clients = {}  # source name -> CSIUdpClient
+        for server_ip, server_port in servers:
+            client = CSIUdpClient(server_ip, server_port, rcvbuf, encoding, aggregate, mix_antennas, packet_meta,
+                                  multicast_interface, capture_status)
+            if client.name in self.clients:
+                client.close()
+                continue
+            self.clients[client.name] = client
+        self.subscribers = []  # (source filter or None, asyncio.Queue)
+        self.queue = None  # Subscription used by receive_batches
+        self.started = False
+
+    @property
+    def sources(self):
+        return list(self.clients)
+
+    @property
+    def rcvbuf(self):
+        """Actual kernel receive buffer size of one socket"""
+        return next(iter(self.clients.values())).rcvbuf if self.clients else 0
+
+    def start(self):
+        """Register with every server and start watching the sockets"""
+        for name, client in self.clients.items():
+            try:
+                client.register()
+                print(f"Joined multicast group {name}" if client.multicast else f"Registered with server at {name}")
+            except OSError as e:
+                print(f"Failed to register with {name}: {e}", file=sys.stderr)
+            self.loop.add_reader(client.socket.fileno(), self.on_readable, client)
+        self.started = True
+
+    def on_readable(self, client):
+        try:
+            batch = client.drain()
+        except Exception as e:
+            print(f"Error receiving data from {client.name}: {e}", file=sys.stderr)
+            return
+        if not batch.blocks:
+            return
+        for source, queue in self.subscribers:
+            if source is None or source == batch.source:
+                queue.put_nowait(batch)
+
+    def subscribe(self, source=None):
+        """Queue receiving the batches of one source, or of all sources if source is None"""
+        if source is not None and source not in self.clients:
+            raise KeyError(f"Unknown source {source}")
+        queue = asyncio.Queue()
+        self.subscribers.append((source, queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers = [(source, q) for source, q in self.subscribers if q is not queue]
+
+    async def stream(self, source=None):
+        """Async iterator over the batches of one source (or all sources) as they arrive"""
+        if not self.started:
+            self.start()
+        queue = self.subscribe(source)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(queue)
+
+    def receive_batches(self, timeout=1.0):
+        """Run the event loop until batches arrive or timeout expires; for callers outside asyncio
+
+        Returns the list of batches received from all sources, empty on timeout.
+        """
+        if not self.started:
+            self.start()
+        if self.queue is None:
+            self.queue = self.subscribe()
+        batches = []
+        if self.queue.empty():
+            try:
+                batches.append(self.loop.run_until_complete(asyncio.wait_for(self.queue.get(), timeout)))
+            except asyncio.TimeoutError:
+                return batches
+        while not self.queue.empty():
+            batches.append(self.queue.get_nowait())
+        return batches
+
+    def close(self):
+        for client in self.clients.values():
+            if self.started:
+                self.loop.remove_reader(client.socket.fileno())
+            client.close()
+        self.subscribers = []
+        if self.own_loop:
+            self.loop.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Bounded hand-off of received CSI batches from a receiver thread to a consumer thread
+
+The receiver puts every CSIBatch it drains; the consumer takes everything
+pending at once. Pending CSIData blocks are bounded by a policy:
+
+    latest       every (source, antenna) channel keeps at most capacity blocks,
+                 the oldest block of a full channel is dropped (newest data wins,
+                 a busy antenna cannot push out the others)
+    drop-oldest  at most capacity blocks over all channels, the oldest is dropped
+    block        at most capacity blocks over all channels, the receiver waits
+                 for the consumer (the kernel socket buffer then overflows and
+                 shows up as kernel drops)
+
+Dropped packets are counted per channel. Batch statistics (datagrams, receive
+and decode time, kernel drops, capture status) are never dropped: they are summed per source
+and delivered with the next take(), so metrics stay complete. So is the packet
+metadata of dropped blocks (CSIBatch.dropped_meta), so sequence gaps only count
+packets that never reached the client.
+"""
+
+import threading
+from collections import deque
+
+from csi_protocol import CSIBatch
+
+HANDOFF_POLICIES = ('latest', 'drop-oldest', 'block')
+
+# Pending blocks per channel (latest) or in total (drop-oldest, block)
+DEFAULT_HANDOFF_CAPACITY = 16
+
+class BatchHandoff:
+    """Thread-safe bounded queue of CSIData blocks between a receiver and its consumer"""
+    def __init__(self, capacity=DEFAULT_HANDOFF_CAPACITY, policy='latest'):
+        if policy not in HANDOFF_POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(HANDOFF_POLICIES)}, got {policy}")
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.policy = policy
+        self.condition = threading.Condition()
+        self.pending = {}  # Channel -> deque of (sequence, arrival time, CSIData), oldest first
+        self.count = 0  # Pending blocks over all channels
+        self.sequence = 0  # Arrival order of the blocks
+        self.stats = {}  # Source -> CSIBatch holding the summed statistics of the pending batches
+        self.drops = {}  # Channel -> packets dropped, cumulative
+        self.closed = False
+
+    def __len__(self):
+        return self.count
+
+    def drop_oldest(self, blocks):
+        _, _, csi_data = blocks.popleft()
+        channel = (csi_data.source, csi_data.antenna_idx)
+        self.drops[channel] = self.drops.get(channel, 0) + len(csi_data.timestamps)
+        self.count -= 1
+        if csi_data.meta is not None:
+            # A pending block is newer than anything taken, so the tracker still sees every packet in order
+            self.stats[csi_data.source].dropped_meta.append((csi_data.antenna_idx, csi_data.meta))
+
+    def put(self, batch):
+        """Add a CSIBatch (receiver side); returns True if nothing was pending before
+
+        The consumer only needs to be woken up when True is returned.
+        """
+        with self.condition:
+            if self.policy == 'block':
+                # A batch larger than the capacity still goes through once the queue is empty
+                while self.count and self.count + len(batch.blocks) > self.capacity and not self.closed:
+                    self.condition.wait()
+            was_empty = not self.count and not self.stats
+            self.add_stats(batch)
+            for csi_data in batch.blocks:
+                blocks = self.pending.setdefault((csi_data.source, csi_data.antenna_idx), deque())
+                if self.policy == 'latest' and len(blocks) >= self.capacity:
+                    self.drop_oldest(blocks)
+                elif self.policy == 'drop-oldest' and self.count >= self.capacity:
+                    self.drop_oldest(min((channel_blocks for channel_blocks in self.pending.values()
+                                          if channel_blocks), key=lambda channel_blocks: channel_blocks[0][0]))
+                blocks.append((self.sequence, batch.arrival_time, csi_data))
+                self.sequence += 1
+                self.count += 1
+            return was_empty
+
+    def add_stats(self, batch):
+        stats = self.stats.get(batch.source)
+        if stats is None:
+            stats = self.stats[batch.source] = CSIBatch()
+            stats.source = batch.source
+            stats.arrival_time = batch.arrival_time
+        stats.num_datagrams += batch.num_datagrams
+        stats.malformed += batch.malformed
+        stats.receive_time += batch.receive_time
+        stats.decode_time += batch.decode_time
+        if batch.kernel_drops is not None:
+            stats.kernel_drops = batch.kernel_drops
+        if batch.capture_status is not None:
+            stats.capture_status = batch.capture_status
+
+    def take(self):
+        """Everything pending as one CSIBatch per source, blocks in arrival order (consumer side)
+
+        A batch's arrival_time is that of its oldest remaining block, so the
+        queue time measured from it is the age of the oldest data shown.
+        """
+        with self.condition:
+            entries = sorted(entry for blocks in self.pending.values() for entry in blocks)
+            batches = self.stats
+            for _, arrival_time, csi_data in entries:
+                batch = batches[csi_data.source]
+                if not batch.blocks:
+                    batch.arrival_time = arrival_time
+                batch.blocks.append(csi_data)
+            self.pending = {}
+            self.count = 0
+            self.stats = {}
+            self.condition.notify_all()
+            return list(batches.values())
+
+    def drop_counts(self):
+        """Copy of the cumulative packets dropped per (source, antenna) channel"""
+        with self.condition:
+            return dict(self.drops)
+
+    def close(self):
+        """Release a receiver blocked in put()"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+
+"""Headless CSI client: receive -> process -> stats/export, without Qt or a display"""
+
+import sys
+import time
+import signal
+import argparse
+import numpy as np
+
+from csi_protocol import ENCODINGS, CHANNEL_BANDWIDTHS
+from csi_fanin import CSIFanInReceiver, server_address
+from csi_processing import CSIPipeline, BASELINE_MODES
+from csi_motion import StreamingMotionDetector
+from csi_doppler import DopplerAnalyzer, parse_subcarriers
+from csi_windows import CSIWindower, WINDOW_OUTPUTS
+from csi_dataset import DatasetWriter, CONTENTS
+from csi_capture import CaptureWriter, CaptureReader, CaptureReplayer
+from csi_metrics import ClientMetrics, MetricsLogger, STAGE_PROCESSING, STAGE_LATENCY, format_capture_status
+
+class HeadlessStats:
+    """Packet counters and magnitude summary per antenna for one reporting interval
+
+    With show_sources antennas are labeled with the server they came from. With
+    a motion detector, the newest motion score of every antenna and the
+    combined score are reported as well; with Doppler analysis, the frequency
+    of the strongest Doppler bin; with packet metadata, the channel bandwidth
+    and mean RSSI, plus sequence gaps and jitter from the metrics snapshot.
+    With a windower, the windows completed per second and the packets dropped
+    for lack of a partner on every antenna.
+    """
+    def __init__(self, show_sources=False, detector=None, windower=None):
+        self.start_time = time.time()
+        self.show_sources = show_sources
+        self.detector = detector
+        self.windower = windower
+        self.reset()
+
+    def reset(self):
+        self.interval_start = time.time()
+        self.datagrams = 0
+        self.packets = {}
+        self.mean_magnitude = {}
+        self.motion_score = {}
+        self.doppler_peak = {}
+        self.radio = {}  # Channel -> (bandwidth MHz, mean RSSI) from the packet metadata
+        self.windows = 0
+
+    def add_batch(self, batch, processed_blocks):
+        self.datagrams += batch.num_datagrams
+        for processed in processed_blocks:
+            channel = (processed.source or "", processed.antenna_idx)
+            self.packets[channel] = self.packets.get(channel, 0) + len(processed.samples)
+            self.mean_magnitude[channel] = float(processed.magnitude.mean())
+            if processed.meta is not None:
+                bandwidth = CHANNEL_BANDWIDTHS.get(int(processed.meta['ch_bw'][-1]), 0)
+                self.radio[channel] = (bandwidth, float(processed.meta['rssi'].mean()))
+
+    def add_motion(self, scores):
+        self.motion_score[(scores.source or "", scores.antenna_idx)] = float(scores.scores[-1])
+
+    def add_windows(self, windows):
+        self.windows += len(windows)
+
+    def add_doppler(self, processed, spectrogram):
+        if spectrogram.count:
+            peak = spectrogram.frequencies()[spectrogram.view()[-1].argmax()]
+            self.doppler_peak[(processed.source or "", processed.antenna_idx)] = float(peak)
+
+    def report(self, snapshot=None):
+        elapsed = max(time.time() - self.interval_start, 1e-9)
+        per_antenna = " | ".join(
+            f"{source + ' ' if self.show_sources else ''}ant {antenna_idx}: {count / elapsed:.0f} pkt/s, "
+            f"mean |H| {self.mean_magnitude[(source, antenna_idx)]:.1f}"
+            + (f", motion {self.motion_score[(source, antenna_idx)]:.2f}"
+               if (source, antenna_idx) in self.motion_score else "")
+            + (f", doppler peak {self.doppler_peak[(source, antenna_idx)]:.1f} Hz"
+               if (source, antenna_idx) in self.doppler_peak else "")
+            + (", {} MHz, RSSI {:.0f} dBm".format(*self.radio[(source, antenna_idx)])
+               if (source, antenna_idx) in self.radio else "")
+            for (source, antenna_idx), count in sorted(self.packets.items()))
+        drops = f" | kernel drops {snapshot['kernel_drops']}" if snapshot else ""
+        if snapshot and self.radio:
+            drops += f" | sequence gaps {snapshot['sequence_gaps']} | jitter {snapshot['hw_jitter_ms']:.2f} ms"
+        motion = ""
+        if self.detector is not None:
+            motion = f" | motion {self.detector.combined_score:.2f}{' MOTION' if self.detector.motion else ''}"
+        if self.windower is not None:
+            motion += f" | windows {self.windows / elapsed:.0f}/s, {self.windower.dropped} unpaired"
+        print(f"[{time.time() - self.start_time:7.1f}s] {self.datagrams / elapsed:.0f} datagrams/s"
+              f"{drops}{motion}{' | ' + per_antenna if per_antenna else ''}")
+        for source, status in (snapshot or {}).get("capture_status", {}).items():
+            print(f"          {format_capture_status(source, status)}")
+        self.reset()
+
+class ExportCollector:
+    """Processed complex samples and timestamps per antenna, saved as .npz on exit
+
+    With show_sources keys are prefixed with the server, e.g. "10.0.0.1_8888_antenna0_509".
+    Motion scores, if given, are saved per antenna as "<key>_motion", sanitized
+    phase as "<key>_phase", Doppler spectrogram columns (dB) as "<key>_doppler"
+    with the bin frequencies (Hz) in "<key>_doppler_hz".
+    """
+    def __init__(self, path, show_sources=False):
+        self.path = path
+        self.show_sources = show_sources
+        self.blocks = {}
+        self.motion = {}
+        self.doppler = {}
+        self.doppler_hz = {}
+
+    def add(self, processed_blocks, motion_scores=None, doppler=None):
+        for i, processed in enumerate(processed_blocks):
+            # Separate keys per subcarrier count, blocks of different bandwidths cannot be stacked
+            key = f"antenna{processed.antenna_idx}_{processed.samples.shape[-1]}"
+            if self.show_sources:
+                key = f"{processed.source.replace(':', '_')}_{key}"
+            self.blocks.setdefault(key, []).append(processed)
+            if motion_scores is not None:
+                self.motion.setdefault(key, []).append(motion_scores[i].scores)
+            if doppler is not None:
+                spectrogram, new_columns = doppler[i]
+                if new_columns:
+                    self.doppler.setdefault(key, []).append(spectrogram.view()[-new_columns:].copy())
+                    self.doppler_hz[key] = spectrogram.frequencies()
+
+    def save(self):
+        arrays = {}
+        for key, blocks in self.blocks.items():
+            arrays[f"{key}_samples"] = np.concatenate([block.samples for block in blocks])
+            arrays[f"{key}_timestamps"] = np.concatenate([block.timestamps for block in blocks])
+            if all(block.sanitized_phase is not None for block in blocks):
+                arrays[f"{key}_phase"] = np.concatenate([block.sanitized_phase for block in blocks])
+            if key in self.motion:
+                arrays[f"{key}_motion"] = np.concatenate(self.motion[key])
+            if key in self.doppler:
+                arrays[f"{key}_doppler"] = np.concatenate(self.doppler[key])
+                arrays[f"{key}_doppler_hz"] = self.doppler_hz[key]
+        np.savez(self.path, **arrays)
+        print(f"Exported {len(self.blocks)} antenna streams to {self.path}")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Headless CSI client for CSIdump")
+    parser.add_argument("server_ip", nargs="?")
+    parser.add_argument("server_port", type=int, nargs="?")
+    parser.add_argument("--server", type=server_address, action="append", default=[], metavar="HOST:PORT",
+                        help="additional CSIdump server to receive from, may be repeated")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="stop after this many seconds (default: run until Ctrl+C)")
+    parser.add_argument("--stats-interval", type=float, default=1.0,
+                        help="seconds between stats lines (default: 1.0)")
+    parser.add_argument("--export", metavar="FILE",
+                        help="save processed samples and timestamps per antenna to an .npz file on exit")
+    parser.add_argument("--dataset", metavar="DIR",
+                        help="stream processed packets into a chunked, time-indexed dataset directory")
+    parser.add_argument("--dataset-content", choices=sorted(CONTENTS), default="complex",
+                        help="what --dataset stores per packet: complex samples or magnitude and phase "
+                             "(default: complex)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="append every raw datagram to a capture file")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="process a capture file instead of receiving from a server")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed relative to the recording, 0 for maximum speed (default: 1.0)")
+    parser.add_argument("--encoding", choices=sorted(ENCODINGS), default="float64",
+                        help="sample encoding requested from the server (default: float64)")
+    parser.add_argument("--aggregate", type=int, metavar="BYTES",
+                        help="ask the server to pack packets into datagrams of up to BYTES "
+                             "(1472 fits an Ethernet MTU, at most 65507)")
+    parser.add_argument("--mix-antennas", action="store_true",
+                        help="with --aggregate, let packets of different antennas share a datagram")
+    parser.add_argument("--rcvbuf", type=int, metavar="BYTES",
+                        help="kernel socket receive buffer size")
+    parser.add_argument("--packet-meta", action="store_true",
+                        help="ask the server for the driver fields of every packet, to count sequence gaps "
+                             "and measure hardware timestamp jitter")
+    parser.add_argument("--capture-status", action="store_true",
+                        help="ask the server for its capture scheduler status (rate, dump size, late cycles) "
+                             "every second")
+    parser.add_argument("--multicast-interface", metavar="IP",
+                        help="address of the interface to join multicast groups on, when a server is a "
+                             "multicast group (default: any)")
+    parser.add_argument("--metrics-jsonl", metavar="FILE",
+                        help="append a metrics snapshot as a JSON line every stats interval")
+    parser.add_argument("--keep-dc-subcarrier", action="store_true",
+                        help="do not interpolate the DC subcarrier")
+    parser.add_argument("--remove-dc-offset", action="store_true",
+                        help="subtract the per-packet I/Q mean")
+    parser.add_argument("--baseline", choices=[mode for mode in BASELINE_MODES if mode != 'fixed'],
+                        help="subtract a baseline from the magnitude: the mean of the newest "
+                             "--baseline-window packets (rolling) or an exponential moving average (ema)")
+    parser.add_argument("--baseline-window", type=int, default=100, metavar="PACKETS",
+                        help="packets in the rolling baseline (default: 100)")
+    parser.add_argument("--sanitize-phase", action="store_true",
+                        help="unwrap the phase and remove its per-packet linear trend (exported with --export)")
+    parser.add_argument("--motion", action="store_true",
+                        help="score motion per antenna and report it with the stats (and in --export)")
+    parser.add_argument("--motion-threshold", type=float, default=3.0,
+                        help="combined motion score above which motion is reported (default: 3.0)")
+    parser.add_argument("--doppler", action="store_true",
+                        help="compute a Doppler spectrogram per antenna, report its peak and export it")
+    parser.add_argument("--doppler-window", type=int, default=128, metavar="PACKETS",
+                        help="Doppler DFT window length (default: 128)")
+    parser.add_argument("--doppler-hop", type=int, default=8, metavar="PACKETS",
+                        help="packets between spectrogram columns (default: 8)")
+    parser.add_argument("--doppler-bins", type=int, default=32,
+                        help="Doppler bins tracked, up to window / 2 (default: 32)")
+    parser.add_argument("--window", type=int, default=0, metavar="PACKETS",
+                        help="cut (antennas, subcarriers, time) windows of this many packets, synchronised "
+                             "across antennas, and report their rate (default: off)")
+    parser.add_argument("--window-hop", type=int, default=1, metavar="PACKETS",
+                        help="packets between window starts (default: 1)")
+    parser.add_argument("--window-output", choices=list(WINDOW_OUTPUTS), default="magnitude",
+                        help="what windows hold (default: magnitude)")
+    parser.add_argument("--doppler-subcarriers", type=parse_subcarriers, metavar="START:STOP[:STEP]|I,J,...",
+                        help="subcarriers for the Doppler spectrogram (default: 16 spread over the band)")
+    args = parser.parse_args(argv)
+    if args.replay is None and args.server_port is None:
+        parser.error("server_ip and server_port are required unless --replay is given")
+    if args.record and args.server:
+        parser.error("--record takes a single server")
+    if not 0 < args.doppler_hop <= args.doppler_window:
+        parser.error("--doppler-hop must be between 1 and --doppler-window")
+    if args.window and not 0 < args.window_hop <= args.window:
+        parser.error("--window-hop must be between 1 and --window")
+    return args
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    pipeline = CSIPipeline(remove_dc_subcarrier=not args.keep_dc_subcarrier,
+                           remove_dc_offset=args.remove_dc_offset, sanitize_phase=args.sanitize_phase,
+                           amplitude_diff=args.baseline is not None, baseline_mode=args.baseline or 'fixed',
+                           baseline_window=args.baseline_window)
+    detector = StreamingMotionDetector(threshold=args.motion_threshold) if args.motion else None
+    windower = CSIWindower(args.window, args.window_hop, args.window_output) if args.window else None
+    show_sources = bool(args.server) and not args.replay
+    stats = HeadlessStats(show_sources, detector, windower)
+    doppler = None
+    if args.doppler:
+        doppler = DopplerAnalyzer(args.doppler_window, args.doppler_hop, args.doppler_bins,
+                                  args.doppler_subcarriers)
+    metrics = ClientMetrics()
+    metrics_logger = MetricsLogger(args.metrics_jsonl) if args.metrics_jsonl else None
+    export = ExportCollector(args.export, show_sources) if args.export else None
+    dataset = DatasetWriter(args.dataset, args.dataset_content) if args.dataset else None
+
+    running = [True]
+    def stop(signum, frame):
+        running[0] = False
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    if args.replay:
+        reader = CaptureReader(args.replay)
+        print(f"Replaying {len(reader)} datagrams from {args.replay}")
+        batches = CaptureReplayer(reader, args.speed).batches()
+        client = None
+        recorder = None
+    else:
+        servers = [(args.server_ip, args.server_port)] + args.server
+        client = CSIFanInReceiver(servers, args.rcvbuf, args.encoding, args.aggregate, args.mix_antennas,
+                                  packet_meta=args.packet_meta, multicast_interface=args.multicast_interface,
+                                  capture_status=args.capture_status)
+        metrics.rcvbuf = client.rcvbuf
+        recorder = None
+        if args.record:
+            udp_client = client.clients[client.sources[0]]
+            recorder = CaptureWriter(args.record, udp_client.header_version)
+            udp_client.recorder = recorder
+        client.start()
+
+    deadline = time.time() + args.duration if args.duration > 0 else None
+    try:
+        while running[0] and (deadline is None or time.time() < deadline):
+            if client is not None:
+                received = client.receive_batches(min(args.stats_interval, 0.5))
+            else:
+                batch = next(batches, None)
+                received = [batch] if batch is not None else []
+                if batch is None:
+                    running[0] = False
+
+            for batch in received:
+                metrics.record_batch(batch, time.time())
+                start = time.perf_counter()
+                processed_blocks = pipeline.process_batch(batch)
+                metrics.record(STAGE_PROCESSING, (time.perf_counter() - start) * 1000)
+                now_ms = time.time() * 1000
+                for processed in processed_blocks:
+                    metrics.record(STAGE_LATENCY, now_ms - processed.timestamps.astype(float))
+                stats.add_batch(batch, processed_blocks)
+                motion_scores = None
+                if detector is not None:
+                    motion_scores = [detector.update(processed) for processed in processed_blocks]
+                    for scores in motion_scores:
+                        stats.add_motion(scores)
+                spectrograms = None
+                if doppler is not None:
+                    spectrograms = [doppler.update(processed) for processed in processed_blocks]
+                    for processed, (spectrogram, _) in zip(processed_blocks, spectrograms):
+                        stats.add_doppler(processed, spectrogram)
+                if windower is not None:
+                    stats.add_windows(windower.update_blocks(processed_blocks))
+                if export:
+                    export.add(processed_blocks, motion_scores, spectrograms)
+                if dataset:
+                    for processed in processed_blocks:
+                        dataset.add(processed)
+
+            if time.time() - stats.interval_start >= args.stats_interval or not running[0]:
+                snapshot = metrics.roll()
+                if metrics_logger:
+                    metrics_logger.write(snapshot)
+                stats.report(snapshot)
+    finally:
+        if client is not None:
+            client.close()
+        if recorder:
+            recorder.close()
+        if export:
+            export.save()
+        if dataset:
+            dataset.close()
+            dropped = f", {dataset.dropped} packets dropped" if dataset.dropped else ""
+            failed = f", some blocks failed: {dataset.error}" if dataset.error else ""
+            print(f"Wrote {dataset.rows} packets in {dataset.chunks} chunks to {args.dataset}{dropped}{failed}")
+        if metrics_logger:
+            metrics_logger.close()
+
+if __name__ == "__main__":
+    main()
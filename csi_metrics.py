@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+"""Per-stage latency and loss instrumentation for the CSI client
+
+Stage timings are recorded into log-spaced histograms and rolled over at a
+fixed interval; every rolled snapshot can be shown in the GUI stats panel and
+appended to a JSON lines file for monitoring. When the server sends packet
+metadata, lost packets and timing jitter are measured from the driver's
+sequence numbers and hardware timestamps.
+"""
+
+import json
+import time
+import numpy as np
+
+from csi_stats import ema_filter
+
+# Stages with timing histograms (milliseconds)
+STAGE_RECEIVE = 'receive'        # recv syscalls per batch
+STAGE_DECODE = 'decode'          # datagram decoding and stacking per batch
+STAGE_QUEUE = 'queue'            # receiver -> consumer hand-off per batch
+STAGE_PROCESSING = 'processing'  # CSIPipeline per batch
+STAGE_RENDER = 'render'          # GUI frame
+STAGE_LATENCY = 'latency'        # header timestamp -> processed (headless) or rendered (GUI), per packet
+STAGES = (STAGE_RECEIVE, STAGE_DECODE, STAGE_QUEUE, STAGE_PROCESSING, STAGE_RENDER, STAGE_LATENCY)
+
+# 802.11 sequence numbers are 12 bits; larger forward steps are taken as reordering or a restart
+SEQUENCE_MODULO = 4096
+MAX_SEQUENCE_GAP = SEQUENCE_MODULO // 2
+
+# Hardware timestamps are microseconds in a wrapping uint32
+HW_TIMESTAMP_MODULO = 1 << 32
+
+# Gain of the interarrival jitter estimate, as in RFC 3550
+JITTER_GAIN = 1.0 / 16
+
+class Histogram:
+    """Log-spaced histogram of durations in milliseconds (1 us .. 100 s, 20 bins per decade)"""
+    EDGES = np.logspace(-3, 5, 161)
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.EDGES) + 1, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, values):
+        """Add one value or an array of values"""
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        self.counts += np.bincount(np.searchsorted(self.EDGES, values), minlength=len(self.counts))
+        self.total += len(values)
+        self.sum += float(values.sum())
+        self.max = max(self.max, float(values.max()))
+
+    def percentile(self, q):
+        """Upper bin edge below which q percent of the values fall, capped at the maximum"""
+        if self.total == 0:
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(self.counts), self.total * q / 100.0))
+        return min(float(self.EDGES[min(idx, len(self.EDGES) - 1)]), self.max)
+
+    def summary(self):
+        if self.total == 0:
+            return {"count": 0}
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+class SequenceState:
+    """Newest sequence number, hardware timestamp, interval and jitter of one packet stream"""
+    def __init__(self, pkt_sn, ts):
+        self.pkt_sn = pkt_sn
+        self.ts = ts
+        self.interval = None  # Newest hardware interval (ms)
+        self.jitter = 0.0  # Smoothed interval variation (ms)
+
+class SequenceTracker:
+    """Lost packets and interval jitter from CsiPacketMeta fields
+
+    Streams are told apart by source, antenna and transmitter address, so every
+    stream has its own 802.11 sequence numbers. A forward step of n > 1 counts
+    n - 1 lost packets, a step of 0 a duplicate. The jitter is the RFC 3550
+    estimate J += (|D[i] - D[i-1]| - J) / 16 applied to the hardware intervals D
+    per sequence step.
+    """
+    def __init__(self):
+        self.streams = {}  # (source, antenna, transmitter) -> SequenceState
+        self.gaps = 0  # Lost packets, cumulative
+        self.duplicates = 0
+
+    def update(self, source, antenna_idx, meta):
+        """Account a (packets,) PACKET_META_DTYPE array of one antenna"""
+        if len(meta) == 0:
+            return
+        transmitters = meta['ta'].astype(np.uint64) @ (np.uint64(256) ** np.arange(5, -1, -1, dtype=np.uint64))
+        for transmitter in np.unique(transmitters):
+            rows = meta[transmitters == transmitter]
+            key = (source, antenna_idx, int(transmitter))
+            pkt_sn = rows['pkt_sn'].astype(np.int64)
+            ts = rows['ts'].astype(np.int64)
+            state = self.streams.get(key)
+            if state is None:
+                # The first packet of a stream only starts it
+                state = self.streams[key] = SequenceState(int(pkt_sn[0]), int(ts[0]))
+                pkt_sn, ts = pkt_sn[1:], ts[1:]
+                if len(pkt_sn) == 0:
+                    continue
+            steps = np.diff(pkt_sn, prepend=state.pkt_sn) % SEQUENCE_MODULO
+            forward = (steps > 1) & (steps < MAX_SEQUENCE_GAP)
+            self.gaps += int((steps[forward] - 1).sum())
+            self.duplicates += int((steps == 0).sum())
+
+            # Interval per sequence step, so lost packets do not show up as jitter
+            intervals = (np.diff(ts, prepend=state.ts) % HW_TIMESTAMP_MODULO) / 1000.0
+            intervals[forward] /= steps[forward]
+            previous = intervals[0] if state.interval is None else state.interval
+            variation = np.abs(np.diff(intervals, prepend=previous))
+            state.jitter = float(ema_filter(variation[:, None], np.array([state.jitter]), JITTER_GAIN)[-1, 0])
+            state.pkt_sn = int(pkt_sn[-1])
+            state.ts = int(ts[-1])
+            state.interval = float(intervals[-1])
+
+    @property
+    def jitter(self):
+        """Largest jitter (ms) over the streams"""
+        return max((state.jitter for state in self.streams.values()), default=0.0)
+
+class ClientMetrics:
+    """Stage histograms, counters, queue depth and kernel drops for one reporting interval"""
+    def __init__(self):
+        self.snapshot = None  # Last rolled interval
+        self.kernel_drops = 0  # Cumulative SO_RXQ_OVFL counter, summed over sources
+        self.source_drops = {}  # Cumulative counter per source (socket)
+        self.rcvbuf = 0
+        self.sequence = SequenceTracker()
+        self.handoff_drops = {}  # Cumulative packets dropped by the receiver hand-off per (source, antenna)
+        self.ring_overruns = 0  # Cumulative packets dropped by the worker shared rings
+        self.capture_status = {}  # Newest server capture status per source
+        self.reset()
+
+    def reset(self):
+        self.interval_start = time.time()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.datagrams = 0
+        self.malformed = 0
+        self.packets = 0
+        self.frames = 0
+        self.max_queue_depth = 0
+        self.interval_drops_start = self.kernel_drops
+        self.interval_gaps_start = self.sequence.gaps
+        self.interval_handoff_drops_start = sum(self.handoff_drops.values())
+        self.interval_ring_overruns_start = self.ring_overruns
+
+    def record(self, stage, values):
+        self.histograms[stage].record(values)
+
+    def record_batch(self, batch, received_time=None):
+        """Account a CSIBatch, including the timings collected by drain_socket"""
+        self.datagrams += batch.num_datagrams
+        self.malformed += batch.malformed
+        self.packets += sum(len(block.samples) for block in batch.blocks)
+        self.record(STAGE_RECEIVE, batch.receive_time * 1000)
+        self.record(STAGE_DECODE, batch.decode_time * 1000)
+        if received_time is not None:
+            self.record(STAGE_QUEUE, (received_time - batch.arrival_time) * 1000)
+        if batch.kernel_drops is not None:
+            self.source_drops[batch.source] = batch.kernel_drops
+            self.kernel_drops = sum(self.source_drops.values())
+        # Blocks the hand-off dropped are older than the ones kept on their channel
+        for antenna_idx, meta in batch.dropped_meta:
+            self.record_packet_meta(batch.source, antenna_idx, meta)
+        for block in batch.blocks:
+            self.record_packet_meta(block.source, block.antenna_idx, block.meta)
+        self.record_capture_status(batch.source, batch.capture_status)
+
+    def record_packet_meta(self, source, antenna_idx, meta):
+        """Track sequence gaps and jitter of packets that carry metadata (meta may be None)"""
+        if meta is not None:
+            self.sequence.update(source, antenna_idx, meta)
+
+    def record_capture_status(self, source, status):
+        """Keep the newest capture status a server sent (status may be None)"""
+        if status is not None:
+            self.capture_status[source] = status
+
+    def record_counts(self, datagrams=0, packets=0, kernel_drops=None, malformed=0):
+        """Account traffic that is not seen as CSIBatches, e.g. received by worker processes"""
+        self.datagrams += datagrams
+        self.malformed += malformed
+        self.packets += packets
+        if kernel_drops is not None:
+            self.kernel_drops = kernel_drops
+
+    def record_handoff_drops(self, drops):
+        """Cumulative packets dropped per (source, antenna) channel, see csi_handoff.BatchHandoff"""
+        self.handoff_drops = drops
+
+    def record_ring_overruns(self, overruns):
+        """Cumulative packets dropped by the worker rings, see csi_workers.CSIWorkerPool.overruns"""
+        self.ring_overruns = overruns
+
+    def record_queue_depth(self, depth):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def roll(self):
+        """Close the current interval and return its snapshot"""
+        now = time.time()
+        elapsed = max(now - self.interval_start, 1e-9)
+        self.snapshot = {
+            "time": now,
+            "interval": elapsed,
+            "datagrams_per_s": self.datagrams / elapsed,
+            "packets_per_s": self.packets / elapsed,
+            "malformed_datagrams": self.malformed,
+            "frames_per_s": self.frames / elapsed,
+            "max_queue_depth": self.max_queue_depth,
+            "kernel_drops": self.kernel_drops - self.interval_drops_start,
+            "kernel_drops_total": self.kernel_drops,
+            "rcvbuf": self.rcvbuf,
+            "sequence_gaps": self.sequence.gaps - self.interval_gaps_start,
+            "sequence_gaps_total": self.sequence.gaps,
+            "hw_jitter_ms": self.sequence.jitter,
+            "handoff_drops": sum(self.handoff_drops.values()) - self.interval_handoff_drops_start,
+            "handoff_drops_total": sum(self.handoff_drops.values()),
+            "handoff_drops_per_antenna": {f"{source + ' ' if source else ''}ant {antenna_idx}": count
+                                          for (source, antenna_idx), count in sorted(self.handoff_drops.items())},
+            "ring_overruns": self.ring_overruns - self.interval_ring_overruns_start,
+            "ring_overruns_total": self.ring_overruns,
+            "capture_status": {source or "server": status for source, status in self.capture_status.items()},
+            "stages": {stage: histogram.summary() for stage, histogram in self.histograms.items()},
+        }
+        self.reset()
+        return self.snapshot
+
+def format_snapshot(snapshot):
+    """Multi-line human readable form of a snapshot for the stats panel"""
+    lines = [
+        f"{snapshot['datagrams_per_s']:.0f} datagrams/s | {snapshot['packets_per_s']:.0f} packets/s | "
+        f"{snapshot['frames_per_s']:.1f} frames/s | queue depth max {snapshot['max_queue_depth']} | "
+        f"kernel drops {snapshot['kernel_drops']} ({snapshot['kernel_drops_total']} total) | "
+        f"SO_RCVBUF {snapshot['rcvbuf'] // 1024} KiB"
+    ]
+    if snapshot.get("malformed_datagrams"):
+        lines.append(f"malformed datagrams {snapshot['malformed_datagrams']}")
+    if snapshot.get("hw_jitter_ms") or snapshot.get("sequence_gaps_total"):
+        lines.append(f"sequence gaps {snapshot['sequence_gaps']} ({snapshot['sequence_gaps_total']} total) | "
+                     f"hardware interval jitter {snapshot['hw_jitter_ms']:.3f} ms")
+    if snapshot.get("handoff_drops_total"):
+        per_antenna = ", ".join(f"{channel} {count}" for channel, count in snapshot["handoff_drops_per_antenna"].items())
+        lines.append(f"hand-off drops {snapshot['handoff_drops']} ({snapshot['handoff_drops_total']} total: "
+                     f"{per_antenna})")
+    if snapshot.get("ring_overruns_total"):
+        lines.append(f"ring overruns {snapshot['ring_overruns']} ({snapshot['ring_overruns_total']} total)")
+    for source, status in snapshot.get("capture_status", {}).items():
+        lines.append(format_capture_status(source, status))
+    for stage, summary in snapshot["stages"].items():
+        if summary["count"]:
+            lines.append(f"{stage:<11} n={summary['count']:<6} mean {summary['mean']:8.3f} ms  "
+                         f"p50 {summary['p50']:8.3f}  p95 {summary['p95']:8.3f}  "
+                         f"p99 {summary['p99']:8.3f}  max {summary['max']:8.3f}")
+    return "\n".join(lines)
+
+def format_capture_status(source, status):
+    """One line for a server's capture status (csi_protocol.decode_capture_status)"""
+    target = f" of {status['target_rate']:.0f}" if status["target_rate"] else ""
+    return (f"{source} capture: {status['mode']}, {status['rate']:.0f}{target} packets/s, "
+            f"dump {status['dump_size']} every {status['interval_ms']} ms, cycle {status['cycle_us'] / 1000:.2f} ms, "
+            f"late {status['late_cycles']}, full dumps {status['overruns']} of {status['cycles']}")
+
+class MetricsLogger:
+    """Appends metrics snapshots as JSON lines"""
+    def __init__(self, path):
+        self.file = open(path, 'a', buffering=1)
+
+    def write(self, snapshot):
+        self.file.write(json.dumps(snapshot) + "\n")
+
+    def close(self):
+        self.file.close()
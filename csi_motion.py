@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""Streaming motion detection on processed CSI blocks
+
+Per (source, antenna) channel the detector keeps a slowly adapting reference:
+the mean and variance of the magnitude of every subcarrier, exact over the
+first warmup packets and exponentially weighted afterwards (West's incremental
+form of Welford's algorithm). Each packet is scored by its mean squared
+deviation from the reference mean, normalized by the reference variance, and
+the score is smoothed with a fast exponential average: about 1 for a static
+channel, growing while something moves. The recursions are linear, so a whole
+block of packets is evaluated at once with cumulative sums instead of a Python
+loop; the work stays O(subcarriers) per packet.
+"""
+
+import numpy as np
+
+from csi_processing import BASELINE_APPLIED
+from csi_stats import ema_filter
+
+class ChannelMotionState:
+    """Running per-subcarrier statistics of one (source, antenna) channel"""
+    def __init__(self, subcarriers):
+        self.mean = np.zeros(subcarriers)
+        self.var = np.zeros(subcarriers)
+        self.sum = np.zeros(subcarriers)  # Magnitude sums during warm-up
+        self.sum2 = np.zeros(subcarriers)
+        self.score = 0.0  # Smoothed score of the newest packet
+        self.count = 0  # Packets seen
+
+class MotionScores:
+    """Motion scores of the packets of one processed block"""
+    def __init__(self, source, antenna_idx, timestamps, scores, combined):
+        self.source = source
+        self.antenna_idx = antenna_idx
+        self.timestamps = timestamps  # (packets,) header timestamps (ms)
+        self.scores = scores  # (packets,) smoothed score of this antenna
+        self.combined = combined  # (packets,) mean smoothed score over all antennas
+
+class StreamingMotionDetector:
+    """Per-antenna and combined motion scores at packet rate
+
+    alpha is the weight of a new packet in the reference mean/variance (the
+    reference adapts over roughly 1 / alpha packets, so lasting changes stop
+    scoring after a while), smoothing the weight of a new score in the reported
+    score. The first warmup packets of a channel only train the reference and
+    score 0. threshold is the combined score above which motion is reported.
+    """
+    def __init__(self, alpha=0.001, smoothing=0.1, threshold=3.0, warmup=100):
+        self.alpha = alpha
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self.warmup = warmup
+        self.channels = {}  # (source, antenna) -> ChannelMotionState
+
+    def reset(self):
+        self.channels.clear()
+
+    @property
+    def combined_score(self):
+        if not self.channels:
+            return 0.0
+        return float(np.mean([state.score for state in self.channels.values()]))
+
+    @property
+    def motion(self):
+        return self.combined_score > self.threshold
+
+    def update(self, processed):
+        """Score every packet of a ProcessedBlock and return MotionScores"""
+        # Scores are taken on the raw magnitude, also while a baseline is subtracted
+        if processed.baseline_state == BASELINE_APPLIED:
+            magnitude = np.abs(processed.samples)
+        else:
+            magnitude = processed.magnitude
+        count, subcarriers = magnitude.shape
+        channel = (processed.source, processed.antenna_idx)
+        state = self.channels.get(channel)
+        if state is None or len(state.mean) != subcarriers:
+            # New channel or bandwidth change: train a new reference
+            state = self.channels[channel] = ChannelMotionState(subcarriers)
+
+        raw_scores = np.zeros(count)
+        training = min(max(self.warmup - state.count, 0), count)
+        if training:
+            # Exact mean and variance over the warm-up packets
+            state.sum += magnitude[:training].sum(axis=0)
+            state.sum2 += (magnitude[:training] ** 2).sum(axis=0)
+            trained = state.count + training
+            state.mean = state.sum / trained
+            state.var = np.maximum(state.sum2 / trained - state.mean ** 2, 0.0)
+        if training < count:
+            raw_scores[training:] = self.score_packets(state, magnitude[training:])
+        state.count += count
+
+        scores = ema_filter(raw_scores[:, None], np.array([state.score]), self.smoothing)[:, 0]
+        state.score = float(scores[-1])
+
+        # Other channels contribute their newest score to the combined one
+        others = [other.score for key, other in self.channels.items() if key != channel]
+        combined = (np.sum(others) + scores) / (len(others) + 1)
+        return MotionScores(processed.source, processed.antenna_idx, processed.timestamps, scores, combined)
+
+    def score_packets(self, state, magnitude):
+        """Normalized squared deviation of every packet from the reference, updating the reference"""
+        # Reference mean before each packet: the previous packet's running mean
+        means = ema_filter(magnitude, state.mean, self.alpha)
+        previous_means = np.vstack((state.mean[None], means[:-1]))
+        deviation = magnitude - previous_means
+
+        # West: var[k] = (1 - alpha) * (var[k-1] + alpha * deviation[k]^2)
+        variances = ema_filter((1.0 - self.alpha) * deviation ** 2, state.var, self.alpha)
+        previous_vars = np.vstack((state.var[None], variances[:-1]))
+
+        state.mean = means[-1].copy()
+        state.var = variances[-1].copy()
+        return np.mean(deviation ** 2 / (previous_vars + 1e-9), axis=1)
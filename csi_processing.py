@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""Qt-free CSI processing pipeline working on batches of (packets, subcarriers) arrays"""
+
+import numpy as np
+
+from csi_stats import ChannelStats
+
+# Baseline state of a processed block
+BASELINE_NONE = 0       # Raw magnitude
+BASELINE_APPLIED = 1    # Magnitude minus baseline
+BASELINE_MISMATCH = 2   # Raw magnitude, baseline has a different subcarrier count
+
+# Baselines for the amplitude difference: the running mean frozen by set/snapshot_baselines,
+# the mean over the newest packets, or the EMA mean
+BASELINE_MODES = ('fixed', 'rolling', 'ema')
+
+def remove_dc_offset(samples):
+    """Subtract the per-packet mean from I and Q in place"""
+    if samples.shape[-1] > 0:
+        samples -= samples.mean(axis=-1, keepdims=True)
+    return samples
+
+def interpolate_dc_subcarrier(samples):
+    """Replace the center subcarrier (DC spike) by the average of its neighbors in place"""
+    num_subcarriers = samples.shape[-1]
+    if num_subcarriers > 2:
+        center_idx = num_subcarriers // 2
+        samples[..., center_idx] = (samples[..., center_idx - 1] +
+                                    samples[..., center_idx + 1]) / 2
+    return samples
+
+def sanitize_phase(samples):
+    """Phase unwrapped across subcarriers with the per-packet linear trend removed
+
+    Timing offset (STO) and frequency offsets (CFO/SFO) add a phase offset and a
+    slope across subcarriers that change from packet to packet. The least-squares
+    line of every packet is removed at once: with centered subcarrier indices
+    the slopes of a whole block are one matrix-vector product.
+    """
+    num_subcarriers = samples.shape[-1]
+    if num_subcarriers < 2:
+        # Nothing left once the offset is removed
+        return np.zeros(samples.shape)
+    phase = np.angle(samples)
+
+    # Unwrap: remove the whole turns from every step between neighbors (faster than np.unwrap)
+    turns = np.cumsum(np.round(np.diff(phase, axis=-1) / (2 * np.pi)), axis=-1)
+    phase[..., 1:] -= 2 * np.pi * turns
+
+    index = np.arange(num_subcarriers) - (num_subcarriers - 1) / 2
+    slope = phase @ index / (index @ index)
+    phase -= phase.mean(axis=-1, keepdims=True)
+    phase -= slope[..., None] * index
+    return phase
+
+def magnitude_spectrum_db(samples):
+    """Magnitude (dB) of the FFT across subcarriers"""
+    magnitude_spectrum = np.abs(np.fft.fft(samples, axis=-1))
+    return 20 * np.log10(magnitude_spectrum + 1e-10)  # Add small value to avoid log(0)
+
+class ProcessedBlock:
+    """Processed CSI packets of one antenna"""
+    def __init__(self, antenna_idx, timestamps, samples, magnitude, baseline_state, source=None,
+                 sanitized_phase=None, meta=None):
+        self.antenna_idx = antenna_idx
+        self.source = source  # Server the packets came from, see CSIData.source
+        self.timestamps = timestamps  # (packets,) header timestamps (ms)
+        self.samples = samples  # (packets, subcarriers) processed complex samples
+        self.magnitude = magnitude  # (packets, subcarriers) magnitude, baseline removed if applied
+        self.baseline_state = baseline_state
+        self.sanitized_phase = sanitized_phase  # (packets, subcarriers) sanitized phase, or None
+        self.meta = meta  # (packets,) PACKET_META_DTYPE driver fields, see CSIData.meta
+
+    def phase(self):
+        if self.sanitized_phase is not None:
+            return self.sanitized_phase
+        return np.angle(self.samples)
+
+class CSIPipeline:
+    """DC cleanup, magnitude, phase sanitization and baseline difference applied to whole blocks of packets"""
+    def __init__(self, remove_dc_subcarrier=True, remove_dc_offset=False, amplitude_diff=False,
+                 sanitize_phase=False, baseline_mode='fixed', baseline_window=100, baseline_alpha=0.01):
+        self.remove_dc_subcarrier = remove_dc_subcarrier  # Remove center subcarrier spike
+        self.remove_dc_offset = remove_dc_offset          # Remove DC offset from I/Q data
+        self.amplitude_diff = amplitude_diff              # Subtract baseline magnitude
+        self.sanitize_phase = sanitize_phase              # Unwrap phase and remove its linear trend
+        self.baseline_mode = baseline_mode                # One of BASELINE_MODES
+        self.baseline_window = baseline_window            # Packets in the rolling baseline
+        self.baseline_alpha = baseline_alpha              # Weight of a new packet in the EMA baseline
+        self.baselines = {}  # (source, antenna) -> fixed baseline magnitude
+        self.stats = {}  # (source, antenna) -> ChannelStats of the raw magnitude, kept while amplitude_diff is on
+
+    def set_baseline(self, antenna_idx, magnitude, source=None):
+        """Use magnitude (subcarriers,) as the fixed baseline for the difference calculation"""
+        self.baselines[(source, antenna_idx)] = np.array(magnitude, dtype=float)
+
+    def clear_baselines(self):
+        self.baselines.clear()
+
+    def snapshot_baselines(self):
+        """Freeze the running mean of every antenna as its fixed baseline; returns the number of antennas"""
+        self.clear_baselines()
+        for (source, antenna_idx), stats in self.stats.items():
+            if stats.count:
+                self.set_baseline(antenna_idx, stats.mean, source)
+        return len(self.baselines)
+
+    def baseline(self, key, stats):
+        """Baseline of a channel for the current mode, None if there is none yet"""
+        if self.baseline_mode == 'fixed':
+            return self.baselines.get(key)
+        if stats.count == 0:
+            return None
+        return stats.rolling_mean if self.baseline_mode == 'rolling' else stats.mean
+
+    def process_samples(self, samples):
+        """Process CSI samples (packets along the first axis, subcarriers along the last) to remove DC components and artifacts"""
+        processed_samples = np.array(samples, dtype=complex)
+
+        if self.remove_dc_offset:
+            remove_dc_offset(processed_samples)
+
+        if self.remove_dc_subcarrier:
+            interpolate_dc_subcarrier(processed_samples)
+
+        return processed_samples
+
+    def process_block(self, csi_data):
+        """Process one CSIData block into a ProcessedBlock"""
+        processed_samples = self.process_samples(csi_data.samples)
+        magnitude = np.abs(processed_samples)
+        baseline_state = BASELINE_NONE
+
+        baseline = None
+        if self.amplitude_diff:
+            key = (csi_data.source, csi_data.antenna_idx)
+            stats = self.stats.get(key)
+            if stats is None or stats.subcarriers != magnitude.shape[-1] or stats.window != self.baseline_window:
+                stats = self.stats[key] = ChannelStats(magnitude.shape[-1], self.baseline_alpha, self.baseline_window)
+            stats.alpha = self.baseline_alpha
+            # Baseline from the packets before this block, then take the block in
+            baseline = self.baseline(key, stats)
+            stats.update(magnitude)
+        if baseline is not None:
+            if len(baseline) == magnitude.shape[-1]:
+                magnitude -= baseline
+                baseline_state = BASELINE_APPLIED
+            else:
+                baseline_state = BASELINE_MISMATCH
+
+        phase = sanitize_phase(processed_samples) if self.sanitize_phase else None
+
+        return ProcessedBlock(csi_data.antenna_idx, csi_data.timestamps,
+                              processed_samples, magnitude, baseline_state, csi_data.source, phase,
+                              csi_data.meta)
+
+    def process_batch(self, batch):
+        """Process every block of a CSIBatch"""
+        return [self.process_block(csi_data) for csi_data in batch.blocks if csi_data.samples.size]
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+
+"""CSIdump UDP protocol: wire format, datagram decoding and a Qt-free client socket"""
+
+import sys
+import time
+import select
+import socket
+import struct
+import ipaddress
+import numpy as np
+
+# Struct format for CsiPacketHeader
+# uint64_t timestamp, uint32_t antenna_idx, uint32_t packet_count, uint32_t total_samples
+HEADER_FORMAT = '<QIII'  # Little endian: Q=uint64, I=uint32
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER_STRUCT = struct.Struct(HEADER_FORMAT)
+
+# Struct format for CsiSample (I/Q pair)
+# double i, double q
+SAMPLE_FORMAT = '<dd'  # Little endian: d=double, d=double
+SAMPLE_SIZE = struct.calcsize(SAMPLE_FORMAT)
+
+# Interleaved little endian I/Q doubles have the same memory layout as complex128,
+# so the payload can be viewed directly as a complex array
+SAMPLE_DTYPE = np.dtype('<c16')
+
+# Header versions: version 1 is CsiPacketHeader with CsiSample doubles, sent to
+# clients registering with a plain "register". Version 2 (CsiPacketHeaderV2)
+# is sent to clients that requested any registration option and appends
+# uint8_t version, uint8_t sample_format, uint16_t flags
+HEADER_VERSION_1 = 1
+HEADER_VERSION_2 = 2
+HEADER_V2_FORMAT = '<QIIIBBH'
+HEADER_V2_SIZE = struct.calcsize(HEADER_V2_FORMAT)
+HEADER_V2_STRUCT = struct.Struct(HEADER_V2_FORMAT)
+
+# CsiSampleFormat values and the dtype of one I or Q component
+SAMPLE_FORMAT_FLOAT64 = 0
+SAMPLE_FORMAT_FLOAT32 = 1
+SAMPLE_FORMAT_INT16 = 2
+SAMPLE_COMPONENT_DTYPES = {
+    SAMPLE_FORMAT_FLOAT64: np.dtype('<f8'),
+    SAMPLE_FORMAT_FLOAT32: np.dtype('<f4'),
+    SAMPLE_FORMAT_INT16: np.dtype('<i2'),
+}
+
+# Encoding names accepted in the register message
+ENCODINGS = {
+    'float64': SAMPLE_FORMAT_FLOAT64,
+    'float32': SAMPLE_FORMAT_FLOAT32,
+    'int16': SAMPLE_FORMAT_INT16,
+}
+
+# Version 2 header flags. With FLAG_ANTENNA_TABLE a uint16_t antenna index per
+# packet follows the header and antenna_idx is ANTENNA_MIXED
+FLAG_ANTENNA_TABLE = 0x0001
+ANTENNA_MIXED = 0xFFFFFFFF
+ANTENNA_TABLE_DTYPE = np.dtype('<u2')
+
+# Antenna indices a register message can select ("register antennas=0,2"), a bit each in UdpClient::antennaMask
+MAX_REGISTER_ANTENNAS = 32
+
+# With FLAG_PACKET_META a CsiPacketMeta per packet follows the header (after the
+# antenna table, if any): the driver's hardware timestamp (us, wraps at 2^32),
+# 802.11 sequence number, TX/RX chain, RSSI, SNR, channel bandwidth and transmitter address
+FLAG_PACKET_META = 0x0002
+PACKET_META_DTYPE = np.dtype([('ts', '<u4'), ('pkt_sn', '<u2'), ('tx_idx', '<u2'), ('rx_idx', '<u2'),
+                              ('rssi', 'i1'), ('snr', 'u1'), ('ch_bw', 'u1'), ('reserved', 'u1'),
+                              ('ta', 'u1', (6,))])
+
+# Channel bandwidth (MHz) per CsiPacketMeta ch_bw value
+CHANNEL_BANDWIDTHS = {0: 20, 1: 40, 2: 80, 3: 160}
+
+# With FLAG_CAPTURE_STATUS the datagram carries no packets but the server's capture
+# scheduler counters (CsiCaptureStatus), sent every second to clients that registered
+# with "status=1": mode, dump period, packets requested per dump, cycles, cycles that
+# missed their deadline, dumps that came back full, mean cycle time, achieved and requested rate
+FLAG_CAPTURE_STATUS = 0x0004
+CAPTURE_STATUS_DTYPE = np.dtype([('mode', 'u1'), ('reserved', 'u1', (3,)), ('interval_ms', '<u4'),
+                                 ('dump_size', '<u4'), ('cycles', '<u4'), ('late_cycles', '<u4'),
+                                 ('overruns', '<u4'), ('cycle_us', '<u4'), ('rate', '<f4'), ('target_rate', '<f4')])
+FLAGS_STRUCT = struct.Struct('<H')  # Flags, the last field of the version 2 header
+
+# CaptureMode names
+CAPTURE_MODES = {0: 'latency', 1: 'throughput', 2: 'rate'}
+
+# Datagram size limits for aggregation ("register aggregate=<bytes>"): the
+# largest UDP payload, and the one that fits an Ethernet MTU without IP fragmentation
+MAX_DATAGRAM_SIZE = 65507
+ETHERNET_DATAGRAM_SIZE = 1472
+
+# Largest possible UDP payload
+RECV_BUFFER_SIZE = 65536
+
+# Upper bound of datagrams drained from the socket per wake-up, so consumers
+# still get regular updates when the socket never runs dry
+MAX_BATCH_DATAGRAMS = 1024
+
+# Linux socket options missing from the socket module: cumulative kernel drop
+# counter delivered as ancillary data, and SO_RCVBUF beyond rmem_max
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+DROPS_STRUCT = struct.Struct('=I')
+
+class CSIData:
+    """CSI packets of one antenna received in the same batch, stacked row-wise"""
+    def __init__(self):
+        self.antenna_idx = 0
+        self.timestamps = np.empty(0, dtype=np.uint64)  # Header timestamp (ms) per packet
+        self.samples = np.empty((0, 0), dtype=complex)  # (packets, subcarriers) complex CSI samples (I+jQ)
+        self.meta = None  # (packets,) PACKET_META_DTYPE driver fields, if requested at registration
+        self.addr = None
+        self.source = None  # "ip:port" of the server that was registered with, None for captures
+
+class CSIBatch:
+    """All datagrams drained from the socket in one wake-up, grouped per antenna"""
+    def __init__(self):
+        self.blocks = []  # CSIData per (antenna, sample count), in arrival order
+        self.source = None  # See CSIData.source
+        self.num_datagrams = 0
+        self.malformed = 0  # Datagrams skipped because their packets could not be decoded
+        self.arrival_time = time.time()  # When the batch was drained
+        self.receive_time = 0.0  # Seconds spent in recv syscalls
+        self.decode_time = 0.0  # Seconds spent decoding and stacking
+        self.kernel_drops = None  # Cumulative socket drop counter, if tracked
+        self.capture_status = None  # Newest server capture status (decode_capture_status), if any arrived
+        self.dropped_meta = []  # (antenna_idx, packet meta) of blocks a BatchHandoff dropped, oldest first
+
+def header_size(header_version):
+    return HEADER_V2_SIZE if header_version == HEADER_VERSION_2 else HEADER_SIZE
+
+def registration_message(encoding='float64', aggregate=None, mix_antennas=False, packet_meta=False,
+                         capture_status=False, antennas=None):
+    """Register message requesting the given sample encoding and packet aggregation
+
+    aggregate asks the server to pack several packets into datagrams of at most
+    that many bytes, mix_antennas lets packets of different antennas share one,
+    packet_meta asks for the driver fields of every packet (PACKET_META_DTYPE),
+    capture_status for the server's capture scheduler counters every second,
+    antennas (antenna indices) for the packets of these antennas only.
+    Without options a plain "register" is sent, which every CSIdump version
+    understands and which keeps the version 1 header.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding {encoding}, expected one of {', '.join(ENCODINGS)}")
+    options = []
+    if encoding != 'float64':
+        options.append(f'encoding={encoding}')
+    if aggregate:
+        if not 0 < aggregate <= MAX_DATAGRAM_SIZE:
+            raise ValueError(f"Aggregate size must be between 1 and {MAX_DATAGRAM_SIZE} bytes")
+        options.append(f'aggregate={aggregate}')
+    if mix_antennas:
+        options.append('mix_antennas=1')
+    if packet_meta:
+        options.append('meta=1')
+    if capture_status:
+        options.append('status=1')
+    if antennas is not None:
+        antennas = sorted(set(antennas))
+        if not antennas or not all(0 <= idx < MAX_REGISTER_ANTENNAS for idx in antennas):
+            raise ValueError(f"Antennas must be between 0 and {MAX_REGISTER_ANTENNAS - 1}")
+        options.append('antennas=' + ','.join(str(idx) for idx in antennas))
+    if not options:
+        return b'register', HEADER_VERSION_1
+    return ' '.join(['register'] + options).encode(), HEADER_VERSION_2
+
+def is_multicast(host):
+    """True if host is an IPv4 multicast group address"""
+    try:
+        return ipaddress.IPv4Address(host).is_multicast
+    except ValueError:
+        return False
+
+def split_packets(samples, packet_count):
+    """Reshape the samples of a datagram into (packets, subcarriers)
+
+    All packets of a datagram have the same length, total_samples / packet_count.
+    A packet_count that does not divide the payload is treated as one packet.
+    Raises ValueError for more packets than samples, e.g. a header-only
+    datagram claiming several packets.
+    """
+    if packet_count > len(samples) and (packet_count > 1 or len(samples)):
+        raise ValueError(f"{packet_count} packets do not fit in {len(samples)} samples")
+    if packet_count > 1 and len(samples) % packet_count == 0:
+        return samples.reshape(packet_count, -1)
+    return samples.reshape(1, -1)
+
+def decode_csi_datagram(buffer, nbytes, header_version=HEADER_VERSION_1):
+    """Decode a datagram held in buffer[:nbytes] into header fields and a complex sample array
+
+    Returns (timestamp, antenna_idx, packet_count, samples, meta) with samples
+    shaped (packets, subcarriers). For datagrams mixing antennas antenna_idx is
+    an array holding the antenna of every packet. meta is a (packets,)
+    PACKET_META_DTYPE array if the datagram carries packet metadata, else None.
+
+    The samples are viewed in place with np.frombuffer and converted/copied out
+    in a single block, so the receive buffer can be reused for the next datagram.
+    Every sample format decodes to the same complex128 array. Raises
+    ValueError for an unknown sample format or a packet_count whose antenna
+    table, metadata or samples do not fit in the datagram.
+    """
+    if header_version != HEADER_VERSION_2:
+        timestamp, antenna_idx, packet_count, total_samples = HEADER_STRUCT.unpack_from(buffer, 0)
+        num_samples = (nbytes - HEADER_SIZE) // SAMPLE_SIZE
+        samples = np.frombuffer(buffer, dtype=SAMPLE_DTYPE, count=num_samples, offset=HEADER_SIZE)
+        return timestamp, antenna_idx, packet_count, split_packets(samples.astype(complex), packet_count), None
+
+    (timestamp, antenna_idx, packet_count, total_samples,
+     version, sample_format, flags) = HEADER_V2_STRUCT.unpack_from(buffer, 0)
+    component = SAMPLE_COMPONENT_DTYPES.get(sample_format)
+    if component is None:
+        raise ValueError(f"Unknown sample format {sample_format}")
+    offset = HEADER_V2_SIZE
+    table_size = packet_count * ANTENNA_TABLE_DTYPE.itemsize if flags & FLAG_ANTENNA_TABLE else 0
+    meta_size = packet_count * PACKET_META_DTYPE.itemsize if flags & FLAG_PACKET_META else 0
+    if offset + table_size + meta_size > nbytes:
+        raise ValueError(f"{packet_count} packets do not fit in a {nbytes} byte datagram")
+    if flags & FLAG_ANTENNA_TABLE:
+        antenna_idx = np.frombuffer(buffer, dtype=ANTENNA_TABLE_DTYPE, count=packet_count, offset=offset)
+        antenna_idx = antenna_idx.astype(np.uint32)
+        offset += packet_count * ANTENNA_TABLE_DTYPE.itemsize
+    meta = None
+    if flags & FLAG_PACKET_META:
+        meta = np.frombuffer(buffer, dtype=PACKET_META_DTYPE, count=packet_count, offset=offset).copy()
+        offset += packet_count * PACKET_META_DTYPE.itemsize
+    num_samples = (nbytes - offset) // (2 * component.itemsize)
+    iq = np.frombuffer(buffer, dtype=component, count=2 * num_samples, offset=offset)
+    # Interleaved I/Q converted to doubles is laid out like complex128
+    samples = split_packets(iq.astype(np.float64).view(complex), packet_count)
+    return timestamp, antenna_idx, packet_count, samples, meta
+
+def is_capture_status(buffer, nbytes, header_version):
+    return (header_version == HEADER_VERSION_2 and nbytes >= HEADER_V2_SIZE
+            and FLAGS_STRUCT.unpack_from(buffer, HEADER_V2_SIZE - FLAGS_STRUCT.size)[0] & FLAG_CAPTURE_STATUS)
+
+def decode_capture_status(buffer, nbytes):
+    """Capture status datagram in buffer[:nbytes] as a dict, None if it is too short
+
+    Holds the CAPTURE_STATUS_DTYPE fields, mode as its CAPTURE_MODES name and
+    the server's timestamp (ms).
+    """
+    if nbytes < HEADER_V2_SIZE + CAPTURE_STATUS_DTYPE.itemsize:
+        return None
+    record = np.frombuffer(buffer, dtype=CAPTURE_STATUS_DTYPE, count=1, offset=HEADER_V2_SIZE)[0]
+    status = {name: record[name].item() for name in CAPTURE_STATUS_DTYPE.names if name != 'reserved'}
+    status['mode'] = CAPTURE_MODES.get(status['mode'], str(status['mode']))
+    status['timestamp'] = HEADER_STRUCT.unpack_from(buffer, 0)[0]
+    return status
+
+class CSIBatchBuilder:
+    """Collects decoded datagrams and stacks them per antenna into a CSIBatch
+
+    With antenna_group=(index, count) only antennas with antenna_idx % count == index
+    are kept; datagrams of other antennas are skipped before decoding.
+    """
+    def __init__(self, header_version=HEADER_VERSION_1, source=None, antenna_group=None):
+        self.header_version = header_version
+        self.source = source
+        self.antenna_group = antenna_group
+        self.header_size = header_size(header_version)
+        self.groups = {}
+        self.num_datagrams = 0
+        self.malformed = 0
+        self.capture_status = None
+
+    def add_datagram(self, buffer, nbytes, addr=None):
+        """Decode the datagram in buffer[:nbytes]; short and malformed datagrams are counted but ignored"""
+        self.num_datagrams += 1
+        if nbytes < self.header_size:
+            return
+        if is_capture_status(buffer, nbytes, self.header_version):
+            self.capture_status = decode_capture_status(buffer, nbytes) or self.capture_status
+            return
+        if self.antenna_group is not None:
+            antenna_idx = HEADER_STRUCT.unpack_from(buffer, 0)[1]
+            if antenna_idx != ANTENNA_MIXED and not self.in_group(antenna_idx):
+                return
+        try:
+            timestamp, antenna_idx, packet_count, samples, meta = decode_csi_datagram(buffer, nbytes,
+                                                                                      self.header_version)
+        except ValueError:
+            # A bad datagram must not take the rest of the batch with it
+            self.malformed += 1
+            return
+        if meta is not None and len(meta) != len(samples):
+            # packet_count did not divide the payload, the packets cannot be matched
+            meta = None
+        if isinstance(antenna_idx, np.ndarray):
+            if len(antenna_idx) != len(samples):
+                # packet_count did not divide the payload, the packets have no antenna
+                self.malformed += 1
+                return
+            for idx in np.unique(antenna_idx):
+                selected = antenna_idx == idx
+                self.add_packets(timestamp, int(idx), samples[selected], addr,
+                                 meta[selected] if meta is not None else None)
+        else:
+            self.add_packets(timestamp, antenna_idx, samples, addr, meta)
+
+    def in_group(self, antenna_idx):
+        index, count = self.antenna_group
+        return antenna_idx % count == index
+
+    def add_packets(self, timestamp, antenna_idx, samples, addr, meta=None):
+        if self.antenna_group is not None and not self.in_group(antenna_idx):
+            return
+        # Packets can only be stacked with others of the same length (bandwidth)
+        key = (antenna_idx, samples.shape[1])
+        if key not in self.groups:
+            self.groups[key] = ([], [], [], addr)
+        timestamps, blocks, metas, _ = self.groups[key]
+        timestamps.extend([timestamp] * len(samples))
+        blocks.append(samples)
+        metas.append(meta)
+
+    def build(self):
+        """Stack the collected packets into a CSIBatch and reset the builder"""
+        batch = CSIBatch()
+        batch.num_datagrams = self.num_datagrams
+        batch.malformed = self.malformed
+        batch.source = self.source
+        batch.capture_status = self.capture_status
+        for (antenna_idx, _), (timestamps, blocks, metas, addr) in self.groups.items():
+            csi_data = CSIData()
+            csi_data.antenna_idx = antenna_idx
+            csi_data.timestamps = np.array(timestamps, dtype=np.uint64)
+            csi_data.samples = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+            if all(meta is not None for meta in metas):
+                csi_data.meta = np.concatenate(metas) if len(metas) > 1 else metas[0]
+            csi_data.addr = addr
+            csi_data.source = self.source
+            batch.blocks.append(csi_data)
+        self.groups = {}
+        self.num_datagrams = 0
+        self.malformed = 0
+        self.capture_status = None
+        return batch
+
+def drain_socket(sock, buffer, max_datagrams=MAX_BATCH_DATAGRAMS, recorder=None, track_drops=False,
+                 header_version=HEADER_VERSION_1, source=None, antenna_group=None):
+    """Read every datagram pending on a non-blocking socket and stack them into a CSIBatch
+
+    If a recorder (csi_capture.CaptureWriter) is given, every raw datagram is
+    appended to it before decoding. With track_drops the socket must have
+    SO_RXQ_OVFL enabled; the kernel drop counter is then read from the
+    ancillary data. The batch and its blocks are tagged with source, and
+    antenna_group selects antennas like in CSIBatchBuilder.
+    """
+    builder = CSIBatchBuilder(header_version, source, antenna_group)
+    receive_time = 0.0
+    decode_time = 0.0
+    kernel_drops = None
+    start = time.perf_counter()
+    while builder.num_datagrams < max_datagrams:
+        try:
+            if track_drops:
+                nbytes, ancdata, _, addr = sock.recvmsg_into([buffer], socket.CMSG_SPACE(DROPS_STRUCT.size))
+                for level, kind, data in ancdata:
+                    if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                        kernel_drops = DROPS_STRUCT.unpack(data)[0]
+            else:
+                nbytes, addr = sock.recvfrom_into(buffer)
+        except (BlockingIOError, ConnectionRefusedError):
+            # ConnectionRefusedError reports an ICMP error for an earlier send, not data
+            break
+        if recorder is not None:
+            recorder.write(buffer, nbytes)
+        received = time.perf_counter()
+        receive_time += received - start
+        builder.add_datagram(buffer, nbytes, addr)
+        start = time.perf_counter()
+        decode_time += start - received
+    receive_time += time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = builder.build()
+    batch.decode_time = decode_time + time.perf_counter() - start
+    batch.receive_time = receive_time
+    batch.kernel_drops = kernel_drops
+    return batch
+
+class CSIUdpClient:
+    """Non-blocking UDP socket registered with a CSIdump server
+
+    rcvbuf sets the kernel receive buffer size in bytes (SO_RCVBUFFORCE if
+    permitted, otherwise SO_RCVBUF capped by net.core.rmem_max). On Linux the
+    kernel drop counter is tracked through SO_RXQ_OVFL. encoding, aggregate,
+    mix_antennas, packet_meta, capture_status and antennas are requested at
+    registration, see registration_message.
+
+    If server_ip is a multicast group, the socket binds the group's port and
+    joins the group on multicast_interface (an interface address, default any)
+    instead of registering. The options then have to match the ones the server
+    sends the group with.
+    """
+    def __init__(self, server_ip, server_port, rcvbuf=None, encoding='float64', aggregate=None,
+                 mix_antennas=False, packet_meta=False, multicast_interface=None, capture_status=False,
+                 antennas=None):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.name = f"{server_ip}:{server_port}"
+        self.register_message, self.header_version = registration_message(encoding, aggregate, mix_antennas,
+                                                                           packet_meta, capture_status, antennas)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.multicast = is_multicast(server_ip)
+        if self.multicast:
+            self.join_group(multicast_interface)
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self.recorder = None  # Optional csi_capture.CaptureWriter for raw datagrams
+        self.antenna_group = None  # Optional (index, count) antenna selection, see CSIBatchBuilder
+        if rcvbuf:
+            self.set_rcvbuf(rcvbuf)
+        self.rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.track_drops = False
+        if sys.platform.startswith('linux'):
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self.track_drops = True
+            except OSError:
+                pass
+
+    def set_rcvbuf(self, size):
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, size)
+        except OSError:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+
+    def join_group(self, interface=None):
+        # Several receivers on one host can bind the group's port
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Binding the group address (not INADDR_ANY) keeps other groups on the same port out
+        self.socket.bind((self.server_ip, self.server_port))
+        membership = socket.inet_aton(self.server_ip) + socket.inet_aton(interface or '0.0.0.0')
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+    def register(self):
+        """Ask the server to start sending CSI data to this socket (no-op for a multicast group)"""
+        if self.multicast:
+            return
+        self.socket.sendto(self.register_message, (self.server_ip, self.server_port))
+
+    def receive_batch(self, timeout=1.0):
+        """Wait up to timeout seconds for data, then drain everything pending
+
+        Returns a CSIBatch, or None if nothing arrived in time.
+        """
+        readable, _, _ = select.select([self.socket], [], [], timeout)
+        if not readable:
+            return None
+        return self.drain()
+
+    def drain(self):
+        """Read everything pending on the socket without waiting, as a CSIBatch tagged with self.name"""
+        return drain_socket(self.socket, self.buffer, recorder=self.recorder, track_drops=self.track_drops,
+                            header_version=self.header_version, source=self.name,
+                            antenna_group=self.antenna_group)
+
+    def close(self):
+        self.socket.close()
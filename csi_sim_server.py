@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+
+"""Synthetic stand-in for CSIdump for load tests without an mt76 radio
+
+Speaks the same protocol as MotionDetector::udpServerListen/sendCsiDataUdp:
+clients register by sending "register", then receive one datagram per CSI
+packet and antenna made of a CsiPacketHeader ('<QIII') followed by CsiSample
+I/Q pairs ('<dd'). Registration options ("register encoding=int16
+aggregate=1472 mix_antennas=1 meta=1 antennas=0,2") switch the client to
+CsiPacketHeaderV2 with the requested sample encoding, packet aggregation,
+packet metadata and antennas, and "status=1" adds a CsiCaptureStatus datagram every second describing the
+simulator's own pacing (rate mode, one dump per cycle).
+Like CSIdump's optional multicast group, --multicast sends every datagram once
+to a group that any number of clients can join.
+"""
+
+import sys
+import time
+import socket
+import select
+import argparse
+import numpy as np
+
+from csi_protocol import (HEADER_STRUCT, HEADER_V2_STRUCT, HEADER_VERSION_1, HEADER_VERSION_2,
+                          SAMPLE_DTYPE, SAMPLE_FORMAT_FLOAT64, SAMPLE_COMPONENT_DTYPES, ENCODINGS,
+                          FLAG_ANTENNA_TABLE, ANTENNA_MIXED, ANTENNA_TABLE_DTYPE, MAX_DATAGRAM_SIZE,
+                          FLAG_PACKET_META, PACKET_META_DTYPE, CHANNEL_BANDWIDTHS, FLAG_CAPTURE_STATUS,
+                          CAPTURE_STATUS_DTYPE, CAPTURE_MODES, MAX_REGISTER_ANTENNAS, header_size)
+
+# Subcarriers reported by the driver per channel bandwidth (MHz)
+BANDWIDTH_SUBCARRIERS = {20: 64, 40: 128, 80: 256, 160: 512}
+
+def samples_per_packet(subcarriers):
+    """Samples sent per packet; ParserMT76 skips the first two and the last subcarrier"""
+    start_idx = 2 if subcarriers >= 64 else 1
+    return subcarriers - 1 - start_idx
+
+def channel_bandwidth_code(subcarriers):
+    """csi_data.ch_bw value of a channel with this many subcarriers (20 MHz if unknown)"""
+    for ch_bw, bandwidth in CHANNEL_BANDWIDTHS.items():
+        if BANDWIDTH_SUBCARRIERS.get(bandwidth) == subcarriers:
+            return ch_bw
+    return 0
+
+# Leading fields of the parse_register_message options that select the datagram format
+FORMAT_FIELDS = 6
+
+def parse_register_message(message):
+    """(header version, sample format, aggregate bytes, mix antennas, packet metadata, antennas,
+    capture status) requested by a register message, None if it is not one
+
+    antennas is a sorted tuple of antenna indices, None for every antenna.
+
+    Mirrors MotionDetector::parseRegisterMessage.
+    """
+    tokens = message.decode(errors='replace').split()
+    if not tokens or tokens[0] != 'register':
+        return None
+    header_version, sample_format, aggregate, mix_antennas = HEADER_VERSION_1, SAMPLE_FORMAT_FLOAT64, 0, False
+    packet_meta = capture_status = False
+    antennas = None
+    for token in tokens[1:]:
+        key, _, value = token.partition('=')
+        if key == 'encoding':
+            if value not in ENCODINGS:
+                return None
+            sample_format = ENCODINGS[value]
+        elif key == 'aggregate':
+            try:
+                aggregate = int(value)
+            except ValueError:
+                return None
+            if aggregate <= 0:
+                return None
+            aggregate = min(aggregate, MAX_DATAGRAM_SIZE)
+        elif key == 'mix_antennas':
+            mix_antennas = value == '1'
+        elif key == 'meta':
+            packet_meta = value == '1'
+        elif key == 'status':
+            capture_status = value == '1'
+        elif key == 'antennas':
+            try:
+                antennas = tuple(sorted({int(idx) for idx in value.split(',')}))
+            except ValueError:
+                return None
+            if not all(0 <= idx < MAX_REGISTER_ANTENNAS for idx in antennas):
+                return None
+        else:
+            continue
+        header_version = HEADER_VERSION_2
+    return header_version, sample_format, aggregate, mix_antennas, packet_meta, antennas, capture_status
+
+def datagram_size(options, packet_count, samples_per_packet):
+    header_version, sample_format, _, mix_antennas, packet_meta, _ = options[:FORMAT_FIELDS]
+    table_size = packet_count * ANTENNA_TABLE_DTYPE.itemsize if mix_antennas else 0
+    meta_size = packet_count * PACKET_META_DTYPE.itemsize if packet_meta else 0
+    sample_size = 2 * SAMPLE_COMPONENT_DTYPES[sample_format].itemsize
+    return header_size(header_version) + table_size + meta_size + packet_count * samples_per_packet * sample_size
+
+def encode_datagram(timestamp, antenna_indices, packets, options, meta):
+    """Serialize packets of equal length into one datagram like CsiUdpSender::serializeCsiPackets"""
+    header_version, sample_format, _, mix_antennas, packet_meta, _ = options[:FORMAT_FIELDS]
+    total_samples = sum(len(packet) for packet in packets)
+    if header_version == HEADER_VERSION_1:
+        header = HEADER_STRUCT.pack(timestamp, antenna_indices[0], len(packets), total_samples)
+        return header + b''.join(packet.astype(SAMPLE_DTYPE).tobytes() for packet in packets)
+    antenna_idx = ANTENNA_MIXED if mix_antennas else antenna_indices[0]
+    flags = (FLAG_ANTENNA_TABLE if mix_antennas else 0) | (FLAG_PACKET_META if packet_meta else 0)
+    parts = [HEADER_V2_STRUCT.pack(timestamp, antenna_idx, len(packets), total_samples,
+                                   HEADER_VERSION_2, sample_format, flags)]
+    if mix_antennas:
+        parts.append(np.array(antenna_indices, dtype=ANTENNA_TABLE_DTYPE).tobytes())
+    if packet_meta:
+        parts.append(meta.tobytes())
+    component = SAMPLE_COMPONENT_DTYPES[sample_format]
+    parts.extend(packet.view(np.float64).astype(component).tobytes() for packet in packets)
+    return b''.join(parts)
+
+def pack_datagrams(timestamp, antenna_indices, packets, options, meta=None):
+    """Greedily pack consecutive packets into datagrams like CsiUdpSender::buildDatagrams
+
+    meta holds the PACKET_META_DTYPE fields of every packet, sent if the client asked for them.
+    Only packets of the antennas the client asked for are packed.
+    """
+    aggregate, mix_antennas, antennas = options[2], options[3], options[5]
+    if antennas is not None:
+        selected = [p for p, antenna_idx in enumerate(antenna_indices) if antenna_idx in antennas]
+        antenna_indices = [antenna_indices[p] for p in selected]
+        packets = [packets[p] for p in selected]
+        meta = meta[selected] if meta is not None else None
+    datagrams = []
+    start = 0
+    while start < len(packets):
+        samples = len(packets[start])
+        end = start + 1
+        if aggregate:
+            while (end < len(packets) and len(packets[end]) == samples
+                   and (mix_antennas or antenna_indices[end] == antenna_indices[start])
+                   and datagram_size(options, end - start + 1, samples) <= aggregate):
+                end += 1
+        datagrams.append(encode_datagram(timestamp, antenna_indices[start:end], packets[start:end], options,
+                                         meta[start:end] if meta is not None else None))
+        start = end
+    return datagrams
+
+def encode_capture_status(timestamp, status):
+    """Capture status datagram like CsiUdpSender::sendStatus from a dict of CAPTURE_STATUS_DTYPE fields"""
+    record = np.zeros(1, dtype=CAPTURE_STATUS_DTYPE)
+    for name, value in status.items():
+        record[name] = value
+    header = HEADER_V2_STRUCT.pack(timestamp, ANTENNA_MIXED, 0, 0, HEADER_VERSION_2, 0, FLAG_CAPTURE_STATUS)
+    return header + record.tobytes()
+
+class SyntheticChannel:
+    """Static multipath response per antenna plus a slowly moving reflector and receiver noise"""
+    def __init__(self, num_antennas, num_samples, seed=0):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        self.num_samples = num_samples
+        subcarrier = np.arange(num_samples)
+        # A few static paths with random delay and gain per antenna
+        delays = rng.uniform(0, 0.05, size=(num_antennas, 4, 1))
+        gains = rng.normal(size=(num_antennas, 4, 1)) + 1j * rng.normal(size=(num_antennas, 4, 1))
+        self.static = 400 * (gains * np.exp(-2j * np.pi * delays * subcarrier)).sum(axis=1)
+        self.reflector_delay = rng.uniform(0, 0.05, size=(num_antennas, 1))
+        self.subcarrier = subcarrier
+        self.packet_idx = np.zeros(num_antennas, dtype=np.int64)
+
+    def packets(self, antenna_idx, count):
+        """Next count packets of one antenna as a (count, samples) complex array"""
+        t = self.packet_idx[antenna_idx] + np.arange(count)[:, None]
+        self.packet_idx[antenna_idx] += count
+        doppler_phase = 2 * np.pi * 0.01 * t
+        moving = 80 * np.exp(1j * (doppler_phase - 2 * np.pi * self.reflector_delay[antenna_idx] * self.subcarrier))
+        noise = self.rng.normal(scale=10, size=(count, self.num_samples, 2)).view(complex)[..., 0]
+        # The driver delivers integer I/Q values
+        return np.round(self.static[antenna_idx] + moving + noise)
+
+class SimulatedCSIServer:
+    """Sends synthetic CSI datagrams to registered clients at a configurable rate and burst pattern
+
+    rate is CSI packets per second per antenna. Packets are sent in cycles of
+    burst packets per antenna, antenna by antenna, like runMonitoring sends a
+    dump; burst=1 gives an even packet stream. Every packet is a frame seen
+    by all antennas; a fraction loss of the frames is never sent, which shows
+    up as gaps in the sequence numbers of clients that request packet metadata.
+    """
+    def __init__(self, port, num_antennas=3, subcarriers=512, rate=100.0, burst=1, host='0.0.0.0', seed=0,
+                 loss=0.0):
+        self.num_antennas = num_antennas
+        self.num_samples = samples_per_packet(subcarriers)
+        self.ch_bw = channel_bandwidth_code(subcarriers)
+        self.rate = rate
+        self.burst = burst
+        self.loss = loss
+        self.channel = SyntheticChannel(num_antennas, self.num_samples, seed)
+        self.frame_idx = 0  # Frames generated, for the sequence numbers and hardware timestamps
+        self.transmitter = np.array([0x02, 0x00, 0x00, 0x00, 0x00, 0x01], dtype=np.uint8)
+        self.clients = {}  # addr -> parse_register_message options
+        self.sent_datagrams = 0
+        self.cycles = 0
+        self.late_cycles = 0  # Cycles that ended after the next cycle's deadline
+        self.cycle_time = 0.0  # EMA of the time spent building and sending a cycle (s)
+        self.status_packets = 0  # Packets sent since the last capture status
+        self.running = False
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.port = self.socket.getsockname()[1]
+
+    def handle_messages(self, timeout):
+        """Accept registrations for up to timeout seconds"""
+        readable, _, _ = select.select([self.socket], [], [], max(timeout, 0))
+        while readable:
+            try:
+                message, addr = self.socket.recvfrom(1024)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            options = parse_register_message(message)
+            if options is not None:
+                if addr not in self.clients:
+                    print(f"Added UDP client: {addr[0]}:{addr[1]} (header v{options[0]}, format {options[1]}, "
+                          f"aggregate {options[2]}{', mixed antennas' if options[3] else ''}"
+                          f"{', packet metadata' if options[4] else ''}"
+                          f"{', antennas ' + ','.join(map(str, options[5])) if options[5] is not None else ''}"
+                          f"{', capture status' if options[6] else ''})", flush=True)
+                self.clients[addr] = options
+            readable, _, _ = select.select([self.socket], [], [], 0)
+
+    def add_multicast_group(self, group, port, options='', interface=None):
+        """Send every datagram once to group:port too, in the format of the register options
+
+        interface is the address of the outgoing interface, e.g. 127.0.0.1 for loopback tests.
+        """
+        client_options = parse_register_message(f'register {options}'.encode())
+        if client_options is None:
+            raise ValueError(f"Invalid multicast options: {options}")
+        # Stay on the local network, and deliver to receivers on this host as well
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if interface:
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.clients[(group, port)] = client_options
+
+    def build_datagrams(self):
+        """One cycle of datagrams per client configuration in use
+
+        Like a runMonitoring dump the cycle holds burst packets per antenna,
+        antenna by antenna.
+        """
+        timestamp = int(time.time() * 1000)
+        frames = self.frame_idx + np.arange(self.burst)
+        self.frame_idx += self.burst
+        sent = self.channel.rng.random(self.burst) >= self.loss
+        frame_meta = np.zeros(self.burst, dtype=PACKET_META_DTYPE)
+        frame_meta['pkt_sn'] = frames % 4096
+        # Hardware clock in us with a little capture jitter
+        frame_meta['ts'] = (np.round(frames * 1e6 / self.rate + self.channel.rng.normal(scale=20, size=self.burst))
+                            .astype(np.int64) % (1 << 32))
+        frame_meta['rssi'] = -50
+        frame_meta['snr'] = 30
+        frame_meta['ch_bw'] = self.ch_bw
+        frame_meta['ta'] = self.transmitter
+        antenna_indices = []
+        packets = []
+        metas = []
+        for antenna_idx in range(self.num_antennas):
+            antenna_packets = self.channel.packets(antenna_idx, self.burst)[sent]
+            antenna_meta = frame_meta[sent].copy()
+            antenna_meta['rx_idx'] = antenna_idx
+            antenna_indices.extend([antenna_idx] * len(antenna_packets))
+            packets.extend(antenna_packets)
+            metas.append(antenna_meta)
+        meta = np.concatenate(metas)
+        self.status_packets += len(packets)
+        return {fmt: pack_datagrams(timestamp, antenna_indices, packets, fmt, meta)
+                for fmt in set(options[:FORMAT_FIELDS] for options in self.clients.values())}
+
+    def send_cycle(self):
+        datagrams = self.build_datagrams()
+        for addr, options in list(self.clients.items()):
+            for datagram in datagrams[options[:FORMAT_FIELDS]]:
+                try:
+                    self.socket.sendto(datagram, addr)
+                    self.sent_datagrams += 1
+                except OSError as e:
+                    print(f"Failed to send UDP data to {addr[0]}:{addr[1]}: {e}", file=sys.stderr)
+                    break
+
+    def send_status(self, elapsed):
+        """Send the pacing counters of the last elapsed seconds to clients that registered with status=1"""
+        status = dict(mode=next(code for code, name in CAPTURE_MODES.items() if name == 'rate'),
+                      interval_ms=round(self.burst / self.rate * 1000), dump_size=self.burst * self.num_antennas,
+                      cycles=self.cycles, late_cycles=self.late_cycles, overruns=0,
+                      cycle_us=round(self.cycle_time * 1e6), rate=self.status_packets / max(elapsed, 1e-9),
+                      target_rate=self.rate * self.num_antennas)
+        self.status_packets = 0
+        datagram = encode_capture_status(int(time.time() * 1000), status)
+        for addr, options in list(self.clients.items()):
+            if options[0] == HEADER_VERSION_2 and options[6]:
+                try:
+                    self.socket.sendto(datagram, addr)
+                except OSError as e:
+                    print(f"Failed to send capture status to {addr[0]}:{addr[1]}: {e}", file=sys.stderr)
+
+    def serve(self, duration=0):
+        """Run until stop() is called or duration seconds after the first client registered"""
+        self.running = True
+        period = self.burst / self.rate
+        while self.running and not self.clients:
+            self.handle_messages(0.5)
+
+        start = time.perf_counter()
+        next_cycle = start
+        last_status = start
+        self.status_packets = 0
+        while self.running and (duration <= 0 or time.perf_counter() - start < duration):
+            self.handle_messages(next_cycle - time.perf_counter())
+            cycle_start = time.perf_counter()
+            if cycle_start < next_cycle:
+                continue
+            self.send_cycle()
+            now = time.perf_counter()
+            self.cycles += 1
+            self.cycle_time += ((now - cycle_start) - self.cycle_time) / (1 if self.cycles == 1 else 8)
+            next_cycle += period
+            if now > next_cycle:
+                self.late_cycles += 1
+            # Do not try to catch up after a long stall
+            next_cycle = max(next_cycle, now - period)
+            if now - last_status >= 1.0:
+                self.send_status(now - last_status)
+                last_status = now
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.socket.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic CSIdump stand-in server")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--antennas", type=int, default=3)
+    parser.add_argument("--subcarriers", type=int, default=512, choices=sorted(BANDWIDTH_SUBCARRIERS.values()),
+                        help="subcarriers of the simulated channel bandwidth (default: 512)")
+    parser.add_argument("--rate", type=float, default=100.0,
+                        help="CSI packets per second per antenna (default: 100)")
+    parser.add_argument("--burst", type=int, default=1,
+                        help="packets per antenna sent back-to-back each cycle (default: 1)")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="stop this many seconds after the first client registered (default: run forever)")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="fraction of frames that are never sent, visible as sequence gaps (default: 0)")
+    parser.add_argument("--multicast", metavar="GROUP:PORT",
+                        help="also send every datagram once to this multicast group; starts sending right away")
+    parser.add_argument("--multicast-options", default="",
+                        help='register options of the multicast stream, e.g. "encoding=int16 meta=1"')
+    parser.add_argument("--multicast-interface", metavar="IP",
+                        help="address of the interface to send multicast on (e.g. 127.0.0.1)")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    server = SimulatedCSIServer(args.port, args.antennas, args.subcarriers, args.rate, args.burst, loss=args.loss)
+    if args.multicast:
+        group, _, port = args.multicast.rpartition(':')
+        try:
+            server.add_multicast_group(group, int(port), args.multicast_options, args.multicast_interface)
+        except (ValueError, OSError) as e:
+            print(f"Error: cannot send to multicast group {args.multicast}: {e}", file=sys.stderr)
+            server.close()
+            sys.exit(1)
+        print(f"Sending to multicast group {args.multicast}", flush=True)
+    print(f"Simulated CSIdump on port {server.port}: {args.antennas} antennas, "
+          f"{server.num_samples} samples, {args.rate:g} packets/s, burst {args.burst}", flush=True)
+    try:
+        server.serve(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    print(f"Sent {server.sent_datagrams} datagrams", flush=True)
+
+if __name__ == "__main__":
+    main()
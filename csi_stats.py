@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""Incremental per-subcarrier statistics of the CSI magnitude of one channel
+
+ChannelStats keeps, for every subcarrier, an exponentially weighted mean and
+variance, optionally the mean over the newest window packets, and a minimum
+and maximum that relax towards the mean when no new extreme arrives. Whole
+blocks of packets are applied at once; the work is O(subcarriers) per packet
+and no history is ever rescanned.
+"""
+
+import numpy as np
+
+# Largest growth factor (1 - alpha)^-n allowed inside one vectorized chunk
+MAX_EMA_GAIN = 1e6
+
+def ema_filter(values, state, alpha):
+    """Run y[k] = (1 - alpha) * y[k-1] + alpha * values[k] over the first axis
+
+    state is y[-1]. Returns every y[k] as an array shaped like values. The
+    closed form y[k] = d^k (state + alpha * sum_j d^-j values[j]) with
+    d = 1 - alpha is evaluated in chunks short enough that d^-j stays well
+    conditioned. alpha must be in (0, 1]; with alpha 1 y[k] is values[k].
+    """
+    if not 0 < alpha <= 1:
+        raise ValueError(f"alpha must be greater than 0 and at most 1, got {alpha}")
+    if alpha == 1:
+        return np.array(values, dtype=np.float64)
+    decay = 1.0 - alpha
+    chunk = max(int(np.log(MAX_EMA_GAIN) / -np.log(decay)), 1)
+    output = np.empty(values.shape, dtype=np.float64)
+    for start in range(0, len(values), chunk):
+        block = values[start:start + chunk]
+        powers = decay ** np.arange(1, len(block) + 1, dtype=np.float64)
+        weights = (alpha / powers)[:, None]
+        output[start:start + chunk] = powers[:, None] * (state + np.cumsum(weights * block, axis=0))
+        state = output[start + len(block) - 1]
+    return output
+
+class ChannelStats:
+    """Running statistics of a (packets, subcarriers) magnitude stream
+
+    alpha is the weight of a new packet in the EMA mean/variance, window the
+    length of the rolling mean (0 to skip it) and decay the fraction by which
+    the minimum and maximum move towards the mean per packet (applied once per
+    block, before the block's own extremes are taken in).
+    """
+    def __init__(self, subcarriers, alpha=0.01, window=100, decay=0.01):
+        self.subcarriers = subcarriers
+        self.alpha = alpha
+        self.decay = decay
+        self.mean = np.zeros(subcarriers)
+        self.var = np.zeros(subcarriers)
+        self.minimum = np.zeros(subcarriers)
+        self.maximum = np.zeros(subcarriers)
+        self.window = window
+        self.history = np.zeros((window, subcarriers))  # Ring of the newest window packets
+        self.window_sum = np.zeros(subcarriers)
+        self.pos = 0
+        self.count = 0  # Packets seen
+
+    def update(self, magnitude):
+        """Add a (packets, subcarriers) block"""
+        packets = len(magnitude)
+        if packets == 0:
+            return
+        if self.count == 0:
+            self.mean[:] = magnitude[0]
+            self.minimum[:] = magnitude[0]
+            self.maximum[:] = magnitude[0]
+
+        # EMA mean and West's EW variance, with the mean before each packet
+        means = ema_filter(magnitude, self.mean, self.alpha)
+        deviation = magnitude - np.vstack((self.mean[None], means[:-1]))
+        # Only the newest variance is kept: var = d^m var + alpha * sum_i d^(m-1-i) (1 - alpha) deviation_i^2
+        decay = 1.0 - self.alpha
+        weights = self.alpha * decay * decay ** np.arange(packets - 1, -1, -1)
+        self.var = decay ** packets * self.var + weights @ deviation ** 2
+        self.mean = means[-1].copy()
+
+        # Extremes relax towards the mean, then take in the block's own extremes
+        relax = 1.0 - (1.0 - self.decay) ** packets
+        self.minimum += relax * (self.mean - self.minimum)
+        self.maximum += relax * (self.mean - self.maximum)
+        np.minimum(self.minimum, magnitude.min(axis=0), out=self.minimum)
+        np.maximum(self.maximum, magnitude.max(axis=0), out=self.maximum)
+
+        if self.window:
+            block = magnitude[-self.window:]
+            rows = (self.pos + np.arange(len(block))) % self.window
+            self.window_sum += block.sum(axis=0) - self.history[rows].sum(axis=0)
+            self.history[rows] = block
+            self.pos = (self.pos + len(block)) % self.window
+            if self.pos < len(block):
+                # Wrapped around: resum to keep rounding errors from accumulating
+                self.window_sum = self.history.sum(axis=0)
+        self.count += packets
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def rolling_mean(self):
+        """Mean over the newest window packets (all packets until the window is full)"""
+        return self.window_sum / max(min(self.count, self.window), 1)
+
+    def levels(self):
+        """Stable (low, high) colour levels over all subcarriers"""
+        return float(self.minimum.min()), float(self.maximum.max())
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 
 import sys
-import socket
-import struct
 import time
+import argparse
 import threading
 import signal
 from collections import deque
@@ -12,82 +11,81 @@ import numpy as np
 from PyQt5 import QtWidgets, QtCore, QtGui
 import pyqtgraph as pg
 
+from csi_protocol import ENCODINGS
+from csi_fanin import CSIFanInReceiver, server_address
+from csi_workers import CSIWorkerPool
+from csi_handoff import BatchHandoff, HANDOFF_POLICIES, DEFAULT_HANDOFF_CAPACITY
+from csi_processing import CSIPipeline, BASELINE_APPLIED, BASELINE_MISMATCH, magnitude_spectrum_db
+from csi_stats import ChannelStats
+from csi_motion import StreamingMotionDetector
+from csi_doppler import DopplerAnalyzer, parse_subcarriers
+from csi_dataset import DatasetWriter, CONTENTS
+from csi_waterfall import MultiResolutionWaterfall, POOLING
+from csi_metrics import (ClientMetrics, MetricsLogger, format_snapshot,
+                         STAGE_PROCESSING, STAGE_RENDER, STAGE_LATENCY)
+
 # disclaimer: this is mostly AI slop
 
-# Struct format for CsiPacketHeader
-# uint64_t timestamp, uint32_t antenna_idx, uint32_t packet_count, uint32_t total_samples
-HEADER_FORMAT = '<QIII'  # Little endian: Q=uint64, I=uint32
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# Default plot refresh rate, independent of the packet arrival rate
+DEFAULT_DISPLAY_RATE_HZ = 30
+
+# Motion scores kept per antenna for the motion plot
+MOTION_HISTORY_PACKETS = 500
+
+# Margin added around the data when a line plot's y range has to change
+Y_RANGE_MARGIN = 0.1
 
-# Struct format for CsiSample (I/Q pair)
-# double i, double q
-SAMPLE_FORMAT = '<dd'  # Little endian: d=double, d=double
-SAMPLE_SIZE = struct.calcsize(SAMPLE_FORMAT)
+# Waterfall history: rows per tier, tiers and packets pooled per row from one tier to the next.
+# 256 rows at full rate, the oldest tier reaches back 256 * 8^5 packets (about 2.3 h at 1000 packets/s)
+WATERFALL_ROWS = 256
+WATERFALL_TIERS = 6
+WATERFALL_FACTOR = 8
 
-class CSIData:
-    def __init__(self):
-        self.timestamp = 0
-        self.antenna_idx = 0
-        self.packet_count = 0
-        self.samples = []  # Now contains complex numbers (I+jQ)
-        self.addr = None
+# Default time span shown by the waterfall (s)
+DEFAULT_WATERFALL_SPAN = 10
 
 class CSIReceiver(QtCore.QObject):
-    data_received = QtCore.pyqtSignal(object)
+    data_ready = QtCore.pyqtSignal()
     
-    def __init__(self, server_ip, server_port):
+    def __init__(self, servers, handoff, rcvbuf=None, encoding='float64', aggregate=None, mix_antennas=False,
+                 packet_meta=False, multicast_interface=None, capture_status=False):
         super().__init__()
-        self.server_ip = server_ip
-        self.server_port = server_port
-        self.socket = None
+        self.servers = servers  # (ip, port) of every server, all received on this one thread
+        self.handoff = handoff  # Bounded BatchHandoff to the GUI thread
+        self.rcvbuf = rcvbuf
+        self.encoding = encoding
+        self.aggregate = aggregate
+        self.mix_antennas = mix_antennas
+        self.packet_meta = packet_meta
+        self.multicast_interface = multicast_interface  # Interface to join multicast groups on
+        self.capture_status = capture_status
+        self.client = None
         self.running = False
         
     def start_receiving(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(1.0)  # 1 second timeout
-        
         try:
-            # Register with the server
-            self.socket.sendto(b'register', (self.server_ip, self.server_port))
-            print(f"Registered with server at {self.server_ip}:{self.server_port}")
+            # Joining a multicast group can fail, e.g. without a multicast route
+            self.client = CSIFanInReceiver(self.servers, self.rcvbuf, self.encoding, self.aggregate,
+                                           self.mix_antennas, packet_meta=self.packet_meta,
+                                           multicast_interface=self.multicast_interface,
+                                           capture_status=self.capture_status)
+            self.rcvbuf = self.client.rcvbuf
+
+            # Register with the servers
+            self.client.start()
 
             self.running = True
             while self.running:
                 try:
-                    data, addr = self.socket.recvfrom(65536)
-                    
-                    if len(data) < HEADER_SIZE:
-                        continue
-                    
-                    # Parse header
-                    timestamp, antenna_idx, packet_count, total_samples = struct.unpack(
-                        HEADER_FORMAT, data[:HEADER_SIZE])
-                    
-                    # Parse CSI samples (I/Q pairs)
-                    samples_data = data[HEADER_SIZE:]
-                    num_samples = len(samples_data) // SAMPLE_SIZE
+                    # Wait up to 1 second for data, then drain everything pending on every socket
+                    batches = self.client.receive_batches(1.0)
                     
-                    samples = []
-                    if num_samples > 0:
-                        # Unpack I/Q pairs and create complex numbers
-                        iq_values = list(struct.unpack(f'<{num_samples * 2}d', samples_data))
-                        for i in range(0, len(iq_values), 2):
-                            complex_sample = complex(iq_values[i], iq_values[i + 1])
-                            samples.append(complex_sample)
+                    # Only the first batch after the GUI emptied the hand-off needs a signal, so Qt's
+                    # unbounded event queue never holds more than one
+                    for batch in batches:
+                        if self.handoff.put(batch):
+                            self.data_ready.emit()
                     
-                    # Create CSI data object
-                    csi_data = CSIData()
-                    csi_data.timestamp = timestamp
-                    csi_data.antenna_idx = antenna_idx
-                    csi_data.packet_count = packet_count
-                    csi_data.samples = samples
-                    csi_data.addr = addr
-                    
-                    # Emit signal
-                    self.data_received.emit(csi_data)
-                    
-                except socket.timeout:
-                    continue
                 except Exception as e:
                     if self.running:
                         print(f"Error receiving data: {e}", file=sys.stderr)
@@ -95,12 +93,13 @@ class CSIReceiver(QtCore.QObject):
         except Exception as e:
             print(f"Error in receiver: {e}", file=sys.stderr)
         finally:
-            if self.socket:
-                self.socket.close()
+            if self.client:
+                self.client.close()
             print("Receiver stopped.")
     
     def stop_receiving(self):
         self.running = False
+        self.handoff.close()
     
     def cleanup(self):
         """Clean up socket resources"""
@@ -108,21 +107,65 @@ class CSIReceiver(QtCore.QObject):
             
 
 class CSIVisualizerWindow(QtWidgets.QMainWindow):
-    def __init__(self, server_ip, server_port):
+    def __init__(self, server_ip, server_port, rcvbuf=None, metrics_interval=1.0, metrics_log=None,
+                 encoding='float64', aggregate=None, mix_antennas=False, extra_servers=(), workers=False,
+                 antenna_groups=1, motion_threshold=3.0, doppler_subcarriers=None, decimate=True, opengl=False,
+                 line_width=2, dataset=None, dataset_content='complex', packet_meta=False, queue_policy='latest',
+                 queue_capacity=DEFAULT_HANDOFF_CAPACITY, multicast_interface=None, capture_status=False):
         super().__init__()
         self.server_ip = server_ip
         self.server_port = server_port
+        self.servers = [(server_ip, server_port)] + list(extra_servers)
+        self.workers = workers  # Receive and process in worker processes, this process only renders
+        self.antenna_groups = antenna_groups
+        self.worker_pool = None
+        self.rcvbuf = rcvbuf
+        self.encoding = encoding
+        self.aggregate = aggregate
+        self.mix_antennas = mix_antennas
+        self.packet_meta = packet_meta  # Request driver fields per packet, for sequence gaps and jitter
+        self.multicast_interface = multicast_interface  # Servers that are multicast groups are joined on it
+        self.capture_status = capture_status  # Request the servers' capture scheduler status
+        self.decimate = decimate  # Reduce line plots to the display pixel width
+        self.opengl = opengl
+        self.line_width = line_width  # Pens wider than 1 are much slower to draw without OpenGL
         self.csi_data_history = {}  # Store history per antenna
         self.max_history_length = 100
-        self.packet_counts = {}
-        self.last_update_time = time.time()
+        self.packet_counts = {}  # Packets received per antenna
         self.fps = 0
+        self.display_rate = DEFAULT_DISPLAY_RATE_HZ
+        
+        # Per-stage instrumentation, rolled over every metrics_interval seconds
+        self.metrics = ClientMetrics()
+        self.metrics_interval = metrics_interval
+        self.metrics_logger = MetricsLogger(metrics_log) if metrics_log else None
+        
+        # Bounded hand-off from the receiver thread, so stalls drop data instead of queueing it
+        self.handoff = BatchHandoff(queue_capacity, queue_policy)
+        
+        # Latest processed state per antenna, drawn by the render timer
+        self.latest_frames = {}
+        self.dirty_channels = set()
+        self.info_dirty = False
+        
+        # Motion scores per packet, computed only while the motion plots are shown
+        self.motion_detector = StreamingMotionDetector(threshold=motion_threshold)
+        self.show_motion = False
+        self.motion_history = {}
+        
+        # Doppler spectrograms, computed only while the Doppler plots are shown
+        self.doppler_subcarriers = doppler_subcarriers
+        self.doppler = DopplerAnalyzer(subcarriers=doppler_subcarriers)
+        self.show_doppler = False
+        
+        # Every processed packet is streamed to disk by the dataset writer's own thread
+        self.dataset = DatasetWriter(dataset, dataset_content) if dataset else None
         
         self.setupUI()
         self.setupReceiver()
         
     def setupUI(self):
-        self.setWindowTitle(f"CSI Visualizer - Connected to {self.server_ip}:{self.server_port}")
+        self.setWindowTitle(f"CSI Visualizer - Connected to {self.servers_text()}")
         self.setGeometry(100, 100, 2000, 900)  # Increased width to accommodate waterfall plot
         
         # Create central widget and layout
@@ -134,6 +177,8 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         
         # Create plot widget
         self.plot_widget = pg.GraphicsLayoutWidget()
+        if self.opengl:
+            self.enable_opengl()
         
         # Configure plot widget
         self.plot_widget.setBackground('w')
@@ -141,11 +186,9 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         # Initialize processing options
         self.show_raw_amplitude = True
         self.show_amplitude_diff = False
-        self.baseline_data = {}  # Store baseline for difference calculation
         
-        # CSI processing options
-        self.remove_dc_subcarrier = True  # Remove center subcarrier spike
-        self.remove_dc_offset = False     # Remove DC offset from I/Q data
+        # CSI processing pipeline (DC cleanup, magnitude, baseline difference)
+        self.pipeline = CSIPipeline(remove_dc_subcarrier=True, remove_dc_offset=False)
         
         # Initialize plots dictionary
         self.plots = {}
@@ -156,8 +199,26 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         self.magnitude_lines = {}
         self.waterfall_plots = {}
         self.waterfall_images = {}
-        self.waterfall_data = {}  # Store waterfall data for each antenna
-        self.waterfall_max_rows = 50  # Maximum number of time samples to display (reduced from 200)
+        self.waterfall_data = {}  # MultiResolutionWaterfall per antenna
+        self.display_stats = {}  # ChannelStats of the displayed magnitude per antenna, for colour levels
+        
+        # Render state, so nothing is reallocated or re-set per frame when it did not change
+        self.x_axes = {}  # Length -> reusable x-axis array
+        self.plot_titles = {}  # Plot -> current title
+        self.x_ranges = {}  # Plot -> current x range
+        self.y_ranges = {}  # Plot -> current y range
+        self.image_rects = {}  # ImageItem -> current rectangle
+        self.waterfall_span = DEFAULT_WATERFALL_SPAN  # Seconds shown, the plots can also be zoomed and scrolled
+        self.waterfall_pooling = 'mean'
+        self.motion_plots = {}
+        self.motion_lines = {}
+        self.doppler_plots = {}
+        self.doppler_images = {}
+        
+        # Create stats panel (per-stage timings, queue depth, kernel drops)
+        self.stats_label = QtWidgets.QLabel("No statistics yet")
+        self.stats_label.setStyleSheet("QLabel { font-family: monospace; font-size: 11px; }")
+        self.stats_label.setVisible(False)
         
         # Create layout
         layout = QtWidgets.QVBoxLayout()
@@ -174,6 +235,7 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         info_panel.addStretch()
         
         layout.addLayout(info_panel)
+        layout.addWidget(self.stats_label)
         layout.addWidget(self.plot_widget)
         
         central_widget.setLayout(layout)
@@ -181,16 +243,96 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         # Setup timer for UI updates
         self.update_timer = QtCore.QTimer()
         self.update_timer.timeout.connect(self.update_fps)
-        self.update_timer.start(1000)  # Update every second
+        self.update_timer.start(int(self.metrics_interval * 1000))  # Update every metrics interval
+        
+        # Setup timer for plot refreshes at the display rate
+        self.render_timer = QtCore.QTimer()
+        self.render_timer.timeout.connect(self.render_frame)
+        self.render_timer.start(int(1000 / self.display_rate))
+        
+    def enable_opengl(self):
+        """Render the plots with OpenGL, if PyOpenGL is available"""
+        try:
+            import OpenGL  # noqa: F401, required by pyqtgraph for OpenGL
+        except ImportError:
+            print("Warning: PyOpenGL is not installed, rendering without OpenGL", file=sys.stderr)
+            return
+        self.plot_widget.useOpenGL(True)
+        
+    def add_plot(self, row, col, title):
+        """Plot in the layout grid whose axes are cached as pixmaps and only redrawn when their range changes"""
+        plot = self.plot_widget.addPlot(row=row, col=col, title=title)
+        for axis in ('left', 'bottom'):
+            plot.getAxis(axis).setCacheMode(QtWidgets.QGraphicsItem.DeviceCoordinateCache)
+        self.plot_titles[plot] = title
+        return plot
+        
+    def make_curve(self, plot, pen):
+        """Line item for frequent updates: no finite checks, decimated to the pixel width and clipped to the view"""
+        curve = plot.plot(pen=pen, skipFiniteCheck=True)
+        if self.decimate:
+            curve.setDownsampling(auto=True, method='peak')
+            curve.setClipToView(True)
+        return curve
+        
+    def x_axis(self, length):
+        """Shared, reused x-axis array 0..length-1"""
+        x_axis = self.x_axes.get(length)
+        if x_axis is None:
+            x_axis = self.x_axes[length] = np.arange(length, dtype=np.float64)
+        return x_axis
+        
+    def set_title(self, plot, title):
+        """Set a plot title only when it changed"""
+        if self.plot_titles.get(plot) != title:
+            self.plot_titles[plot] = title
+            plot.setTitle(title)
+        
+    def set_x_range(self, plot, low, high):
+        """Set a plot's x range only when it changed"""
+        if self.x_ranges.get(plot) != (low, high):
+            self.x_ranges[plot] = (low, high)
+            plot.setXRange(low, high, padding=0)
+        
+    def update_y_range(self, plot, low, high):
+        """Follow the data with hysteresis: the range changes only when the data leave it or fill less than half of it"""
+        current = self.y_ranges.get(plot)
+        if current is not None:
+            current_low, current_high = current
+            if current_low <= low and high <= current_high and high - low > (current_high - current_low) / 2:
+                return
+        margin = Y_RANGE_MARGIN * (high - low) or 1.0
+        self.y_ranges[plot] = (low - margin, high + margin)
+        plot.setYRange(low - margin, high + margin, padding=0)
+        
+    def set_image_rect(self, image, rect):
+        """Position an image only when its rectangle changed"""
+        if self.image_rects.get(image) != rect:
+            self.image_rects[image] = rect
+            image.setRect(QtCore.QRectF(*rect))
+        
+    def servers_text(self):
+        return ", ".join(f"{server_ip}:{server_port}" for server_ip, server_port in self.servers)
         
     def setupReceiver(self):
+        if self.workers:
+            # Worker processes publish processed frames in shared memory, polled by render_frame
+            self.worker_pool = CSIWorkerPool(self.servers, self.antenna_groups, self.rcvbuf, self.encoding,
+                                             self.aggregate, self.mix_antennas, packet_meta=self.packet_meta,
+                                             multicast_interface=self.multicast_interface,
+                                             capture_status=self.capture_status)
+            self.worker_pool.start()
+            return
+        
         # Create receiver thread
         self.receiver_thread = QtCore.QThread()
-        self.receiver = CSIReceiver(self.server_ip, self.server_port)
+        self.receiver = CSIReceiver(self.servers, self.handoff, self.rcvbuf, self.encoding, self.aggregate,
+                                    self.mix_antennas, self.packet_meta, self.multicast_interface,
+                                    self.capture_status)
         self.receiver.moveToThread(self.receiver_thread)
         
         # Connect signals
-        self.receiver.data_received.connect(self.on_data_received)
+        self.receiver.data_ready.connect(self.on_data_ready)
         self.receiver_thread.started.connect(self.receiver.start_receiving)
         self.receiver_thread.finished.connect(self.receiver.cleanup)
         
@@ -200,7 +342,7 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
     def create_axis_control_panel(self):
         """Create a control panel for processing options"""
         panel = QtWidgets.QGroupBox("Processing Controls")
-        panel.setMaximumHeight(140)  # Increased height for additional DC processing controls
+        panel.setMaximumHeight(200)  # Increased height for additional DC processing, Doppler and display controls
         
         layout = QtWidgets.QVBoxLayout()
         
@@ -222,6 +364,16 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         self.set_baseline_btn.setEnabled(False)
         processing_layout.addWidget(self.set_baseline_btn)
         
+        processing_layout.addWidget(QtWidgets.QLabel("Baseline:"))
+        self.baseline_mode_combo = QtWidgets.QComboBox()
+        self.baseline_mode_combo.addItem("Fixed", 'fixed')
+        self.baseline_mode_combo.addItem("Rolling Mean", 'rolling')
+        self.baseline_mode_combo.addItem("EMA", 'ema')
+        self.baseline_mode_combo.setToolTip("Fixed: running mean frozen by Set Baseline; "
+                                            "Rolling Mean / EMA: follows the recent packets")
+        self.baseline_mode_combo.currentIndexChanged.connect(self.on_baseline_mode_changed)
+        processing_layout.addWidget(self.baseline_mode_combo)
+        
         processing_layout.addStretch()
         
         # Waterfall options
@@ -233,13 +385,23 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         self.show_waterfall_checkbox.toggled.connect(self.on_waterfall_visibility_changed)
         waterfall_layout.addWidget(self.show_waterfall_checkbox)
         
-        waterfall_layout.addWidget(QtWidgets.QLabel("History Length:"))
-        self.waterfall_history_spinbox = QtWidgets.QSpinBox()
-        self.waterfall_history_spinbox.setRange(20, 200)  # Reduced range from 50-500 to 20-200
-        self.waterfall_history_spinbox.setValue(self.waterfall_max_rows)
-        self.waterfall_history_spinbox.setSuffix(" packets")
-        self.waterfall_history_spinbox.valueChanged.connect(self.on_waterfall_history_changed)
-        waterfall_layout.addWidget(self.waterfall_history_spinbox)
+        waterfall_layout.addWidget(QtWidgets.QLabel("Time Span:"))
+        self.waterfall_span_spinbox = QtWidgets.QSpinBox()
+        self.waterfall_span_spinbox.setRange(1, 24 * 3600)
+        self.waterfall_span_spinbox.setValue(self.waterfall_span)
+        self.waterfall_span_spinbox.setSuffix(" s")
+        self.waterfall_span_spinbox.setToolTip("Seconds up to the newest packet; recent rows are shown at full rate, "
+                                               "older ones pooled. Zoom or drag a waterfall to look further back")
+        self.waterfall_span_spinbox.valueChanged.connect(self.on_waterfall_span_changed)
+        waterfall_layout.addWidget(self.waterfall_span_spinbox)
+        
+        waterfall_layout.addWidget(QtWidgets.QLabel("Pooling:"))
+        self.waterfall_pooling_combo = QtWidgets.QComboBox()
+        for pooling in POOLING:
+            self.waterfall_pooling_combo.addItem(pooling.capitalize(), pooling)
+        self.waterfall_pooling_combo.setToolTip("How older rows are combined: mean, or max to keep short peaks")
+        self.waterfall_pooling_combo.currentIndexChanged.connect(self.on_waterfall_pooling_changed)
+        waterfall_layout.addWidget(self.waterfall_pooling_combo)
         
         waterfall_layout.addStretch()
         
@@ -248,23 +410,77 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         csi_processing_layout.addWidget(QtWidgets.QLabel("CSI Processing:"))
         
         self.remove_dc_subcarrier_checkbox = QtWidgets.QCheckBox("Remove DC Subcarrier")
-        self.remove_dc_subcarrier_checkbox.setChecked(self.remove_dc_subcarrier)
+        self.remove_dc_subcarrier_checkbox.setChecked(self.pipeline.remove_dc_subcarrier)
         self.remove_dc_subcarrier_checkbox.toggled.connect(self.on_dc_processing_changed)
         self.remove_dc_subcarrier_checkbox.setToolTip("Remove the center frequency spike (DC subcarrier) by interpolating from neighbors")
         csi_processing_layout.addWidget(self.remove_dc_subcarrier_checkbox)
         
         self.remove_dc_offset_checkbox = QtWidgets.QCheckBox("Remove DC Offset")
-        self.remove_dc_offset_checkbox.setChecked(self.remove_dc_offset)
+        self.remove_dc_offset_checkbox.setChecked(self.pipeline.remove_dc_offset)
         self.remove_dc_offset_checkbox.toggled.connect(self.on_dc_processing_changed)
         self.remove_dc_offset_checkbox.setToolTip("Remove DC offset from I/Q data by subtracting the mean")
         csi_processing_layout.addWidget(self.remove_dc_offset_checkbox)
         
+        self.sanitize_phase_checkbox = QtWidgets.QCheckBox("Sanitize Phase")
+        self.sanitize_phase_checkbox.setChecked(self.pipeline.sanitize_phase)
+        self.sanitize_phase_checkbox.toggled.connect(self.on_dc_processing_changed)
+        self.sanitize_phase_checkbox.setToolTip("Unwrap the phase across subcarriers and remove the per-packet "
+                                                "linear slope and offset (timing and frequency offsets)")
+        csi_processing_layout.addWidget(self.sanitize_phase_checkbox)
+        
         csi_processing_layout.addStretch()
         
+        # Doppler spectrogram options
+        doppler_layout = QtWidgets.QHBoxLayout()
+        doppler_layout.addWidget(QtWidgets.QLabel("Doppler:"))
+        
+        self.show_doppler_checkbox = QtWidgets.QCheckBox("Show Doppler Spectrogram")
+        self.show_doppler_checkbox.setToolTip("Spectrum of the subcarrier magnitudes over time (sliding DFT)")
+        self.show_doppler_checkbox.toggled.connect(self.on_doppler_visibility_changed)
+        doppler_layout.addWidget(self.show_doppler_checkbox)
+        
+        doppler_layout.addWidget(QtWidgets.QLabel("Window:"))
+        self.doppler_window_spinbox = QtWidgets.QSpinBox()
+        self.doppler_window_spinbox.setRange(16, 1024)
+        self.doppler_window_spinbox.setValue(self.doppler.window)
+        self.doppler_window_spinbox.setSuffix(" packets")
+        self.doppler_window_spinbox.setToolTip("DFT length; longer windows resolve finer Doppler at the same cost per packet")
+        self.doppler_window_spinbox.valueChanged.connect(self.on_doppler_window_changed)
+        doppler_layout.addWidget(self.doppler_window_spinbox)
+        
+        doppler_layout.addStretch()
+        
+        # Display options
+        display_layout = QtWidgets.QHBoxLayout()
+        display_layout.addWidget(QtWidgets.QLabel("Display:"))
+        
+        display_layout.addWidget(QtWidgets.QLabel("Refresh Rate:"))
+        self.display_rate_spinbox = QtWidgets.QSpinBox()
+        self.display_rate_spinbox.setRange(1, 120)
+        self.display_rate_spinbox.setValue(self.display_rate)
+        self.display_rate_spinbox.setSuffix(" Hz")
+        self.display_rate_spinbox.setToolTip("Plots are redrawn at this rate, independent of the packet rate")
+        self.display_rate_spinbox.valueChanged.connect(self.on_display_rate_changed)
+        display_layout.addWidget(self.display_rate_spinbox)
+        
+        self.show_stats_checkbox = QtWidgets.QCheckBox("Show Stats")
+        self.show_stats_checkbox.setToolTip("Per-stage timings, queue depth and kernel drops")
+        self.show_stats_checkbox.toggled.connect(self.stats_label.setVisible)
+        display_layout.addWidget(self.show_stats_checkbox)
+        
+        self.show_motion_checkbox = QtWidgets.QCheckBox("Show Motion")
+        self.show_motion_checkbox.setToolTip("Score motion per antenna and plot the scores over time")
+        self.show_motion_checkbox.toggled.connect(self.on_motion_visibility_changed)
+        display_layout.addWidget(self.show_motion_checkbox)
+        
+        display_layout.addStretch()
+        
         # Add layouts to main layout
         layout.addLayout(processing_layout)
         layout.addLayout(waterfall_layout)
         layout.addLayout(csi_processing_layout)
+        layout.addLayout(doppler_layout)
+        layout.addLayout(display_layout)
         
         panel.setLayout(layout)
         return panel
@@ -273,256 +489,410 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         """Handle processing mode change"""
         self.show_raw_amplitude = self.raw_amplitude_radio.isChecked()
         self.show_amplitude_diff = self.amplitude_diff_radio.isChecked()
-        self.set_baseline_btn.setEnabled(self.show_amplitude_diff)
+        self.pipeline.amplitude_diff = self.show_amplitude_diff
+        if self.worker_pool:
+            self.worker_pool.set_options(amplitude_diff=self.show_amplitude_diff)
+        self.set_baseline_btn.setEnabled(self.show_amplitude_diff and self.pipeline.baseline_mode == 'fixed')
+        # The displayed values change scale, colour levels start over
+        self.display_stats.clear()
+    
+    def on_baseline_mode_changed(self):
+        """Handle baseline mode change"""
+        self.pipeline.baseline_mode = self.baseline_mode_combo.currentData()
+        if self.worker_pool:
+            self.worker_pool.set_options(baseline_mode=self.pipeline.baseline_mode)
+        self.set_baseline_btn.setEnabled(self.show_amplitude_diff and self.pipeline.baseline_mode == 'fixed')
+        self.display_stats.clear()
     
     def on_waterfall_visibility_changed(self, checked):
         """Handle waterfall plot visibility toggle"""
-        for antenna_idx in self.waterfall_plots:
-            self.waterfall_plots[antenna_idx].setVisible(checked)
+        for channel in self.waterfall_plots:
+            self.waterfall_plots[channel].setVisible(checked)
     
-    def on_waterfall_history_changed(self, value):
-        """Handle waterfall history length change"""
-        self.waterfall_max_rows = value
-        # Trim existing data if necessary
-        for antenna_idx in self.waterfall_data:
-            if len(self.waterfall_data[antenna_idx]) > value:
-                self.waterfall_data[antenna_idx] = self.waterfall_data[antenna_idx][-value:]
+    def on_waterfall_span_changed(self, value):
+        """Show the newest value seconds in every waterfall"""
+        self.waterfall_span = value
+        for plot in self.waterfall_plots.values():
+            plot.setYRange(-value, 0, padding=0)
+    
+    def on_waterfall_pooling_changed(self):
+        """Pool rows with the selected function from now on; rows already pooled are kept"""
+        self.waterfall_pooling = self.waterfall_pooling_combo.currentData()
+        for waterfall in self.waterfall_data.values():
+            waterfall.pooling = self.waterfall_pooling
+    
+    def on_waterfall_range_changed(self, channel):
+        """Redraw a waterfall after zooming or scrolling, at the tier that matches the new span"""
+        if channel in self.latest_frames:
+            self.dirty_channels.add(channel)
+    
+    def on_motion_visibility_changed(self, checked):
+        """Handle motion plot visibility toggle; scoring restarts with a fresh reference"""
+        self.show_motion = checked
+        self.motion_detector.reset()
+        for channel in self.motion_plots:
+            self.motion_history[channel].clear()
+            self.motion_plots[channel].setVisible(checked)
+        self.info_dirty = True
+    
+    def on_doppler_visibility_changed(self, checked):
+        """Handle Doppler plot visibility toggle; spectrograms restart empty"""
+        self.show_doppler = checked
+        self.doppler.reset()
+        for channel in self.doppler_plots:
+            self.doppler_images[channel].clear()
+            self.doppler_plots[channel].setVisible(checked)
+    
+    def on_doppler_window_changed(self, value):
+        """Handle Doppler window length change; spectrograms restart with the new window"""
+        hop = min(self.doppler.hop, value)
+        self.doppler = DopplerAnalyzer(value, hop, subcarriers=self.doppler_subcarriers)
+        for channel in self.doppler_plots:
+            self.doppler_images[channel].clear()
+    
+    def on_display_rate_changed(self, value):
+        """Handle display refresh rate change"""
+        self.display_rate = value
+        self.render_timer.setInterval(int(1000 / value))
     
     def on_dc_processing_changed(self):
-        """Handle DC processing options change"""
-        self.remove_dc_subcarrier = self.remove_dc_subcarrier_checkbox.isChecked()
-        self.remove_dc_offset = self.remove_dc_offset_checkbox.isChecked()
+        """Handle DC and phase processing options change"""
+        self.pipeline.remove_dc_subcarrier = self.remove_dc_subcarrier_checkbox.isChecked()
+        self.pipeline.remove_dc_offset = self.remove_dc_offset_checkbox.isChecked()
+        self.pipeline.sanitize_phase = self.sanitize_phase_checkbox.isChecked()
+        if self.worker_pool:
+            self.worker_pool.set_options(remove_dc_subcarrier=self.pipeline.remove_dc_subcarrier,
+                                         remove_dc_offset=self.pipeline.remove_dc_offset,
+                                         sanitize_phase=self.pipeline.sanitize_phase)
+        for channel in self.phase_plots:
+            self.setup_phase_plot(channel)
     
     def set_baseline(self):
-        """Set current CSI data as baseline for difference calculation"""
-        self.baseline_data.clear()
-        for antenna_idx, history in self.csi_data_history.items():
-            if history:
-                latest_data = history[-1]
-                # Store magnitude of complex samples as baseline
-                complex_samples = np.array(latest_data.samples)
-                magnitude = np.abs(complex_samples)
-                self.baseline_data[antenna_idx] = magnitude.copy()
-        print(f"Baseline set for {len(self.baseline_data)} antennas")
-    
-    def process_csi_samples(self, samples):
-        """Process CSI samples to remove DC components and artifacts"""
-        processed_samples = np.array(samples, dtype=complex)
-        
-        # Remove DC offset from I/Q data
-        if self.remove_dc_offset and len(processed_samples) > 0:
-            # Remove mean from I and Q components separately
-            mean_i = np.mean(processed_samples.real)
-            mean_q = np.mean(processed_samples.imag)
-            processed_samples = processed_samples - complex(mean_i, mean_q)
-        
-        # Remove DC subcarrier (center frequency spike)
-        if self.remove_dc_subcarrier and len(processed_samples) > 2:
-            center_idx = len(processed_samples) // 2
-            # Set center subcarrier to average of neighbors
-            if center_idx > 0 and center_idx < len(processed_samples) - 1:
-                processed_samples[center_idx] = (processed_samples[center_idx - 1] + 
-                                               processed_samples[center_idx + 1]) / 2
-        
-        return processed_samples
+        """Freeze the running mean magnitude of every antenna as baseline for difference calculation"""
+        self.display_stats.clear()
+        if self.worker_pool:
+            # The workers hold the running statistics
+            self.worker_pool.set_baseline()
+            print(f"Baseline requested from {len(self.worker_pool.workers)} workers")
+            return
+        print(f"Baseline set for {self.pipeline.snapshot_baselines()} antennas")
     
-    def create_plots_for_antenna(self, antenna_idx):
+    def channel_name(self, channel):
+        """Plot title of a (source, antenna) channel, the source is only named with several servers"""
+        source, antenna_idx = channel
+        if len(self.servers) > 1:
+            return f"Antenna {antenna_idx} @ {source}"
+        return f"Antenna {antenna_idx}"
+
+    def create_plots_for_antenna(self, channel):
         """Create plots for a new antenna"""
-        if antenna_idx in self.plots:
+        if channel in self.plots:
             return
             
-        row = antenna_idx
+        # One row per channel, in order of appearance
+        row = len(self.plots)
         
         # Magnitude plot (from complex CSI data)
-        self.plots[antenna_idx] = self.plot_widget.addPlot(
-            row=row, col=0, title=f"CSI Magnitude - Antenna {antenna_idx}")
-        self.plots[antenna_idx].setLabel('left', 'Magnitude')
-        self.plots[antenna_idx].setLabel('bottom', 'Subcarrier Index')
-        self.plots[antenna_idx].showGrid(True, True)
+        self.plots[channel] = self.add_plot(row, 0, f"CSI Magnitude - {self.channel_name(channel)}")
+        self.plots[channel].setLabel('left', 'Magnitude')
+        self.plots[channel].setLabel('bottom', 'Subcarrier Index')
+        self.plots[channel].showGrid(True, True)
         
         # Create line for this antenna
-        pen = pg.mkPen(color=(255, 0, 0), width=2)
-        self.plot_lines[antenna_idx] = self.plots[antenna_idx].plot(pen=pen)
+        pen = pg.mkPen(color=(255, 0, 0), width=self.line_width)
+        self.plot_lines[channel] = self.make_curve(self.plots[channel], pen)
         
         # Phase plot (from complex CSI data)
-        self.phase_plots[antenna_idx] = self.plot_widget.addPlot(
-            row=row, col=1, title=f"CSI Phase - Antenna {antenna_idx}")
-        self.phase_plots[antenna_idx].setLabel('left', 'Phase (radians)')
-        self.phase_plots[antenna_idx].setLabel('bottom', 'Subcarrier Index')
-        self.phase_plots[antenna_idx].showGrid(True, True)
-        self.phase_plots[antenna_idx].setYRange(-3.15, 3.15)  # Phase range is [-π, π]
+        self.phase_plots[channel] = self.add_plot(row, 1, f"CSI Phase - {self.channel_name(channel)}")
+        self.phase_plots[channel].setLabel('left', 'Phase (radians)')
+        self.phase_plots[channel].setLabel('bottom', 'Subcarrier Index')
+        self.phase_plots[channel].showGrid(True, True)
+        self.setup_phase_plot(channel)
         
-        pen = pg.mkPen(color=(0, 0, 255), width=2)
-        self.phase_lines[antenna_idx] = self.phase_plots[antenna_idx].plot(pen=pen)
+        pen = pg.mkPen(color=(0, 0, 255), width=self.line_width)
+        self.phase_lines[channel] = self.make_curve(self.phase_plots[channel], pen)
         
         # Magnitude Spectrum plot (FFT of CSI data)
-        self.magnitude_plots[antenna_idx] = self.plot_widget.addPlot(
-            row=row, col=2, title=f"Magnitude Spectrum (FFT) - Antenna {antenna_idx}")
-        self.magnitude_plots[antenna_idx].setLabel('left', 'Magnitude (dB)')
-        self.magnitude_plots[antenna_idx].setLabel('bottom', 'Frequency Bin')
-        self.magnitude_plots[antenna_idx].showGrid(True, True)
+        self.magnitude_plots[channel] = self.add_plot(row, 2, f"Magnitude Spectrum (FFT) - {self.channel_name(channel)}")
+        self.magnitude_plots[channel].setLabel('left', 'Magnitude (dB)')
+        self.magnitude_plots[channel].setLabel('bottom', 'Frequency Bin')
+        self.magnitude_plots[channel].showGrid(True, True)
         
-        pen = pg.mkPen(color=(0, 255, 0), width=2)
-        self.magnitude_lines[antenna_idx] = self.magnitude_plots[antenna_idx].plot(pen=pen)
+        pen = pg.mkPen(color=(0, 255, 0), width=self.line_width)
+        self.magnitude_lines[channel] = self.make_curve(self.magnitude_plots[channel], pen)
         
         # Waterfall plot (CSI magnitude over time)
-        self.waterfall_plots[antenna_idx] = self.plot_widget.addPlot(
-            row=row, col=3, title=f"CSI Waterfall - Antenna {antenna_idx}")
-        self.waterfall_plots[antenna_idx].setLabel('left', 'Time (Newest → Oldest)')
-        self.waterfall_plots[antenna_idx].setLabel('bottom', 'Subcarrier Index')
+        self.waterfall_plots[channel] = self.add_plot(row, 3, f"CSI Waterfall - {self.channel_name(channel)}")
+        self.waterfall_plots[channel].setLabel('left', 'Time (s, newest at 0)')
+        self.waterfall_plots[channel].setLabel('bottom', 'Subcarrier Index')
+        self.waterfall_plots[channel].setYRange(-self.waterfall_span, 0, padding=0)
+        self.waterfall_plots[channel].getViewBox().sigYRangeChanged.connect(
+            lambda *_, channel=channel: self.on_waterfall_range_changed(channel))
         
-        # Create ImageItem for waterfall display
-        self.waterfall_images[antenna_idx] = pg.ImageItem()
-        self.waterfall_plots[antenna_idx].addItem(self.waterfall_images[antenna_idx])
+        # Create ImageItem for waterfall display (rows are time, columns are subcarriers)
+        self.waterfall_images[channel] = pg.ImageItem(axisOrder='row-major')
+        self.waterfall_plots[channel].addItem(self.waterfall_images[channel])
         
         # Set up colormap for waterfall (viridis-like colormap)
         colormap = pg.ColorMap(
             pos=[0.0, 0.25, 0.5, 0.75, 1.0],
             color=[(68, 1, 84), (59, 82, 139), (33, 144, 140), (94, 201, 98), (253, 231, 37)]
         )
-        self.waterfall_images[antenna_idx].setColorMap(colormap)
-        
-        # Initialize waterfall data storage
-        self.waterfall_data[antenna_idx] = []
+        self.waterfall_images[channel].setColorMap(colormap)
+        
+        # Initialize the waterfall history, sized on the first packet
+        self.waterfall_data[channel] = MultiResolutionWaterfall(WATERFALL_ROWS, WATERFALL_TIERS, WATERFALL_FACTOR,
+                                                                self.waterfall_pooling)
+        
+        # Motion score plot (score per packet, threshold as a dashed line)
+        self.motion_plots[channel] = self.add_plot(row, 4, f"Motion Score - {self.channel_name(channel)}")
+        self.motion_plots[channel].setLabel('left', 'Score')
+        self.motion_plots[channel].setLabel('bottom', 'Packet')
+        self.motion_plots[channel].showGrid(True, True)
+        self.motion_plots[channel].addItem(pg.InfiniteLine(
+            pos=self.motion_detector.threshold, angle=0, pen=pg.mkPen(color=(128, 128, 128), style=QtCore.Qt.DashLine)))
+        self.motion_plots[channel].setVisible(self.show_motion)
+        
+        pen = pg.mkPen(color=(255, 128, 0), width=self.line_width)
+        self.motion_lines[channel] = self.make_curve(self.motion_plots[channel], pen)
+        self.motion_history[channel] = deque(maxlen=MOTION_HISTORY_PACKETS)
+        
+        # Doppler spectrogram (time x Doppler frequency, power in dB)
+        self.doppler_plots[channel] = self.add_plot(row, 5, f"Doppler Spectrogram - {self.channel_name(channel)}")
+        self.doppler_plots[channel].setLabel('left', 'Doppler (Hz)')
+        self.doppler_plots[channel].setLabel('bottom', 'Time (Oldest → Newest)')
+        self.doppler_images[channel] = pg.ImageItem(axisOrder='row-major')
+        self.doppler_images[channel].setColorMap(colormap)
+        self.doppler_plots[channel].addItem(self.doppler_images[channel])
+        self.doppler_plots[channel].setVisible(self.show_doppler)
         
         # Initialize history for this antenna
-        self.csi_data_history[antenna_idx] = deque(maxlen=self.max_history_length)
-        
-    def on_data_received(self, csi_data):
-        """Handle received CSI data"""
-        antenna_idx = csi_data.antenna_idx
-        
-        # Create plots for this antenna if they don't exist
-        if antenna_idx not in self.plots:
-            self.create_plots_for_antenna(antenna_idx)
-        
-        # Store data in history
-        self.csi_data_history[antenna_idx].append(csi_data)
-        self.packet_counts[antenna_idx] = csi_data.packet_count
-        
-        # Update plots
-        self.update_plots(antenna_idx, csi_data)
+        self.csi_data_history[channel] = deque(maxlen=self.max_history_length)
+        
+    def setup_phase_plot(self, channel):
+        """Title and range of a phase plot for the current phase processing"""
+        plot = self.phase_plots[channel]
+        self.y_ranges.pop(plot, None)
+        if self.pipeline.sanitize_phase:
+            # Unwrapped residual phase is not confined to [-π, π], update_plots follows the data
+            self.set_title(plot, f"CSI Phase (Sanitized) - {self.channel_name(channel)}")
+        else:
+            self.set_title(plot, f"CSI Phase - {self.channel_name(channel)}")
+            plot.setYRange(-3.15, 3.15)  # Phase range is [-π, π]
+        
+    def on_data_ready(self):
+        """Take everything the receiver handed off since the last call"""
+        self.metrics.record_queue_depth(len(self.handoff))
+        for batch in self.handoff.take():
+            self.on_data_received(batch)
+        
+    def on_data_received(self, batch):
+        """Handle a batch of received CSI data; plots are redrawn by render_frame"""
+        self.metrics.record_batch(batch, time.time())
+        
+        start = time.perf_counter()
+        for csi_data in batch.blocks:
+            # Antennas of different servers get separate plots
+            channel = (csi_data.source, csi_data.antenna_idx)
+            
+            # Create plots for this antenna if they don't exist
+            if channel not in self.plots:
+                self.create_plots_for_antenna(channel)
+            
+            # Store data in history
+            self.csi_data_history[channel].append(csi_data)
+            self.packet_counts[channel] = self.packet_counts.get(channel, 0) + len(csi_data.timestamps)
+            
+            # Process all packets of this antenna at once
+            self.ingest_csi_data(channel, csi_data)
+        self.metrics.record(STAGE_PROCESSING, (time.perf_counter() - start) * 1000)
         
-        # Update info
-        self.update_info_panel()
+        self.info_dirty = True
         
-    def update_plots(self, antenna_idx, csi_data):
-        """Update plots with new CSI data"""
-        if not csi_data.samples:
+    def ingest_csi_data(self, channel, csi_data):
+        """Process a block of new CSI packets and mark the antenna's plots for redraw"""
+        if csi_data.samples.size == 0:
             return
             
-        # Convert complex samples to numpy array and process
-        raw_samples = np.array(csi_data.samples)
-        processed_samples = self.process_csi_samples(raw_samples)
-        
-        # Calculate magnitude and phase from processed complex data
-        magnitude = np.abs(processed_samples)
-        phase = np.angle(processed_samples)
-        
-        # Process data based on selected mode
-        if self.show_amplitude_diff and antenna_idx in self.baseline_data:
-            # Show difference from baseline
-            baseline = self.baseline_data[antenna_idx]
-            if len(baseline) == len(magnitude):
-                processed_magnitude = magnitude - baseline
-                plot_title_suffix = " (Difference from Baseline)"
-            else:
-                processed_magnitude = magnitude
-                plot_title_suffix = " (Raw - Baseline size mismatch)"
+        # DC cleanup, magnitude and baseline difference for all packets at once
+        processed = self.pipeline.process_block(csi_data)
+        self.ingest_processed(channel, processed)
+        
+    def poll_workers(self):
+        """Ingest the frames the worker processes published since the last poll"""
+        for processed in self.worker_pool.read_blocks():
+            channel = (processed.source, processed.antenna_idx)
+            if channel not in self.plots:
+                self.create_plots_for_antenna(channel)
+            self.packet_counts[channel] = self.packet_counts.get(channel, 0) + len(processed.timestamps)
+            self.metrics.record_counts(packets=len(processed.timestamps))
+            self.metrics.record_packet_meta(processed.source, processed.antenna_idx, processed.meta)
+            self.ingest_processed(channel, processed)
+            self.info_dirty = True
+        
+    def ingest_processed(self, channel, processed):
+        """Feed a ProcessedBlock into the waterfall and mark the antenna's plots for redraw"""
+        if processed.baseline_state == BASELINE_APPLIED:
+            plot_title_suffix = " (Difference from Baseline)"
+        elif processed.baseline_state == BASELINE_MISMATCH:
+            plot_title_suffix = " (Raw - Baseline size mismatch)"
         else:
-            # Show raw magnitude
-            processed_magnitude = magnitude
             plot_title_suffix = " (Raw)"
         
-        # Update magnitude plot
-        x_data = np.arange(len(processed_magnitude))
-        self.plot_lines[antenna_idx].setData(x_data, processed_magnitude)
+        # Every packet goes into the waterfall history and the colour level statistics
+        self.update_waterfall_data(channel, processed.magnitude, processed.timestamps)
+        stats = self.display_stats.get(channel)
+        if stats is None or stats.subcarriers != processed.magnitude.shape[-1]:
+            stats = self.display_stats[channel] = ChannelStats(processed.magnitude.shape[-1], window=0)
+        stats.update(processed.magnitude)
+        
+        # ... and into the motion detector, which needs the full packet rate
+        if self.show_motion:
+            self.motion_history[channel].extend(self.motion_detector.update(processed).scores)
+        if self.show_doppler:
+            self.doppler.update(processed)
+        if self.dataset:
+            self.dataset.add(processed)
+        
+        # Only the newest packet is shown in the line plots; copied, processed may view shared memory
+        phase = processed.sanitized_phase[-1].copy() if processed.sanitized_phase is not None else None
+        self.latest_frames[channel] = (processed.samples[-1].copy(), processed.magnitude[-1].copy(),
+                                       plot_title_suffix, int(processed.timestamps[-1]), phase)
+        self.dirty_channels.add(channel)
+        
+    def render_frame(self):
+        """Redraw the plots of antennas that received data since the last frame"""
+        try:
+            if self.worker_pool:
+                self.poll_workers()
+            
+            if not self.dirty_channels and not self.info_dirty:
+                return
+            
+            start = time.perf_counter()
+            for channel in self.dirty_channels:
+                self.update_plots(channel)
+            
+            if self.info_dirty:
+                self.info_dirty = False
+                self.update_info_panel()
+            
+            # Header timestamp (ms) of the newest packet drawn -> now
+            now_ms = time.time() * 1000
+            self.metrics.record(STAGE_LATENCY, [now_ms - float(self.latest_frames[channel][3])
+                                                for channel in self.dirty_channels])
+            self.dirty_channels.clear()
+            self.metrics.record(STAGE_RENDER, (time.perf_counter() - start) * 1000)
+            self.metrics.frames += 1
+        except Exception as e:
+            print(f"Error rendering plots: {e}", file=sys.stderr)
+        
+    def update_plots(self, channel):
+        """Update plots with the newest processed CSI packet of an antenna"""
+        processed_samples, processed_magnitude, plot_title_suffix, _, phase = self.latest_frames[channel]
+        
+        # Calculate phase from processed complex data, unless the pipeline sanitized it
+        sanitized = phase is not None
+        if not sanitized:
+            phase = np.angle(processed_samples)
+        
+        # Update magnitude plot; x axes are shared arrays, ranges only change when the data leave them
+        num_subcarriers = len(processed_magnitude)
+        x_data = self.x_axis(num_subcarriers)
+        self.plot_lines[channel].setData(x_data, processed_magnitude)
+        self.set_x_range(self.plots[channel], 0, num_subcarriers - 1)
+        if channel in self.display_stats:
+            self.update_y_range(self.plots[channel], *self.display_stats[channel].levels())
         
         # Update magnitude plot title
-        self.plots[antenna_idx].setTitle(f"CSI Magnitude - Antenna {antenna_idx}{plot_title_suffix}")
+        self.set_title(self.plots[channel], f"CSI Magnitude - {self.channel_name(channel)}{plot_title_suffix}")
         
         # Update phase plot (always use raw phase, not difference)
-        self.phase_lines[antenna_idx].setData(x_data, phase)
+        self.phase_lines[channel].setData(x_data, phase)
+        self.set_x_range(self.phase_plots[channel], 0, num_subcarriers - 1)
+        if sanitized:
+            self.update_y_range(self.phase_plots[channel], phase.min(), phase.max())
         
         # Compute and update magnitude spectrum (FFT) - use complex samples for meaningful FFT
         if len(processed_samples) > 1:
             # Compute FFT of processed complex CSI data
-            fft_data = np.fft.fft(processed_samples)
-            magnitude_spectrum = np.abs(fft_data)
-            magnitude_spectrum_db = 20 * np.log10(magnitude_spectrum + 1e-10)  # Add small value to avoid log(0)
+            spectrum_db = magnitude_spectrum_db(processed_samples)
             
             # Update magnitude spectrum plot
-            freq_bins = np.arange(len(magnitude_spectrum_db))
-            self.magnitude_lines[antenna_idx].setData(freq_bins, magnitude_spectrum_db)
+            self.magnitude_lines[channel].setData(x_data, spectrum_db)
+            self.set_x_range(self.magnitude_plots[channel], 0, num_subcarriers - 1)
+            self.update_y_range(self.magnitude_plots[channel], spectrum_db.min(), spectrum_db.max())
         
         # Update waterfall plot
-        self.update_waterfall_plot(antenna_idx, processed_magnitude)
+        self.update_waterfall_plot(channel)
         
-    def update_waterfall_plot(self, antenna_idx, magnitude_data):
-        """Update the waterfall plot with new magnitude data"""
-        if antenna_idx not in self.waterfall_data:
-            return
-            
-        # Add new magnitude data to waterfall history
-        self.waterfall_data[antenna_idx].append(magnitude_data.copy())
+        # Update motion score plot
+        if self.show_motion and self.motion_history[channel]:
+            self.motion_lines[channel].setData(np.fromiter(self.motion_history[channel], dtype=np.float64))
         
-        # Limit the number of rows (time samples)
-        if len(self.waterfall_data[antenna_idx]) > self.waterfall_max_rows:
-            self.waterfall_data[antenna_idx].pop(0)
+        # Update Doppler spectrogram
+        if self.show_doppler:
+            self.update_doppler_plot(channel)
         
-        # Convert to numpy array for display
-        if len(self.waterfall_data[antenna_idx]) > 1:
-            waterfall_array = np.array(self.waterfall_data[antenna_idx])
-            
-            # Ensure consistent array shape by padding shorter arrays with zeros
-            max_length = max(len(row) for row in self.waterfall_data[antenna_idx])
-            padded_data = []
-            for row in self.waterfall_data[antenna_idx]:
-                if len(row) < max_length:
-                    padded_row = np.pad(row, (0, max_length - len(row)), 'constant', constant_values=0)
-                    padded_data.append(padded_row)
-                else:
-                    padded_data.append(row)
-            
-            waterfall_array = np.array(padded_data)
-            
-            # Transpose so time is on Y-axis (rows) and subcarriers on X-axis (columns)
-            # Note: Most recent data should be at the top, so we flip the array
-            waterfall_array = np.flipud(waterfall_array)
-            
-            # Update the image with proper scaling
-            self.waterfall_images[antenna_idx].setImage(
-                waterfall_array,
-                autoLevels=False,  # Use manual levels for better control
-                autoDownsample=True
-            )
-            
-            # Set manual levels for better contrast
-            data_min = np.min(waterfall_array)
-            data_max = np.max(waterfall_array)
-            if data_max > data_min:
-                self.waterfall_images[antenna_idx].setLevels([data_min, data_max])
-            
-            # Set the correct positioning and scaling
-            num_time_samples = len(self.waterfall_data[antenna_idx])
-            num_subcarriers = waterfall_array.shape[1]
-            
-            # Set the image rectangle (x, y, width, height)
-            # Position image so that bottom is time=0 and top is most recent
-            self.waterfall_images[antenna_idx].setRect(
-                QtCore.QRectF(0, 0, num_subcarriers, num_time_samples)
+    def update_waterfall_data(self, channel, magnitude_data, timestamps):
+        """Append new magnitude data to the waterfall history (one row per packet, pooled into the older tiers)"""
+        if channel not in self.waterfall_data:
+            return
+        
+        # A bandwidth change restarts the history with the new row width
+        self.waterfall_data[channel].append(magnitude_data, timestamps)
+        
+    def update_waterfall_plot(self, channel):
+        """Update the waterfall plot with the visible time span of the waterfall history"""
+        waterfall = self.waterfall_data[channel]
+        stats = self.display_stats.get(channel)
+        
+        if waterfall.count > 1 and stats is not None:
+            # Rows of the finest tier that covers the visible span (a view, at most WATERFALL_ROWS rows),
+            # newest row at the top; manual levels are passed along so the image is rendered once
+            plot = self.waterfall_plots[channel]
+            low, high = plot.getViewBox().viewRange()[1]
+            rows, times, resolution = waterfall.span(min(low, 0), min(high, 0))
+            if len(rows) < 2 or times[-1] <= times[0]:
+                return
+            data_min, data_max = stats.levels()
+            self.waterfall_images[channel].setImage(
+                rows,
+                autoLevels=False,
+                levels=(data_min, data_max if data_max > data_min else data_min + 1),
+                autoDownsample=self.decimate
             )
             
-            # Update plot range to show the full waterfall
-            self.waterfall_plots[antenna_idx].setXRange(0, num_subcarriers)
-            self.waterfall_plots[antenna_idx].setYRange(0, num_time_samples)
+            # Set the image rectangle (x, y, width, height) in seconds relative to the newest packet;
+            # the newest row ends at its own time, which trails the newest packet by up to one pooled row
+            row_height = (times[-1] - times[0]) / (len(times) - 1)
+            self.set_image_rect(self.waterfall_images[channel],
+                                (0, times[0] - row_height, waterfall.subcarriers, times[-1] - times[0] + row_height))
+            self.set_x_range(plot, 0, waterfall.subcarriers)
+            self.set_title(plot, f"CSI Waterfall - {self.channel_name(channel)}"
+                                 + (f" ({resolution} packets/row)" if resolution > 1 else ""))
+        
+    def update_doppler_plot(self, channel):
+        """Update the Doppler spectrogram from the channel's sliding DFT columns"""
+        spectrogram = self.doppler.channels.get(channel)
+        if spectrogram is None or spectrogram.count < 2:
+            return
+        
+        # Rows are Doppler bins (y), columns are time (x)
+        columns = spectrogram.view()
+        self.doppler_images[channel].setImage(columns.T, autoLevels=False, levels=(columns.min(), columns.max()))
+        
+        # Bins are evenly spaced up to half the packet rate
+        max_frequency = spectrogram.frequencies()[-1]
+        if max_frequency > 0:
+            self.set_image_rect(self.doppler_images[channel], (0, 0, spectrogram.count, max_frequency))
         
     def update_info_panel(self):
         """Update the information panel"""
         try:
-            current_time = time.time()
-            self.fps = 1.0 / (current_time - self.last_update_time) if current_time > self.last_update_time else 0
-            self.last_update_time = current_time
+            # Frames actually rendered during the last metrics interval
+            if self.metrics.snapshot is not None:
+                self.fps = self.metrics.snapshot["frames_per_s"]
             
             # Count active antennas
             active_antennas = len(self.csi_data_history)
@@ -532,29 +902,50 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
             
             # Get sample count info from the most recent data
             sample_info = ""
-            if self.csi_data_history:
-                for antenna_idx, history in self.csi_data_history.items():
-                    if history:
-                        latest_data = history[-1]
-                        sample_count = len(latest_data.samples)
-                        sample_info = f" | Samples per packet: {sample_count}"
-                        break
+            for _, latest_magnitude, _, _, _ in self.latest_frames.values():
+                sample_info = f" | Samples per packet: {len(latest_magnitude)}"
+                break
             
             info_text = f"Active Antennas: {active_antennas} | Total Packets: {total_packets} | FPS: {self.fps:.1f}{sample_info}"
+            if len(self.servers) > 1:
+                active_sources = len({source for source, _ in self.csi_data_history})
+                info_text = f"Sources: {active_sources}/{len(self.servers)} | {info_text}"
+            if self.show_motion:
+                motion = " (MOTION)" if self.motion_detector.motion else ""
+                info_text += f" | Motion: {self.motion_detector.combined_score:.2f}{motion}"
+            if self.dataset:
+                dropped = f", {self.dataset.dropped} dropped" if self.dataset.dropped else ""
+                info_text += f" | Dataset: {self.dataset.rows} packets{dropped}"
             
             # Check if widgets still exist before updating
             if hasattr(self, 'info_label') and self.info_label is not None:
                 self.info_label.setText(info_text)
             
             # Update window title
-            self.setWindowTitle(f"CSI Visualizer - Port {self.server_port} | FPS: {self.fps:.1f}")
+            ports = ", ".join(str(server_port) for _, server_port in self.servers)
+            self.setWindowTitle(f"CSI Visualizer - Port {ports} | FPS: {self.fps:.1f}")
         except Exception as e:
             # Silently ignore errors during shutdown
             pass
         
     def update_fps(self):
-        """Update FPS display"""
+        """Roll the metrics interval and update the FPS and stats displays"""
         try:
+            if self.worker_pool:
+                datagrams, malformed, kernel_drops = self.worker_pool.counters()
+                self.metrics.record_counts(datagrams=datagrams, kernel_drops=kernel_drops, malformed=malformed)
+                for source, status in self.worker_pool.capture_status().items():
+                    self.metrics.record_capture_status(source, status)
+                self.metrics.record_ring_overruns(self.worker_pool.overruns)
+                self.metrics.rcvbuf = self.worker_pool.rcvbuf
+            else:
+                self.metrics.rcvbuf = self.receiver.rcvbuf or 0
+                self.metrics.record_handoff_drops(self.handoff.drop_counts())
+            snapshot = self.metrics.roll()
+            if self.metrics_logger:
+                self.metrics_logger.write(snapshot)
+            if self.stats_label.isVisible():
+                self.stats_label.setText(format_snapshot(snapshot))
             if hasattr(self, 'info_label') and self.info_label is not None:
                 self.update_info_panel()
         except Exception as e:
@@ -566,13 +957,26 @@ class CSIVisualizerWindow(QtWidgets.QMainWindow):
         try:
             print("Closing application...")
             
-            # Stop timer first to prevent further callbacks
+            # Stop timers first to prevent further callbacks
             if hasattr(self, 'update_timer') and self.update_timer.isActive():
                 self.update_timer.stop()
+            if hasattr(self, 'render_timer') and self.render_timer.isActive():
+                self.render_timer.stop()
+            if self.metrics_logger:
+                self.metrics_logger.close()
+                self.metrics_logger = None
             
             # Stop receiver
             if hasattr(self, 'receiver'):
                 self.receiver.stop_receiving()
+            if self.worker_pool:
+                self.worker_pool.stop()
+                self.worker_pool = None
+            if self.dataset:
+                self.dataset.close()
+                failed = f", some blocks failed: {self.dataset.error}" if self.dataset.error else ""
+                print(f"Wrote {self.dataset.rows} packets in {self.dataset.chunks} chunks to {self.dataset.path}{failed}")
+                self.dataset = None
             
             # Wait for thread to finish
             if hasattr(self, 'receiver_thread') and self.receiver_thread.isRunning():
@@ -591,12 +995,62 @@ def signal_handler(signum, frame):
     QtWidgets.QApplication.quit()
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: ./csi_udp_client_gui.py <server_ip> <server_port>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="CSI visualizer for CSIdump")
+    parser.add_argument("server_ip")
+    parser.add_argument("server_port", type=int)
+    parser.add_argument("--server", type=server_address, action="append", default=[], metavar="HOST:PORT",
+                        help="additional CSIdump server to receive from, may be repeated")
+    parser.add_argument("--encoding", choices=sorted(ENCODINGS), default="float64",
+                        help="sample encoding requested from the server (default: float64)")
+    parser.add_argument("--aggregate", type=int, metavar="BYTES",
+                        help="ask the server to pack packets into datagrams of up to BYTES "
+                             "(1472 fits an Ethernet MTU, at most 65507)")
+    parser.add_argument("--mix-antennas", action="store_true",
+                        help="with --aggregate, let packets of different antennas share a datagram")
+    parser.add_argument("--rcvbuf", type=int, metavar="BYTES",
+                        help="kernel socket receive buffer size")
+    parser.add_argument("--packet-meta", action="store_true",
+                        help="ask the server for the driver fields of every packet, to count sequence gaps "
+                             "and measure hardware timestamp jitter")
+    parser.add_argument("--capture-status", action="store_true",
+                        help="ask the servers for their capture scheduler status (rate, dump size, late cycles), "
+                             "shown with the stats")
+    parser.add_argument("--multicast-interface", metavar="IP",
+                        help="address of the interface to join multicast groups on, when a server is a "
+                             "multicast group (default: any)")
+    parser.add_argument("--queue-policy", choices=HANDOFF_POLICIES, default="latest",
+                        help="what the receiver does when the GUI falls behind: keep the newest blocks per "
+                             "antenna, drop the oldest blocks overall, or block (default: latest)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_HANDOFF_CAPACITY, metavar="BLOCKS",
+                        help="pending blocks per antenna (latest) or in total before the policy applies "
+                             f"(default: {DEFAULT_HANDOFF_CAPACITY})")
+    parser.add_argument("--workers", action="store_true",
+                        help="receive and process in worker processes, one per server and antenna group")
+    parser.add_argument("--antenna-groups", type=int, default=1, metavar="N",
+                        help="with --workers, split every server's antennas over N workers (default: 1)")
+    parser.add_argument("--motion-threshold", type=float, default=3.0,
+                        help="combined motion score above which motion is reported (default: 3.0)")
+    parser.add_argument("--doppler-subcarriers", type=parse_subcarriers, metavar="START:STOP[:STEP]|I,J,...",
+                        help="subcarriers for the Doppler spectrogram (default: 16 spread over the band)")
+    parser.add_argument("--opengl", action="store_true",
+                        help="render the plots with OpenGL (requires PyOpenGL)")
+    parser.add_argument("--no-decimate", action="store_true",
+                        help="draw every point of the line plots instead of decimating to the pixel width")
+    parser.add_argument("--line-width", type=int, default=2, choices=(1, 2, 3),
+                        help="line plot pen width, 1 is much faster without OpenGL (default: 2)")
+    parser.add_argument("--dataset", metavar="DIR",
+                        help="stream processed packets into a chunked, time-indexed dataset directory")
+    parser.add_argument("--dataset-content", choices=sorted(CONTENTS), default="complex",
+                        help="what --dataset stores per packet: complex samples or magnitude and phase "
+                             "(default: complex)")
+    parser.add_argument("--metrics-jsonl", metavar="FILE",
+                        help="append a metrics snapshot as a JSON line every metrics interval")
+    parser.add_argument("--metrics-interval", type=float, default=1.0,
+                        help="seconds per metrics interval (default: 1.0)")
+    args = parser.parse_args()
     
-    server_ip = sys.argv[1]
-    server_port = int(sys.argv[2])
+    server_ip = args.server_ip
+    server_port = args.server_port
     
     # Set up signal handler for Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
@@ -607,10 +1061,15 @@ def main():
     app.setStyle('Fusion')
     
     # Create and show main window
-    window = CSIVisualizerWindow(server_ip, server_port)
+    window = CSIVisualizerWindow(server_ip, server_port, args.rcvbuf, args.metrics_interval, args.metrics_jsonl,
+                                 args.encoding, args.aggregate, args.mix_antennas, args.server, args.workers,
+                                 args.antenna_groups, args.motion_threshold, args.doppler_subcarriers,
+                                 not args.no_decimate, args.opengl, args.line_width, args.dataset,
+                                 args.dataset_content, args.packet_meta, args.queue_policy, args.queue_size,
+                                 args.multicast_interface, args.capture_status)
     window.show()
     
-    print(f"CSI Visualizer started, connecting to {server_ip}:{server_port}")
+    print(f"CSI Visualizer started, connecting to {window.servers_text()}")
     print("Press Ctrl+C to exit")
     
     # Enable timer to process events during signal handling
@@ -630,6 +1089,8 @@ def main():
         if hasattr(window, 'receiver_thread') and window.receiver_thread.isRunning():
             window.receiver_thread.quit()
             window.receiver_thread.wait(3000)
+        if window.worker_pool:
+            window.worker_pool.stop()
     
     sys.exit(exit_code)
 
@@ -0,0 +1,287 @@
+#include "csi_udp_sender.h"
+
+#include <iostream>
+#include <cstring>
+#include <cerrno>
+#include <netinet/in.h>
+#include <arpa/inet.h>
+
+static size_t csiHeaderSize(const UdpClient& client)
+{
+    return client.headerVersion == CSI_HEADER_VERSION_2 ? sizeof(CsiPacketHeaderV2) : sizeof(CsiPacketHeader);
+}
+
+static size_t csiSampleSize(const UdpClient& client)
+{
+    if (client.headerVersion == CSI_HEADER_VERSION_2) {
+        if (client.sampleFormat == CSI_SAMPLE_FLOAT32)
+            return sizeof(CsiSampleF32);
+        if (client.sampleFormat == CSI_SAMPLE_INT16)
+            return sizeof(CsiSampleI16);
+    }
+    return sizeof(CsiSample);
+}
+
+static size_t csiDatagramSize(const UdpClient& client, size_t packetCount, size_t samples)
+{
+    size_t tableSize = client.mixAntennas ? packetCount * sizeof(uint16_t) : 0;
+    size_t metaSize = client.packetMeta ? packetCount * sizeof(CsiPacketMeta) : 0;
+    return csiHeaderSize(client) + tableSize + metaSize + samples * csiSampleSize(client);
+}
+
+size_t CsiUdpSender::send(int sock, const std::vector<CsiAntennaPackets>& perAntenna,
+                          const std::vector<UdpClient>& clients, uint64_t timestamp)
+{
+    // Antenna by antenna, the order packets were always sent in
+    packets.clear();
+    for (size_t ant = 0; ant < perAntenna.size(); ant++) {
+        const CsiAntennaPackets& antenna = perAntenna[ant];
+        for (size_t p = 0; p < antenna.size(); p++) {
+            if (antenna.samples(p))
+                packets.push_back({ static_cast<uint32_t>(ant), antenna.packet(p),
+                                    static_cast<uint32_t>(antenna.samples(p)), antenna.records[p] });
+        }
+    }
+
+    if (packets.empty()) {
+        return 0;
+    }
+
+    for (auto& entry : datagramsByFormat)
+        entry.second.built = false;
+
+    size_t sent = 0;
+    for (UdpClient client : clients) {
+        if (client.headerVersion != CSI_HEADER_VERSION_2) {
+            client.headerVersion = CSI_HEADER_VERSION_1;
+            client.sampleFormat = CSI_SAMPLE_FLOAT64;
+        } else if (client.sampleFormat > CSI_SAMPLE_INT16) {
+            client.sampleFormat = CSI_SAMPLE_FLOAT64;
+        }
+
+        // Serialized once per distinct client format, on first use
+        auto key = std::make_tuple(client.headerVersion, client.sampleFormat, client.aggregateBytes, client.mixAntennas,
+                                   client.packetMeta, client.antennaMask);
+        Datagrams& datagrams = datagramsByFormat[key];
+        if (!datagrams.built)
+            buildDatagrams(timestamp, client, datagrams);
+
+        sent += sendDatagrams(sock, client, datagrams);
+    }
+    return sent;
+}
+
+// Greedily packs consecutive packets of equal length into datagrams no larger than
+// client.aggregateBytes. A packet that does not fit on its own is still sent alone.
+// Only packets of the antennas in client.antennaMask are packed, if it is set.
+void CsiUdpSender::buildDatagrams(uint64_t timestamp, const UdpClient& client, Datagrams& datagrams)
+{
+    const std::vector<CsiPacketRef>* source = &packets;
+    if (client.antennaMask) {
+        selected.clear();
+        for (const CsiPacketRef& packet : packets) {
+            if (packet.antennaIdx < 32 && (client.antennaMask >> packet.antennaIdx) & 1)
+                selected.push_back(packet);
+        }
+        source = &selected;
+    }
+    const std::vector<CsiPacketRef>& packets = *source;
+
+    // First pass: packets per datagram and the total size, so the buffer is sized once
+    counts.clear();
+    size_t total = 0;
+    size_t start = 0;
+    while (start < packets.size()) {
+        uint32_t samples = packets[start].samples;
+        size_t count = 1;
+        if (client.aggregateBytes) {
+            while (start + count < packets.size()) {
+                const CsiPacketRef& next = packets[start + count];
+                if (next.samples != samples)
+                    break;
+                if (!client.mixAntennas && next.antennaIdx != packets[start].antennaIdx)
+                    break;
+                if (csiDatagramSize(client, count + 1, (count + 1) * samples) > client.aggregateBytes)
+                    break;
+                count++;
+            }
+        }
+        counts.push_back(count);
+        total += csiDatagramSize(client, count, count * samples);
+        start += count;
+    }
+
+    if (datagrams.data.size() < total)
+        datagrams.data.resize(total);
+    datagrams.ends.clear();
+
+    // Second pass: serialize straight into the buffer
+    size_t offset = 0;
+    start = 0;
+    for (size_t count : counts) {
+        offset += serializeCsiPackets(&packets[start], count, timestamp, client, datagrams.data.data() + offset);
+        datagrams.ends.push_back(offset);
+        start += count;
+    }
+    datagrams.built = true;
+}
+
+size_t CsiUdpSender::serializeCsiPackets(const CsiPacketRef* packets, size_t count, uint64_t timestamp,
+                                         const UdpClient& client, uint8_t* out)
+{
+    uint32_t totalSamples = 0;
+    for (size_t p = 0; p < count; p++) {
+        totalSamples += packets[p].samples;
+    }
+
+    size_t headerSize = csiHeaderSize(client);
+    size_t sampleSize = csiSampleSize(client);
+    uint8_t sampleFormat = client.headerVersion == CSI_HEADER_VERSION_2 ? client.sampleFormat
+                                                                         : static_cast<uint8_t>(CSI_SAMPLE_FLOAT64);
+
+    // Create header
+    CsiPacketHeaderV2 header;
+    header.timestamp = timestamp;
+    header.antenna_idx = client.mixAntennas ? CSI_ANTENNA_MIXED : packets[0].antennaIdx;
+    header.packet_count = static_cast<uint32_t>(count);
+    header.total_samples = totalSamples;
+    header.version = client.headerVersion;
+    header.sample_format = sampleFormat;
+    header.flags = (client.mixAntennas ? CSI_FLAG_ANTENNA_TABLE : 0) | (client.packetMeta ? CSI_FLAG_PACKET_META : 0);
+
+    // Copy header, version 1 is the leading part of version 2
+    uint8_t* ptr = out;
+    memcpy(ptr, &header, headerSize);
+    ptr += headerSize;
+
+    if (client.mixAntennas) {
+        for (size_t p = 0; p < count; p++) {
+            uint16_t antennaIdx = static_cast<uint16_t>(packets[p].antennaIdx);
+            memcpy(ptr, &antennaIdx, sizeof(antennaIdx));
+            ptr += sizeof(antennaIdx);
+        }
+    }
+
+    if (client.packetMeta) {
+        for (size_t p = 0; p < count; p++) {
+            CsiPacketMeta meta = {};
+            const csi_data* csi = packets[p].csi;
+            if (csi) {
+                meta.ts = csi->ts;
+                meta.pkt_sn = csi->pkt_sn;
+                meta.tx_idx = csi->tx_idx;
+                meta.rx_idx = csi->rx_idx;
+                meta.rssi = csi->rssi;
+                meta.snr = csi->snr;
+                meta.ch_bw = csi->ch_bw;
+                memcpy(meta.ta, csi->ta, ETH_ALEN);
+            }
+            memcpy(ptr, &meta, sizeof(meta));
+            ptr += sizeof(meta);
+        }
+    }
+
+    // Copy CSI data as I/Q pairs
+    for (size_t p = 0; p < count; p++) {
+        const int16_t* iq = packets[p].iq;
+        size_t values = 2 * packets[p].samples;
+        if (sampleFormat == CSI_SAMPLE_INT16) {
+            // Same layout as the parsed driver values
+            memcpy(ptr, iq, values * sizeof(int16_t));
+        } else if (sampleFormat == CSI_SAMPLE_FLOAT32) {
+            for (size_t i = 0; i < values; i++) {
+                float value = iq[i];
+                memcpy(ptr + i * sizeof(float), &value, sizeof(value));
+            }
+        } else {
+            for (size_t i = 0; i < values; i++) {
+                double value = iq[i];
+                memcpy(ptr + i * sizeof(double), &value, sizeof(value));
+            }
+        }
+        ptr += packets[p].samples * sampleSize;
+    }
+
+    return ptr - out;
+}
+
+void CsiUdpSender::sendStatus(int sock, const CsiCaptureStatus& status, const std::vector<UdpClient>& clients,
+                              uint64_t timestamp)
+{
+    CsiPacketHeaderV2 header = {};
+    header.timestamp = timestamp;
+    header.antenna_idx = CSI_ANTENNA_MIXED;
+    header.version = CSI_HEADER_VERSION_2;
+    header.flags = CSI_FLAG_CAPTURE_STATUS;
+
+    uint8_t buffer[sizeof(header) + sizeof(status)];
+    memcpy(buffer, &header, sizeof(header));
+    memcpy(buffer + sizeof(header), &status, sizeof(status));
+
+    for (const UdpClient& client : clients) {
+        if (!client.captureStatus || client.headerVersion != CSI_HEADER_VERSION_2)
+            continue;
+
+        struct sockaddr_in clientAddr;
+        memset(&clientAddr, 0, sizeof(clientAddr));
+        clientAddr.sin_family = AF_INET;
+        clientAddr.sin_port = htons(client.port);
+        if (inet_pton(AF_INET, client.ip.c_str(), &clientAddr.sin_addr) <= 0)
+            continue;
+
+        if (sendto(sock, buffer, sizeof(buffer), 0, (struct sockaddr*)&clientAddr, sizeof(clientAddr)) < 0)
+            std::cerr << "Failed to send capture status to " << client.ip << ":" << client.port << ": " << strerror(errno) << std::endl;
+    }
+}
+
+size_t CsiUdpSender::sendDatagrams(int sock, const UdpClient& client, const Datagrams& datagrams)
+{
+    struct sockaddr_in clientAddr;
+    memset(&clientAddr, 0, sizeof(clientAddr));
+    clientAddr.sin_family = AF_INET;
+    clientAddr.sin_port = htons(client.port);
+
+    // Convert IP address
+    if (inet_pton(AF_INET, client.ip.c_str(), &clientAddr.sin_addr) <= 0) {
+        return 0;
+    }
+
+    size_t count = datagrams.ends.size();
+    iovecs.resize(count);
+    messages.resize(count);
+    size_t start = 0;
+    for (size_t d = 0; d < count; d++) {
+        iovecs[d].iov_base = const_cast<uint8_t*>(datagrams.data.data()) + start;
+        iovecs[d].iov_len = datagrams.ends[d] - start;
+        memset(&messages[d], 0, sizeof(messages[d]));
+        messages[d].msg_hdr.msg_name = &clientAddr;
+        messages[d].msg_hdr.msg_namelen = sizeof(clientAddr);
+        messages[d].msg_hdr.msg_iov = &iovecs[d];
+        messages[d].msg_hdr.msg_iovlen = 1;
+        start = datagrams.ends[d];
+    }
+
+    // sendmmsg may send fewer messages than asked for, e.g. more than UIO_MAXIOV. It stops at
+    // a message that fails and reports the error on the next call, if it was the first one:
+    // that datagram is skipped and the rest of the dump still goes out, like with one sendto each.
+    size_t next = 0;
+    size_t failed = 0;
+    int error = 0;
+    while (next < count) {
+        int result = sendmmsg(sock, messages.data() + next, count - next, 0);
+        if (result < 0) {
+            if (errno == EINTR)
+                continue;
+            error = errno;
+            failed++;
+            next++;
+            continue;
+        }
+        next += result;
+    }
+    if (failed) {
+        std::cerr << "Failed to send " << failed << " of " << count << " datagrams to " << client.ip << ":"
+                  << client.port << ": " << strerror(error) << std::endl;
+    }
+    return count - failed;
+}
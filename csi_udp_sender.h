@@ -0,0 +1,135 @@
+#pragma once
+
+#include <map>
+#include <string>
+#include <tuple>
+#include <vector>
+#include <cstdint>
+#include <sys/socket.h>
+
+#include "wifi_drv_api/mt76_api.h"
+#include "parsers/parser.h"
+#include "capture_scheduler.h"
+
+struct CsiPacketHeader {
+    uint64_t timestamp;
+    uint32_t antenna_idx;
+    uint32_t packet_count;
+    uint32_t total_samples;
+} __attribute__((packed));
+
+struct CsiSample {
+    double i;  // In-phase component
+    double q;  // Quadrature component
+} __attribute__((packed));
+
+// Sample encodings a client can request at registration ("register encoding=int16")
+enum CsiSampleFormat : uint8_t {
+    CSI_SAMPLE_FLOAT64 = 0,  // CsiSample
+    CSI_SAMPLE_FLOAT32 = 1,  // CsiSampleF32
+    CSI_SAMPLE_INT16 = 2,    // CsiSampleI16, raw driver values
+};
+
+#define CSI_HEADER_VERSION_1 1  // CsiPacketHeader + CsiSample, sent to plain "register" clients
+#define CSI_HEADER_VERSION_2 2  // CsiPacketHeaderV2, sent to clients that requested any option
+
+struct CsiPacketHeaderV2 {
+    uint64_t timestamp;
+    uint32_t antenna_idx;
+    uint32_t packet_count;
+    uint32_t total_samples;
+    uint8_t version;        // CSI_HEADER_VERSION_2
+    uint8_t sample_format;  // CsiSampleFormat
+    uint16_t flags;         // CSI_FLAG_*
+} __attribute__((packed));
+
+// A uint16_t antenna index per packet follows the header, antenna_idx is CSI_ANTENNA_MIXED
+#define CSI_FLAG_ANTENNA_TABLE 0x0001
+#define CSI_ANTENNA_MIXED 0xFFFFFFFF
+// A CsiPacketMeta per packet follows the header (after the antenna table, if any)
+#define CSI_FLAG_PACKET_META 0x0002
+// Capture status datagram: packet_count and total_samples are 0 and a CsiCaptureStatus follows the header
+#define CSI_FLAG_CAPTURE_STATUS 0x0004
+
+// Largest UDP payload
+#define CSI_MAX_DATAGRAM_SIZE 65507
+
+// Driver fields of one packet, requested with "register meta=1"
+struct CsiPacketMeta {
+    uint32_t ts;        // csi_data.ts, hardware timestamp (us, wraps)
+    uint16_t pkt_sn;    // 802.11 sequence number
+    uint16_t tx_idx;
+    uint16_t rx_idx;
+    int8_t rssi;
+    uint8_t snr;
+    uint8_t ch_bw;      // 0: 20, 1: 40, 2: 80, 3: 160 MHz
+    uint8_t reserved;
+    uint8_t ta[ETH_ALEN];  // Transmitter address
+} __attribute__((packed));
+
+struct CsiSampleF32 {
+    float i;
+    float q;
+} __attribute__((packed));
+
+struct CsiSampleI16 {
+    int16_t i;
+    int16_t q;
+} __attribute__((packed));
+
+// One parsed CSI packet of an antenna, pointing into its CsiAntennaPackets
+struct CsiPacketRef {
+    uint32_t antennaIdx;
+    const int16_t* iq;    // Interleaved I/Q, raw driver values
+    uint32_t samples;     // I/Q pairs
+    const csi_data* csi;  // Driver record the packet was parsed from
+};
+
+struct UdpClient {
+    std::string ip;
+    int port;
+    uint8_t headerVersion;
+    uint8_t sampleFormat;
+    uint16_t aggregateBytes;  // Pack packets into datagrams up to this size, 0 sends one packet per datagram
+    bool mixAntennas;         // Packets of different antennas may share a datagram
+    bool packetMeta;          // Append a CsiPacketMeta per packet
+    bool captureStatus;       // Send CsiCaptureStatus datagrams
+    uint32_t antennaMask;     // Bit i set: send packets of antenna i, 0 sends every antenna
+
+    bool operator==(const UdpClient& other) const { return ip == other.ip && port == other.port; }
+};
+
+// Serializes the packets of a dump for every client and sends them, one sendmmsg per client.
+// Datagrams are serialized once per distinct client format, straight into buffers that are
+// kept from dump to dump, so the steady state allocates nothing.
+class CsiUdpSender
+{
+public:
+    // Sends the dump to every client on sock, returns the number of datagrams sent
+    size_t send(int sock, const std::vector<CsiAntennaPackets>& perAntenna, const std::vector<UdpClient>& clients,
+                uint64_t timestamp);
+    // Sends a capture status datagram to every client that asked for it
+    void sendStatus(int sock, const CsiCaptureStatus& status, const std::vector<UdpClient>& clients,
+                    uint64_t timestamp);
+
+private:
+    // Datagrams of one client format, back to back in data
+    struct Datagrams {
+        std::vector<uint8_t> data;  // Only grows, the used part ends at ends.back()
+        std::vector<size_t> ends;   // End of every datagram in data
+        bool built = false;
+    };
+    using FormatKey = std::tuple<uint8_t, uint8_t, uint16_t, bool, bool, uint32_t>;
+
+    void buildDatagrams(uint64_t timestamp, const UdpClient& client, Datagrams& datagrams);
+    size_t sendDatagrams(int sock, const UdpClient& client, const Datagrams& datagrams);
+    static size_t serializeCsiPackets(const CsiPacketRef* packets, size_t count, uint64_t timestamp,
+                                      const UdpClient& client, uint8_t* out);
+
+    std::vector<CsiPacketRef> packets;
+    std::vector<CsiPacketRef> selected;  // Packets of the antennas a client asked for, while building
+    std::vector<size_t> counts;  // Packets per datagram, while building
+    std::map<FormatKey, Datagrams> datagramsByFormat;
+    std::vector<struct iovec> iovecs;
+    std::vector<struct mmsghdr> messages;
+};
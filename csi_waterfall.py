@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""Bounded waterfall history of CSI magnitude rows, from full rate to hours
+
+WaterfallBuffer is a fixed-size ring of rows (time x subcarriers). The
+multi-resolution history stacks several of them: tier 0 holds the newest
+rows at full packet rate, and every further tier pools factor rows of the
+tier below into one (mean or max), so each tier reaches factor times further
+back with the same number of rows. Memory is tiers x rows x subcarriers no
+matter how long the stream runs, and a view of any time span is a slice of
+the finest tier that still reaches back far enough, at most rows rows.
+"""
+
+import numpy as np
+
+# How factor rows of a tier are pooled into one row of the next
+POOLING = ('mean', 'max')
+
+class WaterfallBuffer:
+    """Fixed-size ring buffer of waterfall rows (time x subcarriers)
+
+    Every row is written twice, at head and head + rows, so the newest rows are
+    always available in chronological order as one contiguous view without
+    rebuilding the array. Colour levels come from the channel's ChannelStats,
+    not from the rows.
+    """
+    def __init__(self, rows, subcarriers, dtype=np.float64):
+        self.rows = rows
+        self.subcarriers = subcarriers
+        self.data = np.zeros((2 * rows, subcarriers), dtype=dtype)
+        self.head = 0  # Next row to be written
+        self.count = 0  # Number of valid rows
+
+    def append(self, block):
+        """Write a (packets, subcarriers) block of rows in place"""
+        block = block[-self.rows:]
+        num_rows = len(block)
+        if num_rows == 0:
+            return
+        idx = (self.head + np.arange(num_rows)) % self.rows
+        self.data[idx] = block
+        self.data[idx + self.rows] = block
+        self.head = (self.head + num_rows) % self.rows
+        self.count = min(self.count + num_rows, self.rows)
+
+    def view(self):
+        """Valid rows, oldest first, as a view into the buffer"""
+        end = self.head + self.rows
+        return self.data[end - self.count:end]
+
+    def resize(self, rows, subcarriers):
+        """Change the history length or row width, keeping the newest rows if the width is unchanged"""
+        if rows == self.rows and subcarriers == self.subcarriers:
+            return
+        newest = self.view().copy() if subcarriers == self.subcarriers else None
+        self.__init__(rows, subcarriers, self.data.dtype)
+        if newest is not None:
+            self.append(newest)
+
+class WaterfallTier:
+    """Rows of one resolution with the header timestamp (ms) of the newest packet of each row"""
+    def __init__(self, rows, subcarriers):
+        self.values = WaterfallBuffer(rows, subcarriers, np.float32)
+        self.times = WaterfallBuffer(rows, 1)
+        self.pending = np.empty((0, subcarriers), dtype=np.float32)  # Rows of the tier below not pooled yet
+        self.pending_times = np.empty(0)
+
+    def append(self, rows, times):
+        self.values.append(rows)
+        self.times.append(times[:, None])
+
+class MultiResolutionWaterfall:
+    """Waterfall history of one channel: full-rate rows plus tiers pooled factor times each
+
+    rows bounds every tier (and so any view), tiers their number; the
+    history reaches back rows * factor^(tiers - 1) packets.
+    """
+    def __init__(self, rows=256, tiers=6, factor=8, pooling='mean'):
+        if pooling not in POOLING:
+            raise ValueError(f"pooling must be one of {', '.join(POOLING)}")
+        self.rows = rows
+        self.factor = factor
+        self.num_tiers = tiers
+        self.pooling = pooling
+        self.subcarriers = 0
+        self.tiers = []
+
+    def reset(self, subcarriers):
+        self.subcarriers = subcarriers
+        self.tiers = [WaterfallTier(self.rows, subcarriers) for _ in range(self.num_tiers)]
+
+    @property
+    def count(self):
+        """Full-rate rows held"""
+        return self.tiers[0].values.count if self.tiers else 0
+
+    def append(self, magnitude, timestamps):
+        """Add a (packets, subcarriers) block with its (packets,) header timestamps (ms)"""
+        if magnitude.shape[-1] != self.subcarriers:
+            # A bandwidth change restarts the history with the new row width
+            self.reset(magnitude.shape[-1])
+        rows = magnitude
+        times = np.asarray(timestamps, dtype=np.float64)
+        for tier, coarser in zip(self.tiers, self.tiers[1:] + [None]):
+            tier.append(rows, times)
+            if coarser is None:
+                break
+            # Whole groups of factor rows move on to the next tier, the rest waits for the next block
+            rows = np.concatenate((coarser.pending, rows))
+            times = np.concatenate((coarser.pending_times, times))
+            complete = len(rows) - len(rows) % self.factor
+            coarser.pending, coarser.pending_times = rows[complete:], times[complete:]
+            if not complete:
+                break
+            groups = rows[:complete].reshape(-1, self.factor, self.subcarriers)
+            rows = groups.max(axis=1) if self.pooling == 'max' else groups.mean(axis=1)
+            times = times[self.factor - 1:complete:self.factor]
+
+    def newest_time(self):
+        """Header timestamp (ms) of the newest row"""
+        return self.tiers[0].times.view()[-1, 0]
+
+    def span(self, start, end):
+        """Rows between start and end seconds relative to the newest packet (both <= 0)
+
+        Returns (rows, times, packets per row): views of the finest tier that
+        reaches back to start, else of the one that reaches furthest; times are
+        seconds relative to the newest packet, oldest row first.
+        """
+        newest = self.newest_time()
+        chosen = None
+        for level, tier in enumerate(self.tiers):
+            if tier.values.count == 0:
+                break
+            oldest = tier.times.view()[0, 0]
+            # A coarser tier is only worth it if it reaches further back
+            if chosen is None or oldest < chosen.times.view()[0, 0]:
+                chosen, resolution = tier, self.factor ** level
+            if oldest <= newest + start * 1000:
+                break
+        times = (chosen.times.view()[:, 0] - newest) / 1000
+        first, last = np.searchsorted(times, [start, end], side='left')
+        # One row beyond either end, so the visible range is covered
+        first, last = max(first - 1, 0), min(last + 1, len(times))
+        return chosen.values.view()[first:last], times[first:last], resolution
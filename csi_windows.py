@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+"""Sliding windows of processed CSI shaped (antennas, subcarriers, time)
+
+Per source the windower keeps one contiguous time-major buffer of rows
+(antennas, subcarriers). A row is written once every antenna has a packet
+for it: packets are paired across antennas by their hardware timestamp when
+the server sends packet metadata, else by arrival order within the same
+header timestamp, and packets another antenna has no partner for are
+dropped. Like WaterfallBuffer, every row is written twice (at i and
+i + capacity), so any window of up to capacity rows is a contiguous slice
+and is handed out as a transposed view, never copied. A window stays valid
+until capacity - length further rows have been written; copy it to keep it.
+"""
+
+import numpy as np
+
+from csi_processing import sanitize_phase
+
+# What a window holds: processed magnitude (baseline removed if applied), sanitized phase or complex samples
+WINDOW_OUTPUTS = {
+    'magnitude': np.float32,
+    'phase': np.float32,
+    'complex': np.complex64,
+}
+
+# Hardware timestamps (us) are uint32 and wrap
+HW_TIMESTAMP_WRAP = 1 << 32
+
+def block_values(processed, output):
+    """(packets, subcarriers) values of a ProcessedBlock for a WINDOW_OUTPUTS key"""
+    if output == 'magnitude':
+        return processed.magnitude
+    if output == 'phase':
+        if processed.sanitized_phase is not None:
+            return processed.sanitized_phase
+        return sanitize_phase(processed.samples)
+    return processed.samples
+
+class CSIWindow:
+    """One window of a source, views into the windower's buffer"""
+    def __init__(self, source, antennas, timestamps, data, end):
+        self.source = source
+        self.antennas = antennas  # Antenna index of every row of data
+        self.timestamps = timestamps  # (time,) header timestamps (ms)
+        self.data = data  # (antennas, subcarriers, time) view
+        self.end = end  # Rows of the source written before the window ended
+
+    def copy(self):
+        return CSIWindow(self.source, self.antennas, self.timestamps.copy(), self.data.copy(), self.end)
+
+class SourceWindows:
+    """Row buffer and per-antenna pending packets of one source"""
+    def __init__(self, antennas, subcarriers, capacity, dtype, wrap):
+        self.antennas = antennas
+        self.subcarriers = subcarriers
+        self.capacity = capacity
+        self.wrap = wrap  # Key modulus, None for header timestamps
+        self.data = np.zeros((2 * capacity, len(antennas), subcarriers), dtype=dtype)
+        self.timestamps = np.zeros(2 * capacity, dtype=np.uint64)
+        self.rows = 0  # Rows written
+        self.pending = {antenna_idx: (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64),
+                                      np.empty((0, subcarriers), dtype=dtype)) for antenna_idx in antennas}
+
+    def difference(self, keys, reference):
+        """keys - reference, wrap-aware for hardware timestamps"""
+        diff = keys - reference
+        if self.wrap:
+            diff = (diff + self.wrap // 2) % self.wrap - self.wrap // 2
+        return diff
+
+    def add(self, antenna_idx, keys, timestamps, values):
+        """Queue packets of one antenna; returns the number dropped to bound the queue"""
+        old_keys, old_timestamps, old_values = self.pending[antenna_idx]
+        keys = np.concatenate((old_keys, keys))
+        timestamps = np.concatenate((old_timestamps, timestamps))
+        values = np.concatenate((old_values, values))
+        excess = max(len(keys) - self.capacity, 0)
+        self.pending[antenna_idx] = (keys[excess:], timestamps[excess:], values[excess:])
+        return excess
+
+    def align(self):
+        """Drop packets older than every other antenna's oldest; returns (rows ready, packets dropped)"""
+        dropped = 0
+        while all(len(keys) for keys, _, _ in self.pending.values()):
+            heads = np.array([keys[0] for keys, _, _ in self.pending.values()])
+            newest = heads[np.argmax(self.difference(heads, heads[0]))]
+            behind = False
+            for antenna_idx, (keys, timestamps, values) in self.pending.items():
+                stale = self.difference(keys, newest) < 0
+                if stale[0]:
+                    keep = np.argmin(stale) if not stale.all() else len(keys)
+                    self.pending[antenna_idx] = (keys[keep:], timestamps[keep:], values[keep:])
+                    dropped += keep
+                    behind = True
+            if behind:
+                continue
+            # Heads match: the rows ready are the common prefix of equal keys
+            count = min(len(keys) for keys, _, _ in self.pending.values())
+            first = self.pending[self.antennas[0]][0][:count]
+            equal = np.logical_and.reduce([keys[:count] == first for keys, _, _ in self.pending.values()])
+            return (count if equal.all() else int(np.argmin(equal))), dropped
+        return 0, dropped
+
+    def write(self, count):
+        """Move count aligned packets of every antenna into the row buffer"""
+        idx = (self.rows + np.arange(count)) % self.capacity
+        for column, antenna_idx in enumerate(self.antennas):
+            keys, timestamps, values = self.pending[antenna_idx]
+            self.data[idx, column] = values[:count]
+            self.data[idx + self.capacity, column] = values[:count]
+            if column == 0:
+                self.timestamps[idx] = timestamps[:count]
+                self.timestamps[idx + self.capacity] = timestamps[:count]
+            self.pending[antenna_idx] = (keys[count:], timestamps[count:], values[count:])
+        self.rows += count
+
+    def window(self, source, end, length):
+        """Window of the rows [end - length, end) as a view"""
+        start = (end - length) % self.capacity
+        return CSIWindow(source, self.antennas, self.timestamps[start:start + length],
+                         self.data[start:start + length].transpose(1, 2, 0), end)
+
+class CSIWindower:
+    """Overlapping windows of length rows every hop rows, per source
+
+    antennas fixes the antennas of a window (in that order); by default every
+    antenna seen from a source is used, and a new one restarts the source's
+    buffer. A change of subcarrier count, output or timestamp kind restarts
+    it as well. capacity (rows, at least length + hop) bounds how long
+    windows stay valid and how many packets wait for a partner per antenna.
+    With a callback, every window is passed to it as it completes.
+    """
+    def __init__(self, length=64, hop=1, output='magnitude', antennas=None, capacity=None, callback=None):
+        if not 0 < hop <= length:
+            raise ValueError("hop must be between 1 and the window length")
+        if output not in WINDOW_OUTPUTS:
+            raise ValueError(f"output must be one of {', '.join(WINDOW_OUTPUTS)}")
+        self.length = length
+        self.hop = hop
+        self.output = output
+        self.antennas = tuple(antennas) if antennas is not None else None
+        self.capacity = max(capacity or 4 * length, length + hop)
+        self.callback = callback
+        self.sources = {}  # source -> SourceWindows
+        self.windows = 0  # Windows produced
+        self.dropped = 0  # Packets without a partner on every antenna
+
+    def reset(self):
+        self.sources.clear()
+
+    def source_state(self, processed, wrap, batch_antennas=()):
+        """SourceWindows for a block, restarted if the block does not fit it"""
+        state = self.sources.get(processed.source)
+        subcarriers = processed.samples.shape[-1]
+        antennas = self.antennas
+        if antennas is None:
+            known = state.antennas if state is not None else ()
+            antennas = tuple(sorted(set(known) | set(batch_antennas) | {processed.antenna_idx}))
+        if (state is None or state.antennas != antennas or state.subcarriers != subcarriers or state.wrap != wrap
+                or state.data.dtype != WINDOW_OUTPUTS[self.output]):
+            state = self.sources[processed.source] = SourceWindows(antennas, subcarriers, self.capacity,
+                                                                   WINDOW_OUTPUTS[self.output], wrap)
+        return state
+
+    def update(self, processed, batch_antennas=()):
+        """Add a ProcessedBlock; returns the windows it completed
+
+        If the block completes more than capacity - length rows, the buffer
+        wraps within the call and the first windows returned are overwritten;
+        the callback still sees every window intact. batch_antennas are the
+        other antennas of the source in the same batch, so a new source starts
+        with all of them.
+        """
+        if self.antennas is not None and processed.antenna_idx not in self.antennas:
+            return []
+        if processed.meta is not None:
+            keys, wrap = processed.meta['ts'].astype(np.int64), HW_TIMESTAMP_WRAP
+        else:
+            keys, wrap = processed.timestamps.astype(np.int64), None
+        state = self.source_state(processed, wrap, batch_antennas)
+        self.dropped += state.add(processed.antenna_idx, keys, processed.timestamps,
+                                  block_values(processed, self.output))
+
+        windows = []
+        while True:
+            ready, dropped = state.align()
+            self.dropped += dropped
+            if not ready:
+                break
+            # Rows in steps that cannot overwrite a window before it is handed out
+            ready = min(ready, self.capacity - self.length)
+            first = state.rows + 1
+            state.write(ready)
+            # Window ends e with e >= length and (e - length) % hop == 0
+            first_end = max(first, self.length)
+            first_end += (-(first_end - self.length)) % self.hop
+            for end in range(first_end, state.rows + 1, self.hop):
+                window = state.window(processed.source, end, self.length)
+                windows.append(window)
+                if self.callback is not None:
+                    self.callback(window)
+        self.windows += len(windows)
+        return windows
+
+    def update_blocks(self, processed_blocks):
+        """Add the ProcessedBlocks of a batch; returns the windows they completed"""
+        batch_antennas = {}
+        for processed in processed_blocks:
+            batch_antennas.setdefault(processed.source, set()).add(processed.antenna_idx)
+        windows = []
+        for processed in processed_blocks:
+            windows.extend(self.update(processed, batch_antennas[processed.source]))
+        return windows
+
+    def iterate(self, processed_batches):
+        """Yield the windows of an iterable of ProcessedBlock lists as they complete"""
+        for processed_blocks in processed_batches:
+            yield from self.update_blocks(processed_blocks)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+"""Process-pool ingestion: receive, decode and process CSI in worker processes
+
+Every worker owns a CSIUdpClient and a CSIPipeline and writes the processed
+packets into a SharedFrameRing, a ring buffer in multiprocessing.shared_memory.
+The consumer (the GUI) reads new rows as numpy views of the shared block, so
+frames are never pickled or copied between processes. Only small control
+messages (processing options, baseline requests) travel through a queue, and
+the server's capture status through another one the other way.
+
+There is one worker per server, or per antenna group of a server. Antenna
+groups register separately with the same server for the antennas with
+antenna_idx % groups == group only ("register antennas=..."), so the server
+sends every packet once in all. Every worker of a multicast group receives
+the whole stream and drops the other groups' antennas itself.
+"""
+
+import sys
+import time
+import queue
+import signal
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+from csi_protocol import CSIUdpClient, PACKET_META_DTYPE, MAX_REGISTER_ANTENNAS, is_multicast
+from csi_processing import CSIPipeline, ProcessedBlock
+
+# Widest packet a ring row holds (160 MHz)
+MAX_SUBCARRIERS = 512
+
+# Rows per ring; packets that arrive while the consumer is a whole ring behind are dropped
+DEFAULT_RING_ROWS = 4096
+
+# Per-row metadata; written is the time.time() the worker published the row, packet_meta
+# the driver fields of the packet if has_packet_meta is set, seq the row's position in the
+# stream (rows written before it), stored last so the consumer can tell a complete row
+FRAME_META_DTYPE = np.dtype([('timestamp', '<u8'), ('written', '<f8'), ('antenna_idx', '<u4'),
+                             ('width', '<u4'), ('baseline_state', '<u4'), ('phase_sanitized', '<u4'),
+                             ('has_packet_meta', '<u4'), ('packet_meta', PACKET_META_DTYPE), ('seq', '<u8')])
+
+# uint64 counters at the start of the shared block
+COUNTER_WRITTEN = 0  # Rows published so far
+COUNTER_DATAGRAMS = 1  # Datagrams received by the worker
+COUNTER_KERNEL_DROPS = 2  # Cumulative SO_RXQ_OVFL counter of the worker's socket
+COUNTER_MALFORMED = 3  # Datagrams the worker could not decode
+COUNTER_READ = 4  # Rows the consumer is done with; the producer never writes past COUNTER_READ + rows
+COUNTER_OVERRUNS = 5  # Rows the producer dropped because the ring was full
+COUNTER_RCVBUF = 6  # Actual kernel receive buffer size of the worker's socket
+NUM_COUNTERS = 8
+
+class SharedFrameRing:
+    """Single-producer, single-consumer ring of processed packets in shared memory
+
+    Layout: counters, then per row metadata, processed samples (complex128),
+    magnitude (float64) and sanitized phase (float64, valid if the row's
+    phase_sanitized flag is set), rows wide enough for MAX_SUBCARRIERS. The producer
+    fills rows and publishes them by advancing the written counter last. The
+    consumer reads everything between its position and that counter, and hands
+    the rows back with the read counter on its next read. The producer only
+    writes rows the consumer has handed back; when the ring is full it drops
+    the oldest packets of the block and counts them as overruns.
+
+    Python has no memory fences, so the consumer does not rely on the written
+    counter alone: a row is only taken once its seq field, stored after the
+    row's data, matches its position. Rows not complete yet are read next time.
+    """
+    def __init__(self, rows=DEFAULT_RING_ROWS, width=MAX_SUBCARRIERS, name=None):
+        self.rows = rows
+        self.width = width
+        sizes = [NUM_COUNTERS * 8, rows * FRAME_META_DTYPE.itemsize, rows * width * 16, rows * width * 8,
+                 rows * width * 8]
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        offsets = np.cumsum([0] + sizes)
+        buf = self.shm.buf
+        self.counters = np.ndarray((NUM_COUNTERS,), dtype=np.uint64, buffer=buf, offset=offsets[0])
+        self.meta = np.ndarray((rows,), dtype=FRAME_META_DTYPE, buffer=buf, offset=offsets[1])
+        self.samples = np.ndarray((rows, width), dtype=complex, buffer=buf, offset=offsets[2])
+        self.magnitude = np.ndarray((rows, width), dtype=np.float64, buffer=buf, offset=offsets[3])
+        self.phase = np.ndarray((rows, width), dtype=np.float64, buffer=buf, offset=offsets[4])
+        if self.owner:
+            self.counters[:] = 0
+        self.read_pos = 0
+
+    def spec(self):
+        """Picklable description for attaching in another process"""
+        return self.shm.name, self.rows, self.width
+
+    @classmethod
+    def attach(cls, spec):
+        name, rows, width = spec
+        return cls(rows, width, name)
+
+    @property
+    def written(self):
+        return int(self.counters[COUNTER_WRITTEN])
+
+    @property
+    def overruns(self):
+        """Rows dropped because the consumer was a whole ring behind"""
+        return int(self.counters[COUNTER_OVERRUNS])
+
+    def write(self, processed, written_time=None):
+        """Append the rows of a ProcessedBlock (producer side)"""
+        count, width = processed.samples.shape
+        if width > self.width or count == 0:
+            return
+        written_time = time.time() if written_time is None else written_time
+        pos = self.written
+        # Rows the consumer has not handed back are never overwritten, the oldest packets of the block give way
+        free = self.rows - (pos - int(self.counters[COUNTER_READ]))
+        start = max(count - free, 0)
+        if start:
+            self.counters[COUNTER_OVERRUNS] += start
+        while start < count:
+            # Contiguous run up to the end of the block or the end of the ring
+            row = pos % self.rows
+            stop = min(count, start + self.rows - row)
+            rows = slice(row, row + stop - start)
+            self.samples[rows, :width] = processed.samples[start:stop]
+            self.magnitude[rows, :width] = processed.magnitude[start:stop]
+            if processed.sanitized_phase is not None:
+                self.phase[rows, :width] = processed.sanitized_phase[start:stop]
+            meta = self.meta[rows]
+            meta['timestamp'] = processed.timestamps[start:stop]
+            meta['written'] = written_time
+            meta['antenna_idx'] = processed.antenna_idx
+            meta['width'] = width
+            meta['baseline_state'] = processed.baseline_state
+            meta['phase_sanitized'] = processed.sanitized_phase is not None
+            meta['has_packet_meta'] = processed.meta is not None
+            if processed.meta is not None:
+                meta['packet_meta'] = processed.meta[start:stop]
+            meta['seq'] = pos + np.arange(stop - start, dtype=np.uint64)
+            pos += stop - start
+            start = stop
+        self.counters[COUNTER_WRITTEN] = pos
+
+    def read_blocks(self, source=None):
+        """ProcessedBlocks viewing the rows published since the last call (consumer side)
+
+        Runs of rows with the same antenna, width, phase sanitization and packet metadata presence
+        become one block. The views stay valid until the next call, which hands their rows back to the
+        producer; copy what has to be kept longer.
+        """
+        self.counters[COUNTER_READ] = self.read_pos
+        written = self.written
+        blocks = []
+        while self.read_pos < written:
+            row = self.read_pos % self.rows
+            stop = min(row + written - self.read_pos, self.rows)
+            # Only rows whose data is complete, the rest is read next time
+            complete = self.meta['seq'][row:stop] == self.read_pos + np.arange(stop - row, dtype=np.uint64)
+            if not complete.all():
+                stop = row + int(np.argmin(complete))
+                if stop == row:
+                    break
+            meta = self.meta[row:stop]
+            # Split where antenna, width, phase sanitization or packet metadata presence change
+            keys = (meta['antenna_idx'].astype(np.int64) << 18 | meta['has_packet_meta'] << 17
+                    | meta['phase_sanitized'] << 16 | meta['width'])
+            bounds = np.flatnonzero(np.diff(keys)) + 1
+            for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(meta)]))):
+                width = int(meta['width'][start])
+                phase = self.phase[row + start:row + end, :width] if meta['phase_sanitized'][start] else None
+                packet_meta = meta['packet_meta'][start:end] if meta['has_packet_meta'][start] else None
+                blocks.append(ProcessedBlock(int(meta['antenna_idx'][start]), meta['timestamp'][start:end],
+                                             self.samples[row + start:row + end, :width],
+                                             self.magnitude[row + start:row + end, :width],
+                                             int(meta['baseline_state'][end - 1]), source, phase, packet_meta))
+            self.read_pos += stop - row
+            if stop - row < len(complete):
+                break
+        return blocks
+
+    def close(self):
+        del self.counters, self.meta, self.samples, self.magnitude, self.phase
+        try:
+            self.shm.close()
+        except BufferError:
+            # Blocks handed out by read_blocks are still referenced; the mapping goes with the process
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+def run_worker(ring_spec, server_ip, server_port, client_options, antenna_group, commands, statuses, stop_event):
+    """Worker process: receive -> decode -> process -> shared ring until stop_event is set"""
+    # Ctrl+C is handled by the parent, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = SharedFrameRing.attach(ring_spec)
+    antennas = None
+    if antenna_group is not None and not is_multicast(server_ip):
+        # Multicast receivers do not register, the group's options fix the header version
+        index, count = antenna_group
+        antennas = range(index, MAX_REGISTER_ANTENNAS, count)
+    client = CSIUdpClient(server_ip, server_port, antennas=antennas, **client_options)
+    client.antenna_group = antenna_group
+    ring.counters[COUNTER_RCVBUF] = client.rcvbuf
+    pipeline = CSIPipeline()
+    try:
+        client.register()
+        while not stop_event.is_set():
+            try:
+                while True:
+                    command, args = commands.get_nowait()
+                    if command == 'options':
+                        for name, value in args.items():
+                            setattr(pipeline, name, value)
+                    elif command == 'set_baseline':
+                        pipeline.snapshot_baselines()
+            except queue.Empty:
+                pass
+
+            batch = client.receive_batch(0.1)
+            if batch is None:
+                continue
+            ring.counters[COUNTER_DATAGRAMS] += batch.num_datagrams
+            ring.counters[COUNTER_MALFORMED] += batch.malformed
+            if batch.kernel_drops is not None:
+                ring.counters[COUNTER_KERNEL_DROPS] = batch.kernel_drops
+            if batch.capture_status is not None:
+                statuses.put(batch.capture_status)
+            written_time = time.time()
+            for processed in pipeline.process_batch(batch):
+                ring.write(processed, written_time)
+    except Exception as e:
+        print(f"Error in worker for {client.name}: {e}", file=sys.stderr)
+    finally:
+        client.close()
+        ring.close()
+
+class CSIWorker:
+    """A worker process with its shared ring and control queue"""
+    def __init__(self, context, server_ip, server_port, client_options, antenna_group, ring_rows):
+        self.source = f"{server_ip}:{server_port}"
+        self.antenna_group = antenna_group
+        self.ring = SharedFrameRing(ring_rows)
+        self.commands = context.Queue()
+        self.statuses = context.Queue()  # Capture status dicts sent by the server, about one per second
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=run_worker, daemon=True,
+            args=(self.ring.spec(), server_ip, server_port, client_options, antenna_group,
+                  self.commands, self.statuses, self.stop_event))
+
+class CSIWorkerPool:
+    """Worker processes for several servers and antenna groups, read through shared rings
+
+    servers is a list of (ip, port) tuples; antenna_groups workers are started
+    per server. The remaining arguments are passed to every CSIUdpClient.
+    """
+    def __init__(self, servers, antenna_groups=1, rcvbuf=None, encoding='float64', aggregate=None,
+                 mix_antennas=False, ring_rows=DEFAULT_RING_ROWS, packet_meta=False, multicast_interface=None,
+                 capture_status=False):
+        # Spawned, not forked: the parent may already run Qt
+        context = multiprocessing.get_context('spawn')
+        client_options = dict(rcvbuf=rcvbuf, encoding=encoding, aggregate=aggregate, mix_antennas=mix_antennas,
+                              packet_meta=packet_meta, multicast_interface=multicast_interface,
+                              capture_status=capture_status)
+        self.workers = []
+        for server_ip, server_port in servers:
+            for group in range(antenna_groups):
+                antenna_group = (group, antenna_groups) if antenna_groups > 1 else None
+                self.workers.append(CSIWorker(context, server_ip, server_port, client_options,
+                                              antenna_group, ring_rows))
+        self.datagrams = 0  # Datagrams counted by the last counters() call
+        self.malformed = 0  # Malformed datagrams counted by the last counters() call
+
+    def start(self):
+        for worker in self.workers:
+            worker.process.start()
+            group = f" (antenna group {worker.antenna_group[0]}/{worker.antenna_group[1]})" \
+                if worker.antenna_group else ""
+            print(f"Started worker {worker.process.pid} for {worker.source}{group}")
+
+    def read_blocks(self):
+        """ProcessedBlocks published by all workers since the last call, as shared memory views"""
+        blocks = []
+        for worker in self.workers:
+            blocks.extend(worker.ring.read_blocks(worker.source))
+        return blocks
+
+    def counters(self):
+        """(datagrams and malformed datagrams since the last call, cumulative kernel drops) over all workers"""
+        datagrams = sum(int(worker.ring.counters[COUNTER_DATAGRAMS]) for worker in self.workers)
+        malformed = sum(int(worker.ring.counters[COUNTER_MALFORMED]) for worker in self.workers)
+        drops = sum(int(worker.ring.counters[COUNTER_KERNEL_DROPS]) for worker in self.workers)
+        new_datagrams, new_malformed = datagrams - self.datagrams, malformed - self.malformed
+        self.datagrams, self.malformed = datagrams, malformed
+        return new_datagrams, new_malformed, drops
+
+    def capture_status(self):
+        """Newest capture status received per source since the last call"""
+        statuses = {}
+        for worker in self.workers:
+            try:
+                while True:
+                    statuses[worker.source] = worker.statuses.get_nowait()
+            except queue.Empty:
+                pass
+        return statuses
+
+    @property
+    def overruns(self):
+        """Rows dropped by all rings because the consumer fell a whole ring behind, cumulative"""
+        return sum(worker.ring.overruns for worker in self.workers)
+
+    @property
+    def rcvbuf(self):
+        """Actual kernel receive buffer size of one worker socket, 0 until a worker has started"""
+        return max((int(worker.ring.counters[COUNTER_RCVBUF]) for worker in self.workers), default=0)
+
+    def send(self, command, args=None):
+        for worker in self.workers:
+            worker.commands.put((command, args))
+
+    def set_options(self, **options):
+        """Set CSIPipeline attributes (remove_dc_subcarrier, amplitude_diff, baseline_mode, ...) in every worker"""
+        self.send('options', options)
+
+    def set_baseline(self):
+        """Freeze the running mean of every antenna as its fixed baseline, in every worker"""
+        self.send('set_baseline')
+
+    def stop(self, timeout=3.0):
+        for worker in self.workers:
+            worker.stop_event.set()
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                print(f"Warning: worker {worker.process.pid} did not terminate cleanly", file=sys.stderr)
+                worker.process.terminate()
+            worker.ring.close()
+        self.workers = []
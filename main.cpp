@@ -6,12 +6,23 @@
 #include <sys/socket.h>
 #include <fstream>
 #include <unistd.h>
+#include <getopt.h>
 
 #include "motion_detector.h"
 
 MotionDetector& md = MotionDetector::getInstance();
 int stop = 0;
 
+static void usage()
+{
+    std::cout << "Usage: CSIdump [--mode latency|throughput] [--rate packets/s] [--max-dump packets]\n"
+              << "               wifi_interface interval udp_port [multicast_group:port [\"register options\"]]\n"
+              << "  --mode latency     dump every interval ms, dump size follows the packets per interval (default)\n"
+              << "  --mode throughput  largest dumps, dump again right away while the driver has a backlog\n"
+              << "  --rate N           dump N packets/s (over all antennas) in steps of interval ms\n"
+              << "  --max-dump N       largest dump in packets (default 300)" << std::endl;
+}
+
 void signalHandler(int)
 {
     md.stopMonitoring();
@@ -28,9 +39,36 @@ int main(int argc, char **argv)
     if (sigaction(SIGINT, &sig, NULL) || sigaction(SIGTERM, &sig, NULL))
         std::cerr << "sigaction error" << std::endl;
 
-    if (argc != 4)
+    static const struct option longOptions[] = {
+        { "mode", required_argument, nullptr, 'm' },
+        { "rate", required_argument, nullptr, 'r' },
+        { "max-dump", required_argument, nullptr, 'd' },
+        { nullptr, 0, nullptr, 0 },
+    };
+    CaptureConfig capture;
+    int opt;
+    while ((opt = getopt_long(argc, argv, "m:r:d:", longOptions, nullptr)) != -1) {
+        if (opt == 'm' && std::string(optarg) == "latency") {
+            capture.mode = CAPTURE_LATENCY;
+        } else if (opt == 'm' && std::string(optarg) == "throughput") {
+            capture.mode = CAPTURE_THROUGHPUT;
+        } else if (opt == 'r' && std::atof(optarg) > 0) {
+            capture.mode = CAPTURE_RATE;
+            capture.rate = std::atof(optarg);
+        } else if (opt == 'd' && std::atoi(optarg) > 0) {
+            capture.maxDump = std::atoi(optarg);
+        } else {
+            usage();
+            return -1;
+        }
+    }
+
+    // Positional arguments
+    argv += optind - 1;
+    argc -= optind - 1;
+    if (argc < 4 || argc > 6)
     {
-        std::cout << "Need 3 arguments: wifi_interface interval udp_port" << std::endl;
+        usage();
         return -1;
     }
 
@@ -41,12 +79,28 @@ int main(int argc, char **argv)
         return -1;
     }
 
+    // Optional multicast group, sent to in addition to registered clients
+    if (argc >= 5) {
+        std::string target = argv[4];
+        size_t sep = target.rfind(':');
+        if (sep == std::string::npos ||
+            md.addMulticastGroup(target.substr(0, sep), std::stoi(target.substr(sep + 1)), argc == 6 ? argv[5] : "") != 0) {
+            std::cerr << "Failed to add multicast group " << target << std::endl;
+            md.stopUdpServer();
+            return -1;
+        }
+    }
+
+    md.setCaptureConfig(capture);
     md.startMonitoring(argv[1], std::stoul(argv[2]));
 
     while (!stop)
     {
-        std::cout << "Main Function Executing..." << std::endl;
         std::this_thread::sleep_for(std::chrono::seconds(1));
+        CsiCaptureStatus status = md.getCaptureStatus();
+        std::cout << "Capture: " << status.rate << " packets/s, dump " << status.dump_size << ", cycle "
+                  << status.cycle_us << " us, late cycles " << status.late_cycles << ", full dumps "
+                  << status.overruns << std::endl;
     }
 
     return 0;
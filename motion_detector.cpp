@@ -5,6 +5,9 @@
 #include <iostream>
 #include <thread>
 #include <cstring>
+#include <sstream>
+#include <algorithm>
+#include <cstdlib>
 #include <unistd.h>
 #include <arpa/inet.h>
 
@@ -20,43 +23,43 @@ MotionDetector& MotionDetector::getInstance()
 
 void MotionDetector::runMonitoring()
 {
-    std::chrono::time_point<std::chrono::steady_clock> currTime;
-    std::chrono::time_point<std::chrono::steady_clock> oldTime = startMon;
-    int diff;
-    int pkt_num;
     ParserMT76 parser;
-
+    std::vector<CsiAntennaPackets> parsed_data;  // Reused for every dump
+    CaptureScheduler scheduler(captureConfig);
+    scheduler.start(startMon);
+    auto lastStatus = startMon;
 
     while (!stopFlag.load()) {
-        currTime = std::chrono::steady_clock::now();
-        diff = std::chrono::duration_cast<std::chrono::milliseconds>(currTime - oldTime).count();
-        //TODO should we make this be based on the interval parameter again?
-        pkt_num = 100;
-        std::vector<csi_data *> *list = wifi.motion_detection_dump(ifname.c_str(), pkt_num);
-        oldTime = currTime;
-
-        dataMutex.lock();
-        unsigned antIdx = antMonIdx;
-        dataMutex.unlock();
-        for (int i = 0 ; i < ANTENNA_NUM; i++) {
-            if (list) {
-                std::vector<std::vector<double>> parsed_data = parser.processRawData(list, i);
-                if (parsed_data.size()) {
-                    // Send CSI data via UDP if server is running
-                    if (udpServerRunning) {
-                        // Send each packet separately instead of concatenating
-                        for (const auto& packet : parsed_data) {
-                            if (!packet.empty()) {
-                                std::vector<std::vector<double>> singlePacket = { packet };
-                                sendCsiDataUdp(singlePacket, i);
-                            }
-                        }
-                    }
-                } 
-            } 
+        auto cycleStart = std::chrono::steady_clock::now();
+        std::vector<csi_data *> *list = wifi.motion_detection_dump(ifname.c_str(), scheduler.dumpSize());
+
+        unsigned packets = 0;
+        if (list) {
+            packets = list->size();
+
+            // One pass over the dump sorts the packets by antenna
+            parser.parseDump(list, parsed_data);
+
+            // Send CSI data via UDP if server is running
+            if (udpServerRunning)
+                sendCsiDataUdp(parsed_data);
         }
 
-        std::this_thread::sleep_for(std::chrono::milliseconds(interval));
+        // The next deadline already accounts for the time spent in this cycle
+        auto now = std::chrono::steady_clock::now();
+        auto next = scheduler.cycleDone(packets, cycleStart, now);
+
+        if (now - lastStatus >= std::chrono::seconds(1)) {
+            CsiCaptureStatus status = scheduler.status(now);
+            dataMutex.lock();
+            captureStatus = status;
+            dataMutex.unlock();
+            if (udpServerRunning)
+                sendCaptureStatusUdp(status);
+            lastStatus = now;
+        }
+
+        std::this_thread::sleep_until(next);
     }
 }
 
@@ -70,11 +73,13 @@ void MotionDetector::udpServerListen()
         ssize_t recvLen = recvfrom(udpSocket, buffer, sizeof(buffer) - 1, 0, (struct sockaddr*)&clientAddr, &clientAddrLen);
         if (recvLen > 0) {
             buffer[recvLen] = '\0';
-            if (strcmp(buffer, "register") == 0) {
+            UdpClient client;
+            if (parseRegisterMessage(buffer, client)) {
                 char clientIp[INET_ADDRSTRLEN];
                 inet_ntop(AF_INET, &clientAddr.sin_addr, clientIp, INET_ADDRSTRLEN);
-                int clientPort = ntohs(clientAddr.sin_port);
-                addUdpClient(clientIp, clientPort);
+                client.ip = clientIp;
+                client.port = ntohs(clientAddr.sin_port);
+                addUdpClient(client);
             }
         }
     }
@@ -92,6 +97,8 @@ int MotionDetector::startMonitoring(std::string ifname, unsigned interval)
 
     this->ifname = ifname;
     this->interval = interval;
+    captureConfig.intervalMs = interval;
+    captureStatus = {};
 
     ret = wifi.motion_detection_start(this->ifname.c_str());
     startMon = std::chrono::steady_clock::now();
@@ -136,6 +143,20 @@ int MotionDetector::setAntennaIdx(unsigned idx)
     return 0;
 }
 
+void MotionDetector::setCaptureConfig(const CaptureConfig& config)
+{
+    captureConfig = config;
+}
+
+CsiCaptureStatus MotionDetector::getCaptureStatus()
+{
+    dataMutex.lock();
+    CsiCaptureStatus status = captureStatus;
+    dataMutex.unlock();
+
+    return status;
+}
+
 unsigned MotionDetector::getAntennaIdx()
 {
     dataMutex.lock();
@@ -229,14 +250,140 @@ int MotionDetector::stopUdpServer()
     return 0;
 }
 
-void MotionDetector::addUdpClient(const std::string& clientIp, int clientPort)
+// "register" alone keeps the original format (CsiPacketHeader + double samples).
+// Options follow as space separated key=value pairs, e.g. "register encoding=int16",
+// and switch the client to CsiPacketHeaderV2:
+//   encoding=float64|float32|int16  sample encoding
+//   aggregate=<bytes>               pack several packets per datagram up to this size
+//   mix_antennas=1                  let packets of different antennas share a datagram
+//   meta=1                          append the driver fields of every packet (CsiPacketMeta)
+//   status=1                        send a CsiCaptureStatus datagram every second
+//   antennas=<i>[,<i>...]           send only the packets of these antennas (0 to 31)
+bool MotionDetector::parseRegisterMessage(const char* message, UdpClient& client)
+{
+    std::istringstream tokens(message);
+    std::string token;
+
+    if (!(tokens >> token) || token != "register")
+        return false;
+
+    client.headerVersion = CSI_HEADER_VERSION_1;
+    client.sampleFormat = CSI_SAMPLE_FLOAT64;
+    client.aggregateBytes = 0;
+    client.mixAntennas = false;
+    client.packetMeta = false;
+    client.captureStatus = false;
+    client.antennaMask = 0;
+
+    while (tokens >> token) {
+        size_t sep = token.find('=');
+        std::string key = token.substr(0, sep);
+        std::string value = sep == std::string::npos ? "" : token.substr(sep + 1);
+
+        if (key == "encoding") {
+            if (value == "float64")
+                client.sampleFormat = CSI_SAMPLE_FLOAT64;
+            else if (value == "float32")
+                client.sampleFormat = CSI_SAMPLE_FLOAT32;
+            else if (value == "int16")
+                client.sampleFormat = CSI_SAMPLE_INT16;
+            else {
+                std::cerr << "Unknown encoding in register message: " << value << std::endl;
+                return false;
+            }
+        } else if (key == "aggregate") {
+            long bytes = strtol(value.c_str(), nullptr, 10);
+            if (bytes <= 0) {
+                std::cerr << "Invalid aggregate size in register message: " << value << std::endl;
+                return false;
+            }
+            client.aggregateBytes = static_cast<uint16_t>(std::min<long>(bytes, CSI_MAX_DATAGRAM_SIZE));
+        } else if (key == "mix_antennas") {
+            client.mixAntennas = value == "1";
+        } else if (key == "meta") {
+            client.packetMeta = value == "1";
+        } else if (key == "status") {
+            client.captureStatus = value == "1";
+        } else if (key == "antennas") {
+            std::istringstream indices(value);
+            std::string index;
+            uint32_t mask = 0;
+            while (std::getline(indices, index, ',')) {
+                char* end = nullptr;
+                long antenna = strtol(index.c_str(), &end, 10);
+                if (index.empty() || *end != '\0' || antenna < 0 || antenna > 31) {
+                    std::cerr << "Invalid antennas in register message: " << value << std::endl;
+                    return false;
+                }
+                mask |= 1u << antenna;
+            }
+            if (!mask) {
+                std::cerr << "Invalid antennas in register message: " << value << std::endl;
+                return false;
+            }
+            client.antennaMask = mask;
+        } else {
+            std::cerr << "Unknown register option: " << token << std::endl;
+            continue;
+        }
+        client.headerVersion = CSI_HEADER_VERSION_2;
+    }
+
+    return true;
+}
+
+// Multicast mode: every datagram is sent once to group:port, whatever the number of
+// receivers that joined it. options are register options ("encoding=int16 meta=1") and
+// fix the format for all receivers. Requires a running UDP server.
+int MotionDetector::addMulticastGroup(const std::string& group, int port, const std::string& options)
+{
+    if (!udpServerRunning || udpSocket < 0) {
+        std::cerr << "UDP server must be running to add a multicast group" << std::endl;
+        return -1;
+    }
+
+    struct in_addr groupAddr;
+    if (inet_pton(AF_INET, group.c_str(), &groupAddr) <= 0 || !IN_MULTICAST(ntohl(groupAddr.s_addr))) {
+        std::cerr << "Not an IPv4 multicast address: " << group << std::endl;
+        return -1;
+    }
+
+    UdpClient client;
+    std::string message = "register " + options;
+    if (!parseRegisterMessage(message.c_str(), client)) {
+        std::cerr << "Invalid multicast options: " << options << std::endl;
+        return -1;
+    }
+    client.ip = group;
+    client.port = port;
+
+    // Stay on the local network, and deliver to receivers on this host as well
+    unsigned char ttl = 1;
+    unsigned char loop = 1;
+    if (setsockopt(udpSocket, IPPROTO_IP, IP_MULTICAST_TTL, &ttl, sizeof(ttl)) < 0 ||
+        setsockopt(udpSocket, IPPROTO_IP, IP_MULTICAST_LOOP, &loop, sizeof(loop)) < 0) {
+        std::cerr << "Failed to set multicast socket options: " << strerror(errno) << std::endl;
+        return -1;
+    }
+
+    addUdpClient(client);
+    return 0;
+}
+
+void MotionDetector::addUdpClient(const UdpClient& client)
 {
     udpMutex.lock();
-    // Check if client already exists
-    auto it = std::find(udpClients.begin(), udpClients.end(), std::make_pair(clientIp, clientPort));
+    // Check if client already exists, a new registration updates its options
+    auto it = std::find(udpClients.begin(), udpClients.end(), client);
     if (it == udpClients.end()) {
-        udpClients.push_back(std::make_pair(clientIp, clientPort));
-        std::cout << "Added UDP client: " << clientIp << ":" << clientPort << std::endl;
+        udpClients.push_back(client);
+        std::cout << "Added UDP client: " << client.ip << ":" << client.port
+                  << " (header v" << (int)client.headerVersion << ", format " << (int)client.sampleFormat
+                  << ", aggregate " << client.aggregateBytes << (client.mixAntennas ? ", mixed antennas" : "")
+                  << (client.packetMeta ? ", packet metadata" : "")
+                  << (client.captureStatus ? ", capture status" : "") << ")" << std::endl;
+    } else {
+        *it = client;
     }
     udpMutex.unlock();
 }
@@ -244,7 +391,8 @@ void MotionDetector::addUdpClient(const std::string& clientIp, int clientPort)
 void MotionDetector::removeUdpClient(const std::string& clientIp, int clientPort)
 {
     udpMutex.lock();
-    auto it = std::find(udpClients.begin(), udpClients.end(), std::make_pair(clientIp, clientPort));
+    UdpClient client = { clientIp, clientPort, CSI_HEADER_VERSION_1, CSI_SAMPLE_FLOAT64, 0, false, false, false, 0 };
+    auto it = std::find(udpClients.begin(), udpClients.end(), client);
     if (it != udpClients.end()) {
         udpClients.erase(it);
         std::cout << "Removed UDP client: " << clientIp << ":" << clientPort << std::endl;
@@ -252,73 +400,38 @@ void MotionDetector::removeUdpClient(const std::string& clientIp, int clientPort
     udpMutex.unlock();
 }
 
-void MotionDetector::sendCsiDataUdp(const std::vector<std::vector<double>>& data, int antennaIdx)
+void MotionDetector::sendCsiDataUdp(const std::vector<CsiAntennaPackets>& data)
 {
     if (!udpServerRunning || udpSocket < 0) {
         return;
     }
 
     udpMutex.lock();
-    auto clients = udpClients; // Copy to avoid holding lock too long
+    sendClients = udpClients; // Copy to avoid holding lock too long, reuses the copy's storage
     udpMutex.unlock();
 
-    if (clients.empty()) {
+    if (sendClients.empty()) {
         return;
     }
 
-    // Calculate total number of I/Q pairs (samples / 2 since each sample is I,Q pair)
-    uint32_t totalSamples = 0;
-    for (const auto& packet : data) {
-        totalSamples += packet.size() / 2; // I/Q pairs are interleaved
-    }
-
-    // Create header
-    CsiPacketHeader header;
-    header.timestamp = std::chrono::duration_cast<std::chrono::milliseconds>(
+    uint64_t timestamp = std::chrono::duration_cast<std::chrono::milliseconds>(
         std::chrono::system_clock::now().time_since_epoch()).count();
-    header.antenna_idx = static_cast<uint32_t>(antennaIdx);
-    header.packet_count = static_cast<uint32_t>(data.size());
-    header.total_samples = totalSamples;
 
-    // Calculate total message size
-    size_t messageSize = sizeof(CsiPacketHeader) + totalSamples * sizeof(CsiSample);
-    
-    // Allocate buffer
-    std::vector<uint8_t> buffer(messageSize);
-    uint8_t* ptr = buffer.data();
-    
-    // Copy header
-    memcpy(ptr, &header, sizeof(CsiPacketHeader));
-    ptr += sizeof(CsiPacketHeader);
-    
-    // Copy CSI data as I/Q pairs
-    for (const auto& packet : data) {
-        for (size_t i = 0; i < packet.size(); i += 2) {
-            CsiSample sample;
-            sample.i = packet[i];     // I component
-            sample.q = packet[i + 1]; // Q component
-            memcpy(ptr, &sample, sizeof(CsiSample));
-            ptr += sizeof(CsiSample);
-        }
-    }
+    // The whole dump at once, so packets can be packed per client
+    udpSender.send(udpSocket, data, sendClients, timestamp);
+}
 
-    // Send to each UDP client
-    for (const auto& client : clients) {
-        struct sockaddr_in clientAddr;
-        memset(&clientAddr, 0, sizeof(clientAddr));
-        clientAddr.sin_family = AF_INET;
-        clientAddr.sin_port = htons(client.second);
+void MotionDetector::sendCaptureStatusUdp(const CsiCaptureStatus& status)
+{
+    if (!udpServerRunning || udpSocket < 0) {
+        return;
+    }
 
-        // Convert IP address
-        if (inet_pton(AF_INET, client.first.c_str(), &clientAddr.sin_addr) <= 0) {
-            continue;
-        }
+    udpMutex.lock();
+    sendClients = udpClients;
+    udpMutex.unlock();
 
-        ssize_t sent = sendto(udpSocket, buffer.data(), buffer.size(), 0,
-                             (struct sockaddr*)&clientAddr, sizeof(clientAddr));
-        
-        if (sent < 0) {
-            std::cerr << "Failed to send UDP data to " << client.first << ":" << client.second << ": " << strerror(errno) << std::endl;
-        }
-    }
+    uint64_t timestamp = std::chrono::duration_cast<std::chrono::milliseconds>(
+        std::chrono::system_clock::now().time_since_epoch()).count();
+    udpSender.sendStatus(udpSocket, status, sendClients, timestamp);
 }
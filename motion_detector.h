@@ -14,18 +14,8 @@
 #include <arpa/inet.h>
 
 #include "wifi_drv_api/mt76_api.h"
-
-struct CsiPacketHeader {
-    uint64_t timestamp;
-    uint32_t antenna_idx;
-    uint32_t packet_count;
-    uint32_t total_samples;
-} __attribute__((packed));
-
-struct CsiSample {
-    double i;  // In-phase component
-    double q;  // Quadrature component
-} __attribute__((packed));
+#include "csi_udp_sender.h"
+#include "capture_scheduler.h"
 
 class MotionDetector
 {
@@ -35,6 +25,9 @@ public:
     MotionDetector(const MotionDetector&) = delete;
     MotionDetector& operator=(const MotionDetector&) = delete;
 
+    // Capture mode, rate and largest dump; the interval is set by startMonitoring
+    void setCaptureConfig(const CaptureConfig& config);
+    CsiCaptureStatus getCaptureStatus();
     int startMonitoring(std::string ifname, unsigned interval);
     int stopMonitoring();
 
@@ -44,13 +37,16 @@ public:
     bool getIsMonitoring();
     int startUdpServer(int port);
     int stopUdpServer();
-    void addUdpClient(const std::string& clientIp, int clientPort);
+    void addUdpClient(const UdpClient& client);
+    int addMulticastGroup(const std::string& group, int port, const std::string& options);
     void removeUdpClient(const std::string& clientIp, int clientPort);
 
 private:
     void runMonitoring();
     void udpServerListen();
-    void sendCsiDataUdp(const std::vector<std::vector<double>>& data, int antennaIdx);
+    void sendCsiDataUdp(const std::vector<CsiAntennaPackets>& data);
+    void sendCaptureStatusUdp(const CsiCaptureStatus& status);
+    static bool parseRegisterMessage(const char* message, UdpClient& client);
 
     static MotionDetector* instance;
     MotionDetector() : isMonitoring(false), stopFlag(false), antMonIdx(0), motion_result(0.0),
@@ -62,6 +58,8 @@ private:
     std::atomic<bool> stopFlag;
     std::chrono::time_point<std::chrono::steady_clock> startMon;
     MT76API wifi;
+    CaptureConfig captureConfig;
+    CsiCaptureStatus captureStatus = {};  // Latest scheduler counters, guarded by dataMutex
 
     double motion_result;
     bool isMonitoring;
@@ -69,7 +67,9 @@ private:
     std::thread udpServerWorker;
     std::mutex dataMutex;
     std::mutex udpMutex;
-    std::vector<std::pair<std::string, int>> udpClients;
+    std::vector<UdpClient> udpClients;
+    std::vector<UdpClient> sendClients;  // Copy of udpClients taken for each dump
+    CsiUdpSender udpSender;
     int udpSocket;
     bool udpServerRunning;
 };
\ No newline at end of file
@@ -3,14 +3,39 @@
 #include <string>
 #include <vector>
 #include <algorithm>
+#include <cstdint>
 #include <math.h>
 #include <complex.h>
 
+struct csi_data;
+
+// Packets of one antenna parsed from a dump. The buffers keep their capacity from
+// dump to dump, so parsing allocates nothing once they fit the largest dump.
+struct CsiAntennaPackets
+{
+    std::vector<int16_t> iq;                // Interleaved I/Q of all packets, back to back
+    std::vector<size_t> offsets = {0};      // Start of every packet in I/Q pairs, plus the end
+    std::vector<const csi_data *> records;  // Driver record of every packet
+
+    void clear()
+    {
+        iq.clear();
+        offsets.assign(1, 0);
+        records.clear();
+    }
+    size_t size() const { return records.size(); }
+    size_t samples(size_t p) const { return offsets[p + 1] - offsets[p]; }
+    const int16_t *packet(size_t p) const { return iq.data() + 2 * offsets[p]; }
+};
+
 class Parser
 {
 protected:
     size_t packets_to_read = 0;
 
 public:
+    // Sorts the packets of a dump into perAntenna[rx_idx] in a single pass
+    virtual void parseDump(void *data, std::vector<CsiAntennaPackets> &perAntenna) = 0;
+    // Interleaved I/Q of every packet of one antenna
     virtual std::vector<std::vector<double>> processRawData(void *data, int antIdx) = 0;
 };
@@ -6,62 +6,59 @@
 
 #define CSI_MAX_COUNT 256
 
-//TODO rewrite, there is no "data_num"
-std::vector<std::vector<double>> ParserMT76::processRawData(void *data, int antIdx)
+static int subcarrierCount(u8 ch_bw)
+{
+    switch (ch_bw) {
+        case 0: return CSI_BW20_DATA_COUNT;   // 20MHz
+        case 1: return CSI_BW40_DATA_COUNT;   // 40MHz
+        case 2: return CSI_BW80_DATA_COUNT;   // 80MHz
+        case 3: return CSI_BW160_DATA_COUNT;  // 160MHz
+        default: return CSI_BW20_DATA_COUNT;  // Default to 20MHz
+    }
+}
+
+void ParserMT76::parseDump(void *data, std::vector<CsiAntennaPackets> &perAntenna)
 {
-    std::vector<std::vector<std::complex<double>>> csi_per_antenna(ANTENNA_NUM, std::vector<std::complex<double>>(CSI_BW160_DATA_COUNT));
     std::vector<csi_data *> *list = (std::vector<csi_data *>*)data;
-    std::vector<std::vector<double>> tones_per_packet[ANTENNA_NUM];
 
-    for (int it = 0; it < list->size(); it++)
+    perAntenna.resize(ANTENNA_NUM);
+    for (CsiAntennaPackets &antenna : perAntenna)
+        antenna.clear();
+
+    for (const csi_data *csi : *list)
     {
-        int num_subcarriers = CSI_BW20_DATA_COUNT; // Default value
-        
-        csi_data *csi = list->at(it);
-        if (csi)
-        {
-            //fprintf(stderr, "\tprocessRawData() csi->data_num: %d\n", csi->data_num);
-            
-            // Determine number of subcarriers based on bandwidth
-            switch (csi->ch_bw) {
-                case 0: num_subcarriers = CSI_BW20_DATA_COUNT; break;   // 20MHz
-                case 1: num_subcarriers = CSI_BW40_DATA_COUNT; break;   // 40MHz
-                case 2: num_subcarriers = CSI_BW80_DATA_COUNT; break;   // 80MHz
-                case 3: num_subcarriers = CSI_BW160_DATA_COUNT; break;  // 160MHz
-                default: num_subcarriers = CSI_BW20_DATA_COUNT; break;  // Default to 20MHz
-            }
-            
-            //fprintf(stderr, "\tprocessRawData() ch_bw: %d, num_subcarriers: %d\n", csi->ch_bw, num_subcarriers);
-            
-            // Process all subcarriers for this bandwidth
-            for (size_t i = 0; i < num_subcarriers; i++)
-            {
-                std::complex<double> csi_complex(csi->data_i[i], csi->data_q[i]);
-                csi_per_antenna[csi->rx_idx][i] = csi_complex;
-                //fprintf(stderr, "\tprocessRawData() csi_data[%d]->i: 0x%x, csi_data[%d]->q: 0x%x\n", i, csi->data_i[i], i, csi->data_q[i]);
-            }
+        if (!csi || csi->rx_idx >= perAntenna.size())
+            continue;
 
-            if (csi->rx_idx == antIdx)
-            {
-                // Skip first few subcarriers to avoid DC offset issues
-                int start_idx = (num_subcarriers >= 64) ? 2 : 1;
-                int end_idx = num_subcarriers - 1; // Also skip last subcarrier
-                
-                // Store raw I/Q pairs (interleaved: I, Q, I, Q, ...)
-                std::vector<double> iq_data;
-                
-                for (int i = start_idx; i < end_idx; i++) {
-                    iq_data.push_back(static_cast<double>(csi->data_i[i]));
-                    iq_data.push_back(static_cast<double>(csi->data_q[i]));
-                }
-                
-                tones_per_packet[antIdx].push_back(iq_data);
-            }
-            
-            //fprintf(stderr, "\tprocessRawData() processed %d subcarriers\n", num_subcarriers);
+        int num_subcarriers = subcarrierCount(csi->ch_bw);
+        // Skip first few subcarriers to avoid DC offset issues, and the last subcarrier
+        int start_idx = (num_subcarriers >= 64) ? 2 : 1;
+        int end_idx = num_subcarriers - 1;
+
+        CsiAntennaPackets &antenna = perAntenna[csi->rx_idx];
+        size_t pos = antenna.iq.size();
+        antenna.iq.resize(pos + 2 * (end_idx - start_idx));
+        int16_t *out = antenna.iq.data() + pos;
+        for (int i = start_idx; i < end_idx; i++) {
+            *out++ = csi->data_i[i];
+            *out++ = csi->data_q[i];
         }
+        antenna.offsets.push_back(antenna.offsets.back() + (end_idx - start_idx));
+        antenna.records.push_back(csi);
     }
+}
+
+std::vector<std::vector<double>> ParserMT76::processRawData(void *data, int antIdx)
+{
+    parseDump(data, scratch);
+
+    std::vector<std::vector<double>> tones_per_packet;
+    if (antIdx < 0 || antIdx >= (int)scratch.size())
+        return tones_per_packet;
 
+    const CsiAntennaPackets &antenna = scratch[antIdx];
+    for (size_t p = 0; p < antenna.size(); p++)
+        tones_per_packet.emplace_back(antenna.packet(p), antenna.packet(p) + 2 * antenna.samples(p));
 
-    return tones_per_packet[antIdx];
+    return tones_per_packet;
 }
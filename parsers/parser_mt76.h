@@ -9,6 +9,8 @@ class ParserMT76 final : public Parser
 {
 private:
     std::vector<int> cleanupDump(const std::string &data);
+    std::vector<CsiAntennaPackets> scratch;  // processRawData's parse buffers
 public:
+    virtual void parseDump(void *data, std::vector<CsiAntennaPackets> &perAntenna) override;
     virtual std::vector<std::vector<double>> processRawData(void *data, int antIdx) override;
 };